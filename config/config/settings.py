@@ -46,11 +46,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'employees.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'employees.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,14 +86,40 @@ environ.Env.read_env(os.path.join(BASE_DIR, ".env"))
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'employee_db',
+        'NAME': env('DB_NAME', default='employee_db'),
         'USER': env('DB_USER', default='postgres'),
         'PASSWORD': env('DB_PASSWORD', default='password'),
         'HOST': env('DB_HOST', default='localhost'),
         'PORT': env.int('DB_PORT', default='5432'),
+        # Reuse connections across requests instead of reconnecting each time.
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# A local SQLite file instead of PostgreSQL, e.g. DB_SQLITE_PATH=bench.sqlite3 to
+# run benchmark_endpoints without a database server.
+if env('DB_SQLITE_PATH', default=''):
+    DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': env('DB_SQLITE_PATH')}
+
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica1.internal,replica2.internal:5433.
+# Safe API requests read from a random replica; see employees/routers.py.
+DATABASE_REPLICAS = []
+for index, host in enumerate(env.list('DB_REPLICA_HOSTS', default=[]), start=1):
+    alias = f'replica{index}'
+    replica_host, _, replica_port = host.partition(':')
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=replica_host, PORT=int(replica_port or DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['employees.routers.PrimaryReplicaRouter']
+
+# After a write a client reads from the primary for this many seconds, so it
+# sees its own changes despite replication lag.
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=5)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -136,7 +164,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'employees.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -144,15 +172,95 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'employees.throttling.AnonRateThrottle',
+        'employees.throttling.UserRateThrottle',
+        'employees.throttling.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
-        'user': '1000/day'
+        'user': '1000/day',
+        # Per-endpoint budgets on top of the above, by the views' throttle_scope
+        'analytics': '60/minute',
+        'payroll': '20/minute',
+        'export': '10/minute',
+        'search': '60/minute',
     }
 }
 
+# Where the throttles keep their state, shared by all worker processes: a
+# SQLite file for the processes on one host, or redis://host:6379/2 to share
+# limits across hosts (needs the redis package)
+THROTTLE_STORE = env('THROTTLE_STORE', default=os.path.join(BASE_DIR, 'throttle.sqlite3'))
+
+# Cache backend, e.g. CACHE_URL=redis://redis:6379/1 in production so every
+# worker shares cached responses; local memory otherwise (and in tests).
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Dashboard/analytics responses are cached under a data version that is
+# bumped on every write, so the timeout only bounds memory use.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=300)
+
+# The dashboard snapshot is rebuilt in the background once data changed and
+# it is at least this many seconds old; a build holding the refresh lock for
+# longer than DASHBOARD_SNAPSHOT_BUILD_TIMEOUT is assumed to have died.
+DASHBOARD_SNAPSHOT_REFRESH_SECONDS = env.int('DASHBOARD_SNAPSHOT_REFRESH_SECONDS', default=30)
+DASHBOARD_SNAPSHOT_BUILD_TIMEOUT = env.int('DASHBOARD_SNAPSHOT_BUILD_TIMEOUT', default=120)
+
+# The live attendance feed (ASGI only) sends at most one update per
+# LIVE_FEED_INTERVAL seconds, a keepalive comment after
+# LIVE_FEED_KEEPALIVE_SECONDS of silence, and ends each stream after
+# LIVE_FEED_MAX_SECONDS so clients reconnect to a possibly different worker.
+# Today's counts are read again at least every LIVE_FEED_POLL_SECONDS, which
+# bounds how late writes made by other processes show up when the response
+# cache (and with it the data version) isn't shared.
+LIVE_FEED_INTERVAL = env.float('LIVE_FEED_INTERVAL', default=1.0)
+LIVE_FEED_POLL_SECONDS = env.float('LIVE_FEED_POLL_SECONDS', default=5.0)
+LIVE_FEED_KEEPALIVE_SECONDS = env.float('LIVE_FEED_KEEPALIVE_SECONDS', default=15.0)
+LIVE_FEED_MAX_SECONDS = env.float('LIVE_FEED_MAX_SECONDS', default=300.0)
+
+# Resolved API tokens are kept in each process for up to TOKEN_CACHE_TTL
+# seconds (TOKEN_CACHE_SIZE=0 disables this). Deleting a token or saving its
+# user invalidates them in every process through a version kept in
+# THROTTLE_STORE, which all processes share.
+TOKEN_CACHE_TTL = env.int('TOKEN_CACHE_TTL', default=300)
+TOKEN_CACHE_SIZE = env.int('TOKEN_CACHE_SIZE', default=10000)
+
+# Upper bound for the client-chosen ?page_size= on keyset-paginated endpoints
+API_MAX_PAGE_SIZE = 500
+
+# Serve list endpoints from values() rows and orjson instead of the model
+# serializers (identical output, much less CPU per row)
+API_FAST_LIST_SERIALIZATION = env.bool('API_FAST_LIST_SERIALIZATION', default=True)
+
+# Largest batch accepted by POST /api/attendance/bulk/
+ATTENDANCE_BULK_MAX_RECORDS = 10000
+
+# Attendance months older than the retention window are moved to compressed
+# files here by `manage.py archive_attendance`
+ATTENDANCE_ARCHIVE_DIR = env('ATTENDANCE_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+ATTENDANCE_RETENTION_MONTHS = env.int('ATTENDANCE_RETENTION_MONTHS', default=24)
+
+# Payroll: overtime is paid per hour at salary / PAYROLL_ANNUAL_HOURS times
+# the multiplier
+PAYROLL_ANNUAL_HOURS = env.int('PAYROLL_ANNUAL_HOURS', default=2080)
+PAYROLL_OVERTIME_MULTIPLIER = env('PAYROLL_OVERTIME_MULTIPLIER', default='1.5')
+
+# Request instrumentation (employees.middleware.RequestMetricsMiddleware):
+# Server-Timing headers (off by default: they show every client the SQL time
+# and query count of its requests), /api/metrics/ for Prometheus (Bearer
+# METRICS_TOKEN when set) summing the totals each process writes to
+# THROTTLE_STORE every METRICS_PUBLISH_SECONDS, and a log of requests slower
+# than the threshold with their queries, the first SLOW_REQUEST_MAX_QUERIES of
+# them (only those are kept in memory)
+SERVER_TIMING_HEADER = env.bool('SERVER_TIMING_HEADER', default=False)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_PUBLISH_SECONDS = env.int('METRICS_PUBLISH_SECONDS', default=5)
+SLOW_REQUEST_THRESHOLD_MS = env.int('SLOW_REQUEST_THRESHOLD_MS', default=1000)
+SLOW_REQUEST_MAX_QUERIES = env.int('SLOW_REQUEST_MAX_QUERIES', default=100)
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Static files (CSS, JavaScript, Images)
@@ -175,22 +283,53 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
 }
 
-# Logging configuration
+# Logging: JSON lines written by a background thread to a size-rotated file
+# ({pid} in LOG_FILE gives each worker process its own). The SQL query log is
+# sampled at LOG_SQL_SAMPLE_RATE of requests; the queries of slow and failed
+# requests are always written.
+LOG_FILE = env('LOG_FILE', default=os.path.join(BASE_DIR, 'debug.log'))
+LOG_MAX_BYTES = env.int('LOG_MAX_BYTES', default=10 * 1024 * 1024)
+LOG_BACKUP_COUNT = env.int('LOG_BACKUP_COUNT', default=5)
+LOG_SQL_SAMPLE_RATE = env.float('LOG_SQL_SAMPLE_RATE', default=0.01)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'employees.log.JSONFormatter',
+        },
+    },
+    'filters': {
+        'sql_sampling': {
+            '()': 'employees.log.SQLSampleFilter',
+            'rate': LOG_SQL_SAMPLE_RATE,
+        },
+    },
     'handlers': {
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'debug.log'),
+            'class': 'employees.log.QueuedRotatingFileHandler',
+            'filename': LOG_FILE,
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': 'json',
         },
     },
     'loggers': {
         'django': {
             'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'django.db.backends': {
             'level': 'DEBUG',
+            'filters': ['sql_sampling'],
+        },
+        'employees': {
+            'handlers': ['file'],
+            'level': 'INFO',
             'propagate': True,
         },
     },
-}
\ No newline at end of file
+}
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Department, Employee, Attendance, PerformanceReview
+from .models import Department, Employee, Attendance, PerformanceReview, AttendanceDailySummary
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
@@ -26,4 +26,10 @@ class PerformanceReviewAdmin(admin.ModelAdmin):
     list_display = ['employee', 'review_date', 'rating', 'reviewer']
     list_filter = ['rating', 'review_date']
     search_fields = ['employee__first_name', 'employee__last_name', 'reviewer']
-    date_hierarchy = 'review_date'
\ No newline at end of file
+    date_hierarchy = 'review_date'
+
+@admin.register(AttendanceDailySummary)
+class AttendanceDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'department', 'present_count', 'absent_count', 'late_count', 'leave_count', 'half_day_count', 'total_count']
+    list_filter = ['department']
+    date_hierarchy = 'date'
@@ -0,0 +1,180 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce, NullIf, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import hierarchy
+from .models import Attendance, AttendanceDailySummary, Department, Employee
+from .rollups import STATUS_FIELDS
+from .serializers import (
+    AttendanceAnalyticsSerializer, DepartmentAnalyticsSerializer, EmployeeSerializer, SubtreeRollupSerializer
+)
+
+
+def department_analytics_data(params):
+    location = params.get('location')
+    employment_type = params.get('employment_type')
+    employee_filter = Q(employees__employment_type=employment_type) if employment_type else None
+    departments = Department.objects.all()
+    if location:
+        departments = departments.filter(location__icontains=location)
+    departments = departments.annotate(
+        employee_count=Count('employees', filter=employee_filter),
+        avg_salary=Avg('employees__salary', filter=employee_filter),
+        total_salary=Sum('employees__salary', filter=employee_filter),
+    ).order_by('name')
+    data = []
+    for dept in departments:
+        total_salary = dept.total_salary or 0
+        data.append({
+            'department': dept.name,
+            'employee_count': dept.employee_count,
+            'avg_salary': dept.avg_salary or 0,
+            'total_budget': dept.budget,
+            'budget_utilization': (total_salary / dept.budget * 100) if dept.budget > 0 else 0
+        })
+    return DepartmentAnalyticsSerializer(data, many=True).data
+
+
+def date_range(params, days=30):
+    """start..end from the query params; by default the last `days` days."""
+    try:
+        end = parse_date(params['end']) if params.get('end') else timezone.now().date()
+        start = parse_date(params['start']) if params.get('start') else end - timedelta(days=days)
+    except (TypeError, ValueError):
+        start = end = None
+    if start is None or end is None:
+        raise ValueError('start and end must be dates in YYYY-MM-DD format.')
+    return start, end
+
+
+GRANULARITIES = {
+    'day': lambda field: F(field),
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+BREAKDOWNS = {
+    'department': 'department__name',
+    'employment_type': 'employment_type',
+}
+
+
+def attendance_analytics_data(params):
+    """
+    Attendance counts and rate per day, week or month between start and end,
+    optionally broken down by department and/or employment type. Buckets are
+    labelled with their first day; the first and last may be partial.
+    """
+    start_date, end_date = date_range(params)
+    granularity = params.get('granularity') or 'day'
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}.")
+    breakdown = [name for name in (params.get('breakdown') or '').split(',') if name]
+    unknown = set(breakdown) - set(BREAKDOWNS)
+    if unknown:
+        raise ValueError(f"breakdown must be among: {', '.join(BREAKDOWNS)}.")
+
+    attendance_data = AttendanceDailySummary.objects.filter(date__range=[start_date, end_date])
+    department = params.get('department')
+    if department:
+        attendance_data = attendance_data.filter(department__name__icontains=department)
+    employment_type = params.get('employment_type')
+    if employment_type:
+        attendance_data = attendance_data.filter(employment_type=employment_type)
+    groups = [BREAKDOWNS[name] for name in breakdown]
+    attendance_data = attendance_data.values(*groups, bucket=GRANULARITIES[granularity]('date')).annotate(
+        present=Sum('present_count'),
+        absent=Sum('absent_count'),
+        late=Sum('late_count'),
+        rate=Coalesce(
+            ExpressionWrapper(
+                Sum('present_count') * 100.0 / NullIf(Sum('total_count'), 0), output_field=FloatField()
+            ),
+            0.0
+        ),
+    ).order_by('bucket', *groups)
+    data = [
+        dict(
+            {group: item[group] for group in groups},
+            date=item['bucket'],
+            present_count=item['present'],
+            absent_count=item['absent'],
+            late_count=item['late'],
+            attendance_rate=item['rate'],
+        )
+        for item in attendance_data
+    ]
+    return AttendanceAnalyticsSerializer(data, many=True).data
+
+
+def total_employees():
+    return Employee.objects.count()
+
+
+def total_departments():
+    return Department.objects.count()
+
+
+def today_attendance():
+    return Attendance.objects.filter(date=timezone.now().date()).count()
+
+
+def recent_hires():
+    hires = Employee.objects.select_related('department', 'manager').order_by('-hire_date')[:5]
+    return EmployeeSerializer(hires, many=True).data
+
+
+# Independent pieces of the dashboard; the async view runs them concurrently.
+DASHBOARD_PARTS = {
+    'total_employees': total_employees,
+    'total_departments': total_departments,
+    'today_attendance': today_attendance,
+    'recent_hires': recent_hires,
+}
+
+
+def dashboard_data():
+    return {name: part() for name, part in DASHBOARD_PARTS.items()}
+
+
+def subtree_rollup_data(root, params):
+    """
+    Span of control, headcount, payroll and attendance for everyone under
+    root (root excluded). Attendance covers start..end, by default the last
+    30 days.
+    """
+    start, end = date_range(params)
+    branches = hierarchy.branch_rollups(root.pk)
+    headcount = sum(branch['headcount'] for branch in branches)
+    total_salary = sum((branch['total_salary'] for branch in branches), Decimal('0.00'))
+    # Every member has one manager inside the subtree (root or a member),
+    # so headcount / managers is the average span of control.
+    managers = sum(branch['managers'] for branch in branches) + (1 if branches else 0)
+
+    statuses = (
+        Attendance.objects.filter(date__range=[start, end], employee_id__in=hierarchy.subtree_ids(root.pk))
+        .values('status').annotate(count=Count('id')).order_by()
+    )
+    attendance = dict.fromkeys(STATUS_FIELDS.values(), 0)
+    for row in statuses:
+        attendance[STATUS_FIELDS[row['status']]] = row['count']
+    attendance['total_count'] = sum(attendance.values())
+    attendance['attendance_rate'] = (
+        attendance['present_count'] / attendance['total_count'] * 100 if attendance['total_count'] else 0
+    )
+
+    return SubtreeRollupSerializer({
+        'employee': {'id': root.pk, 'name': str(root), 'job_title': root.job_title},
+        'headcount': headcount,
+        'direct_reports': len(branches),
+        'levels': max((branch['levels'] for branch in branches), default=0),
+        'managers': managers,
+        'avg_span_of_control': headcount / managers if managers else 0,
+        'total_salary': total_salary,
+        'avg_salary': total_salary / headcount if headcount else Decimal('0.00'),
+        'attendance': dict(attendance, start=start, end=end),
+        'branches': branches,
+    }).data
@@ -0,0 +1,218 @@
+"""
+Archival of old attendance months to gzip-compressed NDJSON files.
+
+Each month is written to ATTENDANCE_ARCHIVE_DIR/attendance-YYYY-MM.ndjson.gz
+with the columns of the attendance export, then removed from the database: a
+complete monthly partition is detached and dropped on PostgreSQL, anything
+else is deleted in short batches. Daily summaries are kept, so the analytics
+still cover archived days, and the month's summary counts are saved next to
+the archive so that rebuilding the summary from the remaining rows can add
+them back. Archived rows stay readable through the API.
+"""
+import gzip
+import itertools
+import json
+import os
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date
+
+from . import partitions
+from .cache import bump_data_version
+from .exports import RESOURCES, export_queryset, export_rows, stream_csv, stream_ndjson
+from .filters import filter_text
+from .models import Attendance, AttendanceDailySummary, Employee
+from .rollups import COUNT_FIELDS
+
+HEADERS = [header for header, _ in RESOURCES['attendance']['columns']]
+ID, EMPLOYEE, DATE = (HEADERS.index(header) for header in ('id', 'employee', 'date'))
+FILE_PATTERN = re.compile(r'^attendance-(\d{4})-(\d{2})\.ndjson\.gz$')
+
+
+def archive_path(month):
+    return os.path.join(settings.ATTENDANCE_ARCHIVE_DIR, f'attendance-{month:%Y-%m}.ndjson.gz')
+
+
+def summary_path(month):
+    return os.path.join(settings.ATTENDANCE_ARCHIVE_DIR, f'attendance-{month:%Y-%m}.summary.json')
+
+
+def archived_months():
+    if not os.path.isdir(settings.ATTENDANCE_ARCHIVE_DIR):
+        return []
+    months = []
+    for name in os.listdir(settings.ATTENDANCE_ARCHIVE_DIR):
+        match = FILE_PATTERN.match(name)
+        if match:
+            months.append(parse_date(f'{match[1]}-{match[2]}-01'))
+    return sorted(months)
+
+
+def months_before(cutoff):
+    """Months that still have attendance rows dated before cutoff."""
+    return list(Attendance.objects.filter(date__lt=cutoff).order_by().dates('date', 'month'))
+
+
+def read_month(month):
+    path = archive_path(month)
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            yield json.loads(line)
+
+
+def archive_month(month, batch_size):
+    """Write month's rows to its archive file, then delete them. Returns the number of rows archived."""
+    end = partitions.add_months(month, 1)
+    queryset = export_queryset('attendance', {}).filter(date__gte=month, date__lt=end)
+    if not queryset.exists():
+        return 0
+    ids, keys = [], set()
+
+    def fresh_rows():
+        for row in export_rows('attendance', queryset):
+            ids.append(row[ID])
+            keys.add((row[EMPLOYEE], row[DATE].isoformat()))
+            yield row
+
+    def earlier_rows():
+        # Rows added to the month after an earlier run replace their archived versions.
+        for record in read_month(month):
+            if (record['employee'], record['date']) not in keys:
+                yield [record[header] for header in HEADERS]
+
+    write_archive(month, itertools.chain(fresh_rows(), earlier_rows()))
+    # Every row of the month is in the archive now, so its summary counts are the archive's.
+    write_summary(month, end)
+    if not partitions.drop_partition_if_complete(month, len(ids)):
+        delete_rows(ids, month, end, batch_size)
+    bump_data_version()
+    return len(ids)
+
+
+def write_archive(month, rows):
+    os.makedirs(settings.ATTENDANCE_ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(month)
+    partial = f'{path}.partial'
+    with gzip.open(partial, 'wt', encoding='utf-8') as archive:
+        archive.writelines(stream_ndjson(rows, HEADERS))
+    # Readers only ever see a complete file.
+    os.replace(partial, path)
+
+
+def write_summary(month, end):
+    rows = AttendanceDailySummary.objects.filter(date__gte=month, date__lt=end).order_by().values(
+        'date', 'department_id', 'employment_type', *COUNT_FIELDS
+    )
+    path = summary_path(month)
+    with open(f'{path}.partial', 'w', encoding='utf-8') as summary:
+        json.dump([dict(row, date=row['date'].isoformat()) for row in rows], summary)
+    os.replace(f'{path}.partial', path)
+
+
+def archived_summaries(start=None, end=None):
+    """
+    The saved summary counts of archived days in start..end (inclusive), as
+    {(date, (department_id, employment_type)): counts}, and the archived
+    months in that range that have no saved counts.
+    """
+    counts, unknown = {}, []
+    for month in archived_months():
+        if (start and partitions.add_months(month, 1) <= start) or (end and month > end):
+            continue
+        if not os.path.exists(summary_path(month)):
+            unknown.append(month)
+            continue
+        with open(summary_path(month), encoding='utf-8') as summary:
+            rows = json.load(summary)
+        for row in rows:
+            day = parse_date(row['date'])
+            if (start and day < start) or (end and day > end):
+                continue
+            counts[(day, (row['department_id'], row['employment_type']))] = {
+                field: row[field] for field in COUNT_FIELDS
+            }
+    return counts, unknown
+
+
+def delete_rows(ids, start, end, batch_size):
+    # Raw deletes skip the rollup bookkeeping, so the daily summaries keep
+    # the archived days. Each batch commits on its own to keep locks short,
+    # and the date bounds let PostgreSQL prune to the month's partition.
+    table = connection.ops.quote_name(Attendance._meta.db_table)
+    start, end = connection.ops.adapt_datefield_value(start), connection.ops.adapt_datefield_value(end)
+    for offset in range(0, len(ids), batch_size):
+        batch = ids[offset:offset + batch_size]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE date >= %s AND date < %s AND id IN ({", ".join(["%s"] * len(batch))})',
+                [start, end, *batch]
+            )
+
+
+def parse_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format.')
+    return parsed
+
+
+def archived_rows(params):
+    """
+    Return an iterator over archived rows, as dicts keyed like the export
+    columns, matching the attendance list filters (employee, match, date,
+    status) and start/end. Bad parameters raise before anything is read.
+    """
+    start = parse_param(params, 'start') or parse_param(params, 'date')
+    end = parse_param(params, 'end') or parse_param(params, 'date')
+    status = params.get('status')
+    employee_ids = None
+    if params.get('employee'):
+        employees = filter_text(Employee.objects.all(), 'last_name', params['employee'], params.get('match'))
+        employee_ids = set(employees.values_list('id', flat=True))
+    first, last = (start.isoformat() if start else ''), (end.isoformat() if end else '9999')
+
+    def rows():
+        for month in archived_months():
+            if (start and partitions.add_months(month, 1) <= start) or (end and month > end):
+                continue
+            for record in read_month(month):
+                if not first <= record['date'] <= last:
+                    continue
+                if status and record['status'] != status:
+                    continue
+                if employee_ids is not None and record['employee'] not in employee_ids:
+                    continue
+                yield record
+    return rows()
+
+
+def archived_page(params, page, page_size):
+    """
+    Return (count, records, has_next) for one page of the matching archived
+    rows. Reading stops at the first match past the page, so count is only
+    known (otherwise None) on the last page.
+    """
+    count = 0
+    records = []
+    first = (page - 1) * page_size
+    for record in archived_rows(params):
+        if count == first + page_size:
+            return None, records, True
+        if count >= first:
+            records.append(record)
+        count += 1
+    return count, records, False
+
+
+def stream_archive(file_format, params):
+    rows = ([record[header] for header in HEADERS] for record in archived_rows(params))
+    if file_format == 'csv':
+        return stream_csv(rows, HEADERS)
+    return stream_ndjson(rows, HEADERS)
@@ -0,0 +1,135 @@
+"""
+Async variants of the dashboard and analytics endpoints for ASGI deployments.
+
+DRF views are synchronous, so these are plain Django async views that
+authenticate the token and apply the API's throttles themselves, and render
+with DRF's JSONRenderer so the response bodies match the sync endpoints.
+Responses are cached like the sync endpoints' under the data version.
+Independent queries run concurrently, each on its own thread and database
+connection.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.renderers import JSONRenderer
+
+from . import live
+from .analytics import DASHBOARD_PARTS, attendance_analytics_data, department_analytics_data
+from .authentication import CachedTokenAuthentication
+from .cache import async_cached_response
+from .throttling import check_throttles
+
+
+def json_response(payload, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(payload), content_type='application/json', status=status_code)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+async def authenticate(request):
+    auth = get_authorization_header(request).split()
+    keyword = CachedTokenAuthentication.keyword.lower().encode()
+    if len(auth) != 2 or auth[0].lower() != keyword:
+        return None
+    try:
+        user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(auth[1].decode())
+    except (AuthenticationFailed, UnicodeError):
+        return None
+    return user
+
+
+def own_connection(func):
+    # Each executor thread keeps its own connection; apply the same
+    # CONN_MAX_AGE/health rules Django applies around a normal request.
+    def run(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def in_thread(func, *args):
+    return await sync_to_async(own_connection(func), thread_sensitive=False)(*args)
+
+
+async def refuse(request, scope=None):
+    """The error response for anything but an authenticated, unthrottled GET, or None."""
+    if request.method != 'GET':
+        return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                             status.HTTP_405_METHOD_NOT_ALLOWED)
+    user = await authenticate(request)
+    if user is None:
+        return json_response({'detail': 'Authentication credentials were not provided.'},
+                             status.HTTP_401_UNAUTHORIZED, {'WWW-Authenticate': CachedTokenAuthentication.keyword})
+    request.user = user
+    try:
+        await sync_to_async(check_throttles)(request, scope)
+    except Throttled as e:
+        headers = {'Retry-After': '%d' % e.wait} if e.wait is not None else None
+        return json_response({'detail': e.detail}, status.HTTP_429_TOO_MANY_REQUESTS, headers)
+    return None
+
+
+def api_endpoint(scope):
+    """Turn compute(request), returning the data, into a view like the sync ones with that throttle scope."""
+    def decorator(compute):
+        @async_cached_response()
+        async def respond(request):
+            try:
+                data = await compute(request)
+                return json_response({"is_v1": True, "data": data})
+            except ValueError as e:
+                return json_response({"is_v1": True, "data": {"error": str(e)}}, status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                return json_response({"is_v1": True, "data": {"error": str(e)}},
+                                     status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        async def view(request):
+            refused = await refuse(request, scope)
+            if refused is not None:
+                return refused
+            return await respond(request)
+        view.__name__ = compute.__name__
+        return view
+    return decorator
+
+
+@api_endpoint('analytics')
+async def employee_dashboard(request):
+    names = list(DASHBOARD_PARTS)
+    results = await asyncio.gather(*(in_thread(DASHBOARD_PARTS[name]) for name in names))
+    return dict(zip(names, results))
+
+
+@api_endpoint('analytics')
+async def department_analytics(request):
+    return await in_thread(department_analytics_data, request.GET)
+
+
+@api_endpoint('analytics')
+async def attendance_analytics(request):
+    return await in_thread(attendance_analytics_data, request.GET)
+
+
+async def attendance_live(request):
+    """Server-sent events with today's attendance changes and counts, see employees.live."""
+    refused = await refuse(request)
+    if refused is not None:
+        return refused
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would buffer the endless stream instead of sending it.
+        return json_response({'detail': 'The live feed needs an ASGI server.'}, status.HTTP_501_NOT_IMPLEMENTED)
+    response = StreamingHttpResponse(live.stream(live.feed), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the events.
+    response['X-Accel-Buffering'] = 'no'
+    return response
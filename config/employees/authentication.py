@@ -0,0 +1,85 @@
+"""
+Token authentication without a query per request.
+
+DRF's TokenAuthentication joins authtoken_token to auth_user on every
+request. CachedTokenAuthentication keeps resolved tokens in a per-process
+LRU for up to TOKEN_CACHE_TTL seconds. Every entry records the auth version
+it was resolved under, a counter in THROTTLE_STORE that is bumped whenever a
+token is deleted or a user is saved (deactivated, password or permissions
+changed), so each worker drops its entries on its next request. The store is
+shared by all processes whatever the cache backend, so revocation is
+immediate everywhere. Writes that bypass signals, such as
+QuerySet.update(), must call bump_auth_version().
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .throttling import get_store
+
+AUTH_VERSION_KEY = 'employees:auth-version'
+
+
+def auth_version():
+    return get_store().version(AUTH_VERSION_KEY)
+
+
+def bump_auth_version(**kwargs):
+    """Invalidate every process's cached tokens; usable directly as a signal receiver."""
+    get_store().bump(AUTH_VERSION_KEY)
+
+
+class TokenCache:
+    """A thread-safe LRU of token key -> (user, token), valid for one auth version and `ttl` seconds."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, token, entry_version, expires = entry
+            if entry_version != version or expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # Requests get their own user instance, as views may annotate it.
+        return copy.copy(user), token
+
+    def put(self, key, user, token, version):
+        with self.lock:
+            self.entries[key] = (user, token, version, time.monotonic() + settings.TOKEN_CACHE_TTL)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+tokens = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in TokenAuthentication that resolves each token from the database once per TTL."""
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_SIZE:
+            return super().authenticate_credentials(key)
+        # Read the version first: a revocation racing the lookup below then
+        # leaves the entry under an outdated version.
+        version = auth_version()
+        cached = tokens.get(key, version)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        tokens.put(key, user, token, version)
+        return copy.copy(user), token
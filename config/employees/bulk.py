@@ -0,0 +1,211 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date, parse_time
+
+from . import live, rollups
+from .cache import bump_data_version
+from .models import Attendance, Employee
+
+STANDARD_HOURS = Decimal('8.00')
+MAX_HOURS = Decimal('24.00')
+QUERY_CHUNK = 5000
+UPSERT_BATCH = 1000
+UPSERT_FIELDS = ['check_in', 'check_out', 'hours_worked', 'overtime_hours', 'status', 'notes', 'leave_type']
+STATUSES = {code for code, _ in Attendance.STATUS_CHOICES}
+DEFAULT_ROW = {
+    'check_in': None, 'check_out': None, 'hours_worked': None, 'overtime_hours': Decimal('0.00'),
+    'status': 'PR', 'notes': '', 'leave_type': '',
+}
+
+
+def derive_hours(check_in, check_out):
+    """Return (hours_worked, overtime_hours); a check-out before check-in is an overnight shift."""
+    if check_in is None or check_out is None:
+        return None, Decimal('0.00')
+    day = datetime(2000, 1, 1)
+    worked = datetime.combine(day, check_out) - datetime.combine(day, check_in)
+    if worked < timedelta(0):
+        worked += timedelta(days=1)
+    hours = min(Decimal(worked.total_seconds()) / 3600, MAX_HOURS).quantize(Decimal('0.01'))
+    return hours, max(hours - STANDARD_HOURS, Decimal('0.00'))
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), QUERY_CHUNK):
+        yield values[start:start + QUERY_CHUNK]
+
+
+def _parse_value(parser, value):
+    if not value:
+        return None
+    try:
+        return parser(str(value))
+    except ValueError:
+        return None
+
+
+def _parse(record):
+    errors = {}
+    if not isinstance(record, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    parsed = {}
+    try:
+        parsed['employee_id'] = int(record.get('employee'))
+    except (TypeError, ValueError):
+        errors['employee'] = ['A valid employee id is required.']
+    parsed['date'] = _parse_value(parse_date, record.get('date'))
+    if parsed['date'] is None:
+        errors['date'] = ['A date in YYYY-MM-DD format is required.']
+    for field in ('check_in', 'check_out'):
+        if field not in record:
+            continue
+        value = record[field]
+        parsed[field] = _parse_value(parse_time, value)
+        if value and parsed[field] is None:
+            errors[field] = ['Time must be in HH:MM[:SS] format.']
+    if 'status' in record:
+        if record['status'] not in STATUSES:
+            errors['status'] = [f"Status must be one of {', '.join(sorted(STATUSES))}."]
+        parsed['status'] = record['status']
+    for field in ('notes', 'leave_type'):
+        if field in record:
+            parsed[field] = str(record[field] or '')
+    if len(parsed.get('leave_type', '')) > 50:
+        errors['leave_type'] = ['Ensure this field has no more than 50 characters.']
+    return (None, errors) if errors else (parsed, None)
+
+
+def upsert_attendance(records):
+    """
+    Validate a batch of attendance events together and upsert them on (employee, date).
+
+    Fields missing from an event keep their stored value, so separate check-in
+    and check-out events for the same day merge into one row. Returns one
+    result dict per input record, in input order.
+    """
+    results = [None] * len(records)
+    parsed = {}
+    for index, record in enumerate(records):
+        values, errors = _parse(record)
+        if errors:
+            results[index] = {'index': index, 'result': 'error', 'errors': errors}
+        else:
+            parsed[index] = values
+
+    employee_ids = {values['employee_id'] for values in parsed.values()}
+    known = set()
+    for chunk in _chunks(employee_ids):
+        known.update(Employee.objects.filter(pk__in=chunk).order_by().values_list('id', flat=True))
+    for index, values in list(parsed.items()):
+        if values['employee_id'] not in known:
+            results[index] = {'index': index, 'result': 'error', 'errors': {'employee': ['Employee does not exist.']}}
+            del parsed[index]
+
+    keys = {(values['employee_id'], values['date']) for values in parsed.values()}
+    dates = {day for _, day in keys}
+    with transaction.atomic():
+        # Every row of the batch exists and is locked before it is read, so
+        # concurrent batches for the same days merge into each other's writes
+        # instead of overwriting them with what they read before.
+        created = _insert_missing(keys)
+        existing = {}
+        for chunk in _chunks({employee_id for employee_id, _ in keys}):
+            rows = Attendance.objects.select_for_update().filter(
+                employee_id__in=chunk, date__in=dates
+            ).order_by('employee_id', 'date').values('employee_id', 'date', *UPSERT_FIELDS)
+            existing.update({(row['employee_id'], row['date']): row for row in rows})
+
+        merged = {}
+        for index, values in parsed.items():
+            key = (values['employee_id'], values['date'])
+            row = merged.get(key) or dict(existing[key])
+            row.update(values)
+            row['hours_worked'], row['overtime_hours'] = derive_hours(row['check_in'], row['check_out'])
+            merged[key] = row
+            results[index] = {
+                'index': index,
+                'result': 'created' if key in created else 'updated',
+                'employee': key[0],
+                'date': key[1].isoformat(),
+                'hours_worked': None if row['hours_worked'] is None else str(row['hours_worked']),
+                'overtime_hours': str(row['overtime_hours']),
+            }
+
+        if merged:
+            _upsert(merged.values())
+            live.publish([
+                live.attendance_change(
+                    key[0], key[1], row['status'], row['check_in'],
+                    previous_status=None if key in created else existing[key]['status'], created=key in created
+                )
+                for key, row in merged.items()
+            ])
+    return results
+
+
+def _insert_sql(count, on_conflict):
+    ops = connection.ops
+    table = ops.quote_name(Attendance._meta.db_table)
+    column_sql = ', '.join(ops.quote_name(column) for column in ['employee_id', 'date'] + UPSERT_FIELDS)
+    placeholder = '(' + ', '.join(['%s'] * (len(UPSERT_FIELDS) + 2)) + ')'
+    return (
+        f'INSERT INTO {table} ({column_sql}) VALUES {", ".join([placeholder] * count)} '
+        f'ON CONFLICT ({ops.quote_name("employee_id")}, {ops.quote_name("date")}) {on_conflict}'
+    )
+
+
+def _row_params(row):
+    ops = connection.ops
+    return (
+        row['employee_id'],
+        ops.adapt_datefield_value(row['date']),
+        ops.adapt_timefield_value(row['check_in']),
+        ops.adapt_timefield_value(row['check_out']),
+        ops.adapt_decimalfield_value(row['hours_worked']),
+        ops.adapt_decimalfield_value(row['overtime_hours']),
+        row['status'],
+        row['notes'],
+        row['leave_type'],
+    )
+
+
+def _insert_missing(keys):
+    """Insert a row with the model defaults for each (employee_id, date) not stored yet; return those keys."""
+    to_date = Attendance._meta.get_field('date').to_python
+    # Sorted, so that concurrent batches take their row locks in the same order.
+    keys = sorted(keys)
+    created = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(keys), UPSERT_BATCH):
+            batch = keys[start:start + UPSERT_BATCH]
+            params = []
+            for employee_id, day in batch:
+                params.extend(_row_params(dict(DEFAULT_ROW, employee_id=employee_id, date=day)))
+            on_conflict = (
+                f'DO NOTHING RETURNING {connection.ops.quote_name("employee_id")}, '
+                f'{connection.ops.quote_name("date")}'
+            )
+            cursor.execute(_insert_sql(len(batch), on_conflict), params)
+            created.update((employee_id, to_date(day)) for employee_id, day in cursor.fetchall())
+    return created
+
+
+def _upsert(rows):
+    # A hand-built multi-row INSERT ... ON CONFLICT skips per-object model
+    # instantiation and field preparation, which dominate bulk_create() here.
+    ops = connection.ops
+    update_sql = ', '.join(f'{ops.quote_name(field)} = EXCLUDED.{ops.quote_name(field)}' for field in UPSERT_FIELDS)
+    rows = list(rows)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH):
+            batch = rows[start:start + UPSERT_BATCH]
+            params = []
+            for row in batch:
+                params.extend(_row_params(row))
+            cursor.execute(_insert_sql(len(batch), f'DO UPDATE SET {update_sql}'), params)
+        # Raw SQL bypasses AttendanceQuerySet, so refresh the rollup explicitly.
+        rollups.refresh_dates({row['date'] for row in rows})
+    bump_data_version()
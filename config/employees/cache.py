@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import replica_reads, replica_reads_enabled
+
+VERSION_KEY = 'employees:data-version'
+LAST_WRITE_KEY = 'employees:recent-write'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def current_version(cache, key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version evicted from the cache never
+        # restarts at a number that older entries were stored under.
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(cache, key):
+    """Increment the version under `key` and return the new value."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        current_version(cache, key)
+        return cache.incr(key)
+
+
+def data_version():
+    return current_version(get_cache(), VERSION_KEY)
+
+
+def bump_data_version(**kwargs):
+    """Invalidate every cached response; usable directly as a signal receiver."""
+    cache = get_cache()
+    cache.set(LAST_WRITE_KEY, 1, timeout=settings.REPLICA_PIN_SECONDS)
+    bump_version(cache, VERSION_KEY)
+
+
+def cache_key(request, version):
+    # GET rather than query_params: async views pass Django's own requests.
+    params = sorted(request.GET.lists())
+    raw = json.dumps([request.path, params, timezone.now().date().isoformat()])
+    return f'employees:response:{version}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cached_response(timeout=None, lock_timeout=30, wait_interval=0.05):
+    """
+    Cache a GET view's 200 responses under the current data version, with
+    ETag/If-None-Match support. On a miss only one caller computes the
+    response; concurrent callers wait for it instead of recomputing.
+    """
+    if timeout is None:
+        timeout = settings.RESPONSE_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = get_cache()
+            key = cache_key(request, data_version())
+            entry = cache.get(key)
+            if entry is None:
+                lock_key = f'{key}:lock'
+                if cache.add(lock_key, 1, timeout=lock_timeout):
+                    # Right after a write a lagging replica could put stale data
+                    # under the new version, so fill the entry from the primary.
+                    try:
+                        with replica_reads(cache.get(LAST_WRITE_KEY) is None and replica_reads_enabled()):
+                            response = view(request, *args, **kwargs)
+                        if response.status_code != status.HTTP_200_OK:
+                            return response
+                        entry = store(cache, key, response.data, timeout)
+                    finally:
+                        cache.delete(lock_key)
+                else:
+                    entry = wait_for(cache, key, lock_key, lock_timeout, wait_interval)
+                    if entry is None:
+                        return view(request, *args, **kwargs)
+            etag, data = entry
+            if etag in request.headers.get('If-None-Match', ''):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(data)
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+
+def store(cache, key, data, timeout):
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    entry = (f'"{hashlib.md5(body.encode()).hexdigest()}"', data)
+    cache.set(key, entry, timeout=timeout)
+    return entry
+
+
+def wait_for(cache, key, lock_key, lock_timeout, wait_interval):
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(wait_interval)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            # The computing request failed or returned an error; don't wait on it.
+            return cache.get(key)
+    return None
+
+
+def async_cached_response(timeout=None, lock_timeout=30, wait_interval=0.05):
+    """
+    cached_response() for async views: caches the rendered body of their 200
+    responses, with the same keys, ETags and single computation on a miss.
+    """
+    if timeout is None:
+        timeout = settings.RESPONSE_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            cache = get_cache()
+            key = cache_key(request, await sync_to_async(data_version)())
+            entry = await cache.aget(key)
+            if entry is None:
+                lock_key = f'{key}:lock'
+                if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+                    try:
+                        recent_write = await cache.aget(LAST_WRITE_KEY) is not None
+                        with replica_reads(not recent_write and replica_reads_enabled()):
+                            response = await view(request, *args, **kwargs)
+                        if response.status_code != status.HTTP_200_OK:
+                            return response
+                        entry = (f'"{hashlib.md5(response.content).hexdigest()}"', response.content,
+                                 response['Content-Type'])
+                        await cache.aset(key, entry, timeout=timeout)
+                    finally:
+                        await cache.adelete(lock_key)
+                else:
+                    entry = await async_wait_for(cache, key, lock_key, lock_timeout, wait_interval)
+                    if entry is None:
+                        return await view(request, *args, **kwargs)
+            etag, body, content_type = entry
+            if etag in request.headers.get('If-None-Match', ''):
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = HttpResponse(body, content_type=content_type)
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+
+async def async_wait_for(cache, key, lock_key, lock_timeout, wait_interval):
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(wait_interval)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry
+        if await cache.aget(lock_key) is None:
+            return await cache.aget(key)
+    return None
@@ -0,0 +1,132 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import filter_attendance, filter_employees, filter_reviews
+from .models import Attendance, Employee, PerformanceReview
+
+CHUNK_SIZE = 2000
+
+# Each column is (header, source fields). Multi-field columns are joined with a
+# space, mirroring the *_name fields of the serializers.
+RESOURCES = {
+    'employees': {
+        'queryset': lambda: Employee.objects.order_by('pk'),
+        'filter': filter_employees,
+        'columns': [
+            ('id', ('id',)),
+            ('first_name', ('first_name',)),
+            ('last_name', ('last_name',)),
+            ('email', ('email',)),
+            ('phone', ('phone',)),
+            ('hire_date', ('hire_date',)),
+            ('job_title', ('job_title',)),
+            ('salary', ('salary',)),
+            ('department', ('department',)),
+            ('department_name', ('department__name',)),
+            ('employment_type', ('employment_type',)),
+            ('manager', ('manager',)),
+            ('manager_name', ('manager__first_name', 'manager__last_name')),
+            ('date_of_birth', ('date_of_birth',)),
+            ('address', ('address',)),
+        ],
+    },
+    'attendance': {
+        'queryset': lambda: Attendance.objects.order_by('pk'),
+        'filter': filter_attendance,
+        'columns': [
+            ('id', ('id',)),
+            ('employee', ('employee',)),
+            ('employee_name', ('employee__first_name', 'employee__last_name')),
+            ('date', ('date',)),
+            ('check_in', ('check_in',)),
+            ('check_out', ('check_out',)),
+            ('hours_worked', ('hours_worked',)),
+            ('status', ('status',)),
+            ('notes', ('notes',)),
+            ('overtime_hours', ('overtime_hours',)),
+            ('leave_type', ('leave_type',)),
+        ],
+    },
+    'performance-reviews': {
+        'queryset': lambda: PerformanceReview.objects.order_by('pk'),
+        'filter': filter_reviews,
+        'columns': [
+            ('id', ('id',)),
+            ('employee', ('employee',)),
+            ('employee_name', ('employee__first_name', 'employee__last_name')),
+            ('review_date', ('review_date',)),
+            ('reviewer', ('reviewer',)),
+            ('rating', ('rating',)),
+            ('comments', ('comments',)),
+            ('goals', ('goals',)),
+            ('strengths', ('strengths',)),
+            ('areas_for_improvement', ('areas_for_improvement',)),
+            ('next_review_date', ('next_review_date',)),
+        ],
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(resource, params):
+    spec = RESOURCES[resource]
+    queryset = spec['filter'](spec['queryset'](), params)
+    if resource == 'attendance':
+        if params.get('start'):
+            queryset = queryset.filter(date__gte=params['start'])
+        if params.get('end'):
+            queryset = queryset.filter(date__lte=params['end'])
+    fields = [field for _, sources in spec['columns'] for field in sources]
+    return queryset.values_list(*fields)
+
+
+def export_rows(resource, queryset):
+    """Yield one list of column values per row, reading the database in chunks."""
+    widths = [len(sources) for _, sources in RESOURCES[resource]['columns']]
+    # values_list() skips model instantiation; iterator() keeps memory flat.
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        values = []
+        position = 0
+        for width in widths:
+            if width == 1:
+                values.append(row[position])
+            else:
+                parts = row[position:position + width]
+                values.append(None if parts[0] is None else ' '.join(parts))
+            position += width
+        yield values
+
+
+def stream_csv(rows, headers):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for values in rows:
+        yield writer.writerow(['' if value is None else value for value in values])
+
+
+def stream_ndjson(rows, headers):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for values in rows:
+        yield encoder.encode(dict(zip(headers, values))) + '\n'
+
+
+def stream_export(resource, file_format, params):
+    """Build the filtered query up front (so bad filters fail before streaming starts)."""
+    queryset = export_queryset(resource, params)
+    headers = [header for header, _ in RESOURCES[resource]['columns']]
+    rows = export_rows(resource, queryset)
+    if file_format == 'csv':
+        return stream_csv(rows, headers)
+    return stream_ndjson(rows, headers)
@@ -0,0 +1,144 @@
+"""
+Fast read-only path for the list endpoints.
+
+Pages are read with values() and turned into output dicts by precompiled
+per-field getters that reproduce each serializer field's to_representation(),
+so no model or serializer instances are built per row. FastJSONRenderer then
+encodes with orjson. Responses are byte-for-byte what the serializers and
+DRF's JSONRenderer produce.
+"""
+import operator
+from decimal import Decimal
+from functools import lru_cache
+
+import orjson
+from django.conf import settings
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import field_paths
+from .metrics import timed
+
+# Fields whose to_representation() returns database values unchanged.
+IDENTITY_FIELDS = (drf_fields.CharField, drf_fields.IntegerField, drf_fields.ChoiceField, PrimaryKeyRelatedField)
+
+
+def column_getter(columns):
+    if len(columns) == 1:
+        return operator.itemgetter(columns[0])
+
+    # Multi-column fields (employee_name, manager_name) join names with a
+    # space, or are null when the relation is.
+    def joined(row):
+        parts = [row[column] for column in columns]
+        return None if parts[0] is None else ' '.join(parts)
+    return joined
+
+
+def null_safe(get, convert):
+    def convert_value(row):
+        value = get(row)
+        return None if value is None else convert(value)
+    return convert_value
+
+
+def decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    # Database decimals already carry the field's scale, so quantize() is a no-op.
+    def convert(value):
+        if isinstance(value, Decimal) and value.as_tuple().exponent == exponent:
+            return f'{value:f}'
+        return field.to_representation(value)
+    return convert
+
+
+def converter(field):
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    if isinstance(field, drf_fields.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, drf_fields.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT) == drf_fields.ISO_8601:
+            return lambda value: value.isoformat()
+    if isinstance(field, drf_fields.TimeField):
+        if getattr(field, 'format', api_settings.TIME_FORMAT) == drf_fields.ISO_8601:
+            return lambda value: value.isoformat()
+    return field.to_representation
+
+
+@lru_cache(maxsize=None)
+def compile_fields(serializer_class, names):
+    """Return (values() columns, [(name, getter)]) rendering names of serializer_class."""
+    serializer = serializer_class()
+    explicit = getattr(serializer_class.Meta, 'field_columns', {})
+    columns, getters = [], []
+    for name in names:
+        field = serializer.fields[name]
+        # Fields mapped to no column (employee_count) read the annotation.
+        paths = field_paths(serializer_class, [name]) or [name]
+        columns.extend(path for path in paths if path not in columns)
+        get = column_getter(paths)
+        # Meta.field_columns entries are method fields whose value is the column.
+        convert = None if name in explicit else converter(field)
+        getters.append((name, get if convert is None else null_safe(get, convert)))
+    return columns, getters
+
+
+def render_rows(rows, getters):
+    return [{name: get(row) for name, get in getters} for row in rows]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when its output is identical:
+    compact, unescaped unicode, and dates/times left to DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for JavaScript compatibility.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastListMixin:
+    """
+    Viewset mixin serving list() from values() rows. Requests with ?include=
+    take the regular serializer path; API_FAST_LIST_SERIALIZATION turns the
+    fast path off.
+    """
+    renderer_classes = [FastJSONRenderer] + [
+        renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if not issubclass(renderer, JSONRenderer)
+    ]
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_LIST_SERIALIZATION or self.requested_includes():
+            return super().list(request, *args, **kwargs)
+        serializer_class = self.get_serializer_class()
+        requested = self.requested_fields(serializer_class)
+        names = tuple(name for name in serializer_class().fields if requested is None or name in requested)
+        columns, getters = compile_fields(serializer_class, names)
+        # Keyset pagination reads its ordering columns off the page's rows.
+        ordering = [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*dict.fromkeys(columns + ordering))
+        page = self.paginate_queryset(rows)
+        with timed('serialize'):
+            output = render_rows(rows if page is None else page, getters)
+        if page is not None:
+            return self.get_paginated_response(output)
+        return Response(output)
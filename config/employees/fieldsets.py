@@ -0,0 +1,125 @@
+"""
+Sparse fieldsets and opt-in nested includes for the model viewsets.
+
+?fields=id,first_name,department_name trims both the serialized output and the
+SELECTed columns. ?include=attendances,performance_reviews nests related
+objects, loaded with one prefetch query per include (or a join for to-one
+relations) however many rows the page holds; fields[attendances]=date,status
+trims an include the same way.
+"""
+from django.db.models import Prefetch
+
+FIELDSET_ACTIONS = ('list', 'retrieve')
+
+
+def parse_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def field_paths(serializer_class, names):
+    """ORM paths that must be loaded to render the named fields of serializer_class."""
+    # Meta.field_columns covers fields whose source isn't a plain attribute path,
+    # such as method fields and annotations.
+    explicit = getattr(serializer_class.Meta, 'field_columns', {})
+    fields = serializer_class().fields
+    paths = []
+    for name in names:
+        if name in explicit:
+            paths.extend(explicit[name])
+        else:
+            paths.append(fields[name].source.replace('.', '__'))
+    return paths
+
+
+def restrict(queryset, paths):
+    """Load only the given paths, joining exactly the relations they traverse."""
+    relations = {path.rsplit('__', 1)[0] for path in paths if '__' in path}
+    queryset = queryset.select_related(None)
+    if relations:
+        queryset = queryset.select_related(*relations)
+    return queryset.only(queryset.model._meta.pk.name, *paths)
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Serializer mixin accepting fields= (names to keep, None for all) and
+    includes= ({name: (serializer_class, fields, many)}) for nested output.
+    """
+
+    def __init__(self, *args, fields=None, includes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name, (serializer_class, nested_fields, many) in (includes or {}).items():
+            self.fields[name] = serializer_class(many=many, read_only=True, fields=nested_fields)
+
+
+class SparseFieldsetMixin:
+    """Viewset mixin wiring ?fields= and ?include= into get_queryset() and get_serializer()."""
+    include_serializers = {}
+    fieldset_actions = FIELDSET_ACTIONS
+
+    def uses_fieldsets(self):
+        return getattr(self, 'action', None) in self.fieldset_actions
+
+    def requested_fields(self, serializer_class, include=None):
+        """Requested field names known to the serializer, or None for all of them."""
+        param = f'fields[{include}]' if include else 'fields'
+        value = self.request.query_params.get(param)
+        if value is None or not self.uses_fieldsets():
+            return None
+        known = serializer_class().fields
+        return [name for name in parse_names(value) if name in known]
+
+    def requested_includes(self):
+        if not self.uses_fieldsets():
+            return []
+        names = parse_names(self.request.query_params.get('include', ''))
+        return [name for name in dict.fromkeys(names) if name in self.include_serializers]
+
+    def wants_field(self, name):
+        fields = self.requested_fields(self.get_serializer_class())
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.uses_fieldsets():
+            model = self.get_serializer_class().Meta.model
+            kwargs['fields'] = self.requested_fields(self.get_serializer_class())
+            kwargs['includes'] = {
+                name: (
+                    self.include_serializers[name],
+                    self.requested_fields(self.include_serializers[name], name),
+                    model._meta.get_field(name).one_to_many,
+                )
+                for name in self.requested_includes()
+            }
+        return super().get_serializer(*args, **kwargs)
+
+    def apply_fieldsets(self, queryset):
+        if not self.uses_fieldsets():
+            return queryset
+        serializer_class = self.get_serializer_class()
+        fields = self.requested_fields(serializer_class)
+        paths = []
+        if fields is not None:
+            # Keyset pagination reads its ordering columns off the page's rows.
+            ordering = getattr(self.paginator, 'ordering', ())
+            paths = field_paths(serializer_class, fields) + [field.lstrip('-') for field in ordering]
+        joined = []
+        for name in self.requested_includes():
+            nested = self.include_serializers[name]
+            nested_fields = self.requested_fields(nested, name)
+            nested_paths = field_paths(nested, list(nested().fields) if nested_fields is None else nested_fields)
+            relation = queryset.model._meta.get_field(name)
+            if relation.one_to_many:
+                related = restrict(relation.related_model._default_manager.all(), nested_paths + [relation.field.name])
+                queryset = queryset.prefetch_related(Prefetch(name, queryset=related))
+            else:
+                joined.extend(f'{name}__{path}' for path in nested_paths)
+                paths.append(name)
+        if fields is not None:
+            return restrict(queryset, paths + joined)
+        if joined:
+            queryset = queryset.select_related(*{path.rsplit('__', 1)[0] for path in joined})
+        return queryset
@@ -0,0 +1,64 @@
+from django.db import connection
+from django.db.models.functions import Lower
+
+MATCH_MODES = ('exact', 'prefix', 'contains')
+
+
+def filter_text(queryset, field, value, mode='contains'):
+    """
+    Case-insensitive name filtering that can use the indexes from migration 0005.
+
+    ``exact`` and ``prefix`` compare against LOWER(field), which is served by a
+    functional btree index on every backend; ``contains`` keeps the original
+    icontains behaviour, backed by a trigram index on PostgreSQL.
+    """
+    if mode not in MATCH_MODES:
+        mode = 'contains'
+    if mode == 'contains':
+        return queryset.filter(**{f'{field}__icontains': value})
+
+    alias = f"{field.replace('__', '_')}_lower"
+    value = value.lower()
+    queryset = queryset.alias(**{alias: Lower(field)})
+    if mode == 'exact':
+        return queryset.filter(**{alias: value})
+    if connection.vendor == 'postgresql':
+        # LIKE 'abc%' uses the text_pattern_ops index regardless of collation.
+        return queryset.filter(**{f'{alias}__startswith': value})
+    # Other backends only use an index for LIKE in narrow cases, but a range
+    # scan on the binary-collated LOWER() index works everywhere.
+    upper_bound = value[:-1] + chr(ord(value[-1]) + 1)
+    return queryset.filter(**{f'{alias}__gte': value, f'{alias}__lt': upper_bound})
+
+
+def filter_employees(queryset, params):
+    department = params.get('department')
+    employment_type = params.get('employment_type')
+    if department:
+        queryset = filter_text(queryset, 'department__name', department, params.get('match'))
+    if employment_type:
+        queryset = queryset.filter(employment_type=employment_type)
+    return queryset
+
+
+def filter_attendance(queryset, params):
+    employee = params.get('employee')
+    date = params.get('date')
+    status = params.get('status')
+    if employee:
+        queryset = filter_text(queryset, 'employee__last_name', employee, params.get('match'))
+    if date:
+        queryset = queryset.filter(date=date)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def filter_reviews(queryset, params):
+    employee = params.get('employee')
+    min_rating = params.get('min_rating')
+    if employee:
+        queryset = filter_text(queryset, 'employee__last_name', employee, params.get('match'))
+    if min_rating:
+        queryset = queryset.filter(rating__gte=min_rating)
+    return queryset
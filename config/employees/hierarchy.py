@@ -0,0 +1,115 @@
+"""
+Org hierarchy queries over ``Employee.manager``.
+
+Subtrees and reporting chains are walked with recursive CTEs, one query per
+question whatever the depth of the org, over the index on manager_id.
+Nothing is precomputed, so results follow manager changes immediately.
+Walks stop at MAX_DEPTH levels and manager changes that would create a
+cycle are rejected, so a bad row can't make a query run away.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Department, Employee
+
+MAX_DEPTH = 50
+
+
+def tables():
+    quote = connection.ops.quote_name
+    return quote(Employee._meta.db_table), quote(Department._meta.db_table)
+
+
+def subtree_sql(root_id, max_depth=None):
+    """SQL and params selecting (id, branch, depth) for everyone under root_id.
+
+    branch is the direct report of root_id whose subtree the row is in, and
+    depth is 1 for direct reports.
+    """
+    employees, _ = tables()
+    max_depth = min(max_depth or MAX_DEPTH, MAX_DEPTH)
+    sql = (
+        f'WITH RECURSIVE org(id, branch, depth) AS ('
+        f'SELECT id, id, 1 FROM {employees} WHERE manager_id = %s '
+        f'UNION ALL '
+        f'SELECT e.id, org.branch, org.depth + 1 FROM {employees} e JOIN org ON e.manager_id = org.id '
+        f'WHERE org.depth < %s) '
+    )
+    return sql, [root_id, max_depth]
+
+
+def subtree_ids(root_id, max_depth=None):
+    """Subquery of the ids of everyone under root_id, for use with __in lookups."""
+    sql, params = subtree_sql(root_id, max_depth)
+    return RawSQL(f'{sql}SELECT id FROM org', params)
+
+
+def subtree(queryset, root_id, max_depth=None):
+    """Restrict an Employee queryset to the people under root_id, max_depth levels down."""
+    return queryset.filter(pk__in=subtree_ids(root_id, max_depth))
+
+
+def would_create_cycle(employee_id, manager_id):
+    if employee_id == manager_id:
+        return True
+    return subtree(Employee.objects.all(), employee_id).filter(pk=manager_id).exists()
+
+
+def reporting_chain(employee_id):
+    """The employee's managers, from the direct manager (level 1) up to the top."""
+    employees, departments = tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH RECURSIVE chain(id, manager_id, level) AS ('
+            f'SELECT id, manager_id, 0 FROM {employees} WHERE id = %s '
+            f'UNION ALL '
+            f'SELECT e.id, e.manager_id, chain.level + 1 FROM {employees} e JOIN chain ON e.id = chain.manager_id '
+            f'WHERE chain.level < %s) '
+            f'SELECT e.id, e.first_name, e.last_name, e.job_title, d.name, chain.level '
+            f'FROM chain JOIN {employees} e ON e.id = chain.id JOIN {departments} d ON d.id = e.department_id '
+            f'WHERE chain.level > 0 ORDER BY chain.level',
+            [employee_id, MAX_DEPTH]
+        )
+        return [
+            {
+                'id': pk, 'name': f'{first_name} {last_name}', 'job_title': job_title,
+                'department_name': department, 'level': level,
+            }
+            for pk, first_name, last_name, job_title, department, level in cursor.fetchall()
+        ]
+
+
+def to_decimal(value):
+    # SQLite returns sums of decimal columns as floats.
+    if value is None or isinstance(value, Decimal):
+        return value or Decimal('0.00')
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def branch_rollups(root_id):
+    """Headcount, payroll and depth of each direct report's subtree (the report included)."""
+    employees, _ = tables()
+    sql, params = subtree_sql(root_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql}SELECT org.branch, COUNT(*), SUM(e.salary), MAX(org.depth), '
+            f'COUNT(DISTINCT CASE WHEN org.depth > 1 THEN e.manager_id END) '
+            f'FROM org JOIN {employees} e ON e.id = org.id GROUP BY org.branch',
+            params
+        )
+        rows = cursor.fetchall()
+    people = Employee.objects.in_bulk([branch for branch, *_ in rows])
+    branches = []
+    for branch, headcount, total_salary, depth, managers in rows:
+        branches.append({
+            'id': branch,
+            'name': str(people[branch]),
+            'job_title': people[branch].job_title,
+            'headcount': headcount,
+            'total_salary': to_decimal(total_salary),
+            'levels': depth,
+            'managers': managers,
+        })
+    return sorted(branches, key=lambda row: (-row['headcount'], row['name']))
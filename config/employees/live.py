@@ -0,0 +1,217 @@
+"""
+Today's attendance, pushed to connected clients as server-sent events.
+
+Saving or deleting an Attendance row of today, and bulk upserts, publish a
+change once the transaction commits. A LiveFeed thread collects changes for
+LIVE_FEED_INTERVAL seconds, recomputes today's counts with one query and
+encodes one message, which every subscriber's queue receives as is: the
+cost of an update doesn't grow with the number of clients. Changes made in
+other processes, or by QuerySet.update(), show up as updated counts without
+the rows that changed: right away through the data version when the
+response cache is shared between processes, and otherwise within
+LIVE_FEED_POLL_SECONDS, after which the counts are read again regardless.
+
+Fan-out is in-process: each worker process serves the clients connected to
+it. Subscriber queues belong to the event loop that streams to the client;
+the thread hands messages over with call_soon_threadsafe.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .cache import data_version
+from .models import Attendance, AttendanceDailySummary
+from .rollups import COUNT_FIELDS, to_date
+
+logger = logging.getLogger(__name__)
+
+# Messages a client may fall behind by before its stream is closed; it
+# reconnects and starts again from the current counts.
+SUBSCRIBER_QUEUE_SIZE = 100
+# Most changes sent in one message; the rest are only counted.
+MAX_CHANGES = 200
+KEEPALIVE = b': keepalive\n\n'
+
+
+def attendance_change(employee_id, day, status, check_in=None, previous_status=None, created=False):
+    """The change event for one saved row, or None if it isn't of today or changes nothing shown."""
+    day = to_date(day)
+    if day != timezone.now().date():
+        return None
+    if created:
+        kind = 'checkin'
+    elif status != previous_status:
+        kind = 'status'
+    else:
+        return None
+    change = {'type': kind, 'employee': employee_id, 'status': status}
+    if created:
+        # Saved instances keep check_in as assigned, possibly a string.
+        change['check_in'] = Attendance._meta.get_field('check_in').to_python(check_in)
+    else:
+        change['previous_status'] = previous_status
+    return change
+
+
+def removal(employee_id, day, status):
+    if to_date(day) != timezone.now().date():
+        return None
+    return {'type': 'removed', 'employee': employee_id, 'status': status}
+
+
+def publish(changes):
+    """Hand changes to the feed once the current transaction commits."""
+    changes = [change for change in changes if change is not None]
+    if changes:
+        transaction.on_commit(partial(feed.publish, changes))
+
+
+def today_counts(day):
+    totals = AttendanceDailySummary.objects.filter(date=day).aggregate(
+        **{field: Sum(field) for field in COUNT_FIELDS}
+    )
+    return {field: value or 0 for field, value in totals.items()}
+
+
+def encode(sequence, payload):
+    return b'id: %d\nevent: attendance\ndata: %s\n\n' % (sequence, JSONRenderer().render(payload))
+
+
+class Subscription:
+    """One client's queue of encoded messages, owned by the event loop streaming to it."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.primed = False
+        self.lagging = False
+
+    def deliver(self, message):
+        # Runs on self.loop.
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.lagging = True
+
+    def send(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, message)
+        except RuntimeError:
+            # The loop is closed; the stream is gone.
+            pass
+
+
+class LiveFeed:
+    """
+    Fan-out of attendance changes and today's counts. With background=False
+    nothing runs on its own: callers drive it with flush(), as the tests do.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.pending = []
+        self.thread = None
+        self.pid = None
+        self.sequence = 0
+        # Today's counts, the (data version, date) they were computed under and when.
+        self.counts = None
+        self.counts_key = None
+        self.counts_at = None
+
+    def subscribe(self):
+        """Register a client on the running event loop."""
+        subscription = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.background and (self.thread is None or self.pid != os.getpid()):
+                # Not started yet, or a forked worker: threads don't survive fork().
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, name='attendance-live-feed', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, changes):
+        with self.lock:
+            if self.subscribers:
+                self.pending.extend(changes)
+
+    def run(self):
+        while True:
+            time.sleep(settings.LIVE_FEED_INTERVAL)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Attendance live feed update failed')
+
+    def flush(self):
+        """Send what changed since the last flush to every subscriber, and the current state to new ones."""
+        with self.lock:
+            subscribers = list(self.subscribers)
+            changes, self.pending = self.pending, []
+        if not subscribers:
+            self.counts = self.counts_key = self.counts_at = None
+            return
+        # Read the version first: a write during the query then triggers another one.
+        key = (data_version(), timezone.now().date())
+        now = time.monotonic()
+        previous = self.counts
+        # A per-process cache doesn't see other processes' version bumps, hence the poll.
+        if changes or key != self.counts_key or now - self.counts_at >= settings.LIVE_FEED_POLL_SECONDS:
+            self.counts, self.counts_key, self.counts_at = today_counts(key[1]), key, now
+        day = key[1].isoformat()
+        if changes or (previous is not None and self.counts != previous):
+            self.sequence += 1
+            message = encode(self.sequence, {
+                'date': day, 'changes': changes[-MAX_CHANGES:],
+                'more_changes': max(len(changes) - MAX_CHANGES, 0), 'counts': self.counts,
+            })
+            for subscription in subscribers:
+                if subscription.primed:
+                    subscription.send(message)
+        new = [subscription for subscription in subscribers if not subscription.primed]
+        if new:
+            message = encode(self.sequence, {'date': day, 'changes': [], 'more_changes': 0, 'counts': self.counts})
+            for subscription in new:
+                subscription.primed = True
+                subscription.send(message)
+
+
+feed = LiveFeed()
+
+
+async def stream(live_feed):
+    """The event stream of one client; ends after LIVE_FEED_MAX_SECONDS or when the client falls behind."""
+    # Subscribe here rather than in the view: this runs on the server's event loop.
+    subscription = live_feed.subscribe()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LIVE_FEED_MAX_SECONDS
+    try:
+        yield b'retry: 1000\n\n'
+        while not subscription.lagging:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                yield await asyncio.wait_for(
+                    subscription.queue.get(), min(settings.LIVE_FEED_KEEPALIVE_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield KEEPALIVE
+    finally:
+        live_feed.unsubscribe(subscription)
@@ -0,0 +1,137 @@
+"""
+Logging that stays off the request path.
+
+QueuedRotatingFileHandler formats a record as one JSON line and hands it to
+a background thread that writes it to a size-rotated file, so request
+threads never wait on disk. SQLSampleFilter keeps a sample of the
+django.db.backends query log; the queries of a request that turns out slow
+or failing are written in full (see RequestMetricsMiddleware).
+
+This module is loaded by LOGGING before the apps are, so it must not import
+models.
+"""
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import orjson
+
+from . import metrics
+
+# Attributes every LogRecord has; anything else was passed as extra=.
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+# Most held query records kept per request.
+MAX_HELD_RECORDS = 1000
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, process, extras and any exception."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DrainingQueueListener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail to stop when the queue is full.
+        self.queue.put(self._sentinel)
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """
+    Format records on the calling thread, then queue them for a listener
+    thread that appends them to `filename`, rotating it at maxBytes. A full
+    queue drops records (and says how many) instead of blocking. `{pid}` in
+    filename gives each worker process its own file, as rotation of a file
+    shared by several processes loses records.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding='utf-8', queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.filename, self.max_bytes, self.backup_count = filename, maxBytes, backupCount
+        self.encoding, self.queue_size = encoding, queue_size
+        self.dropped = 0
+        self.start()
+
+    def start(self):
+        self.pid = os.getpid()
+        self.target = RotatingFileHandler(
+            self.filename.format(pid=self.pid), maxBytes=self.max_bytes, backupCount=self.backup_count,
+            encoding=self.encoding, delay=True
+        )
+        self.listener = DrainingQueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            # A forked worker: the listener thread didn't survive the fork.
+            self.queue = queue.Queue(self.queue_size)
+            self.start()
+        try:
+            if self.dropped:
+                warning = logging.LogRecord(
+                    __name__, logging.WARNING, __file__, 0, 'Log queue full, dropped %d records', (self.dropped,), None
+                )
+                self.queue.put_nowait(self.prepare(warning))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # Stopping the listener writes out everything still queued.
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
+
+
+class SQLSampleFilter(logging.Filter):
+    """
+    Pass `rate` of the query log. Requests are sampled as a whole; the
+    queries of the others are held on the request until the middleware
+    either releases them (slow or failed requests) or drops them.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, '_keep', False):
+            return True
+        request_metrics = metrics.current.get()
+        if request_metrics is None:
+            return random.random() < self.rate
+        if request_metrics.log_sampled is None:
+            request_metrics.log_sampled = random.random() < self.rate
+        if not request_metrics.log_sampled and len(request_metrics.held_logs) < MAX_HELD_RECORDS:
+            request_metrics.held_logs.append(record)
+        return request_metrics.log_sampled
+
+
+def release_held_records(request_metrics):
+    """Log the query records SQLSampleFilter held back for this request."""
+    for record in request_metrics.held_logs:
+        record._keep = True
+        logging.getLogger(record.name).handle(record)
+    request_metrics.held_logs = []
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from employees import archive, partitions
+
+
+class Command(BaseCommand):
+    help = 'Move attendance months older than the retention window into compressed NDJSON archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', type=int, default=settings.ATTENDANCE_RETENTION_MONTHS,
+                            help='Full months to keep in the database before the current one')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per DELETE when a month cannot be dropped as a whole partition')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be archived')
+
+    def handle(self, *args, **options):
+        current = partitions.month_start(timezone.now().date())
+        cutoff = partitions.add_months(current, -options['retention_months'])
+        months = archive.months_before(cutoff)
+        if not months:
+            self.stdout.write(f'Nothing to archive before {cutoff}')
+            return
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f'  would archive {month:%Y-%m}')
+                continue
+            count = archive.archive_month(month, options['batch_size'])
+            self.stdout.write(f'  {month:%Y-%m}: {count} rows -> {archive.archive_path(month)}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Archived {len(months)} month(s) before {cutoff}'))
@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.dummy import DummyCache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+
+ENDPOINTS = {
+    'dashboard': ('/api/dashboard/', '/api/async/dashboard/'),
+    'department-analytics': ('/api/departments/analytics/', '/api/async/departments/analytics/'),
+    'attendance-analytics': ('/api/attendance/analytics/', '/api/async/attendance/analytics/'),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 latency of the sync (WSGI) and async (ASGI) dashboard endpoints under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+        parser.add_argument('--endpoint', choices=list(ENDPOINTS), action='append',
+                            help='Endpoint to benchmark (repeatable); defaults to all')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='benchmark')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        # Measure the handlers themselves: no throttling, no response cache.
+        with override_settings(ALLOWED_HOSTS=['testserver']), \
+                mock.patch('employees.throttling.SharedRateThrottle.allow_request', return_value=True), \
+                mock.patch('employees.cache.get_cache', return_value=DummyCache('benchmark', {})):
+            for name in options['endpoint'] or list(ENDPOINTS):
+                sync_path, async_path = ENDPOINTS[name]
+                self.report(name, 'WSGI', self.run_sync(sync_path, total, concurrency))
+                self.report(name, 'ASGI', asyncio.run(self.run_async(async_path, total, concurrency)))
+
+    def run_sync(self, path, total, concurrency):
+        def request(_):
+            client = Client()
+            started = time.perf_counter()
+            response = client.get(path, headers=self.headers)
+            elapsed = time.perf_counter() - started
+            return elapsed, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(request, range(total)))
+        return results, time.perf_counter() - started
+
+    async def run_async(self, path, total, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, headers=self.headers)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(total)))
+        return results, time.perf_counter() - started
+
+    def report(self, name, mode, outcome):
+        results, wall = outcome
+        latencies = [elapsed * 1000 for elapsed, _ in results]
+        errors = sum(1 for _, code in results if code != 200)
+        self.stdout.write(
+            f'{name:<22} {mode}  p50 {percentile(latencies, 50):8.2f} ms  '
+            f'p99 {percentile(latencies, 99):8.2f} ms  mean {statistics.mean(latencies):8.2f} ms  '
+            f'{len(results) / wall:8.1f} req/s  errors {errors}'
+        )
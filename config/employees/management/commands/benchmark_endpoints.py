@@ -0,0 +1,288 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from employees.management.commands.benchmark_async import percentile
+from employees.models import Attendance, Department, Employee, PerformanceReview
+
+# Dataset presets for --scale; --populate tops the database up to them with generate_sample_data.
+SCALES = {
+    '10k': {'employees': 10000, 'days': 90, 'departments': 10},
+    '100k': {'employees': 100000, 'days': 30, 'departments': 50},
+    '1m': {'employees': 1000000, 'days': 7, 'departments': 100},
+}
+
+# Every GET route in employees/urls.py, by URL name: (URL kwargs, query string).
+# Values in braces are filled from sample rows of the benchmarked database.
+ENDPOINTS = {
+    'api-root': ({}, ''),
+    'department-list': ({}, ''),
+    'department-detail': ({'pk': '{department}'}, ''),
+    'employee-list': ({}, ''),
+    'employee-detail': ({'pk': '{employee}'}, ''),
+    'employee-chain': ({'pk': '{employee}'}, ''),
+    'employee-subtree': ({'pk': '{manager}'}, ''),
+    'employee-rollup': ({'pk': '{manager}'}, ''),
+    'attendance-list': ({}, ''),
+    'attendance-detail': ({'pk': '{attendance}'}, ''),
+    'attendance-archive': ({}, ''),
+    'performancereview-list': ({}, ''),
+    'performancereview-detail': ({'pk': '{review}'}, ''),
+    'performancereview-search': ({}, 'q=performance+management'),
+    'department-analytics': ({}, ''),
+    'attendance-analytics': ({}, ''),
+    'employee-dashboard': ({}, ''),
+    'dashboard-snapshot': ({}, ''),
+    'async-department-analytics': ({}, ''),
+    'async-attendance-analytics': ({}, ''),
+    'async-employee-dashboard': ({}, ''),
+    'payroll': ({}, ''),
+    'payroll-employees': ({}, ''),
+    'dashboard-view': ({}, ''),
+    'metrics': ({}, ''),
+    'export-data': ({'resource': 'attendance', 'file_format': 'csv'}, 'date={date}'),
+}
+# Routes that only accept writes and are left out of the benchmark.
+WRITE_ONLY = ('attendance-bulk-upsert', 'api_token_auth')
+# Routes that stream until the client leaves, which a latency benchmark can't measure.
+STREAMING = ('attendance-live',)
+
+# Metrics compared against a baseline; a higher value is a regression. Measured
+# metrics must also grow by more than their noise floor to count.
+MEASURED_METRICS = {'p95_ms': 2.0, 'peak_memory_kb': 256.0}
+COUNTED_METRICS = ('queries',)
+
+
+def sample_rows():
+    """Primary keys and values used to fill in the endpoint paths."""
+    manager = (
+        Employee.objects.filter(manager__isnull=False).order_by()
+        .values('manager').annotate(reports=Count('id')).order_by('-reports').first()
+    )
+    samples = {
+        'department': Department.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'employee': Employee.objects.filter(manager__isnull=False).order_by('-pk').values_list('pk', flat=True).first(),
+        'manager': manager and manager['manager'],
+        'attendance': Attendance.objects.order_by('-date').values_list('pk', flat=True).first(),
+        'date': Attendance.objects.order_by('-date').values_list('date', flat=True).first(),
+        'review': PerformanceReview.objects.order_by('pk').values_list('pk', flat=True).first(),
+    }
+    missing = [name for name, value in samples.items() if value is None]
+    if missing:
+        raise CommandError(
+            f"No {', '.join(missing)} rows to benchmark against; seed the database with --populate "
+            f"or generate_sample_data."
+        )
+    return samples
+
+
+def endpoint_path(name, samples):
+    kwargs, query = ENDPOINTS[name]
+    path = reverse(name, kwargs={key: value.format(**samples) for key, value in kwargs.items()})
+    return f'{path}?{query.format(**samples)}' if query else path
+
+
+def regressions(results, baseline, tolerance):
+    """Describe each endpoint metric that got worse than the baseline allows."""
+    found = []
+    for name, current in results['endpoints'].items():
+        if current['status'] >= 400 or current['errors']:
+            found.append(f"{name}: status {current['status']}, {current['errors']} failed requests")
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+        for metric in COUNTED_METRICS:
+            if current[metric] > previous[metric]:
+                found.append(f'{name}: {metric} {previous[metric]} -> {current[metric]}')
+        for metric, floor in MEASURED_METRICS.items():
+            if current[metric] > max(previous[metric] * (1 + tolerance), previous[metric] + floor):
+                found.append(f'{name}: {metric} {previous[metric]:.2f} -> {current[metric]:.2f}')
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency percentiles, throughput, SQL queries and peak memory of every API endpoint, '
+        'optionally seeding a dataset preset and comparing against a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), help='Dataset preset the results are recorded under')
+        parser.add_argument('--populate', action='store_true',
+                            help='Top the database up to the --scale preset with generate_sample_data first')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint before timing')
+        parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at once')
+        parser.add_argument('--endpoint', choices=list(ENDPOINTS), action='append',
+                            help='Endpoint to benchmark (repeatable); defaults to all')
+        parser.add_argument('--cache', action='store_true', help='Leave the response cache enabled')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against results saved with --output; fails on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed fractional increase of p95 latency and peak memory over the baseline')
+
+    def handle(self, *args, **options):
+        if options['populate']:
+            if not options['scale']:
+                raise CommandError('--populate needs --scale.')
+            self.populate(SCALES[options['scale']])
+        baseline = self.load_baseline(options['baseline'])
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        samples = sample_rows()
+        results = {
+            'scale': options['scale'],
+            'vendor': connection.vendor,
+            'python': platform.python_version(),
+            'created': timezone.now().isoformat(),
+            'rows': {
+                'departments': Department.objects.count(),
+                'employees': Employee.objects.count(),
+                'attendance': Attendance.objects.count(),
+                'performance_reviews': PerformanceReview.objects.count(),
+            },
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'cache': options['cache'],
+            'endpoints': {},
+        }
+        self.stdout.write(
+            f"{connection.vendor}, {results['rows']['employees']} employees, "
+            f"{results['rows']['attendance']} attendance records"
+        )
+        self.stdout.write(
+            f"{'endpoint':<28}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9} ms{'req/s':>9}{'queries':>9}"
+            f"{'peak KiB':>10}{'errors':>8}"
+        )
+
+        # Measure the handlers themselves: no throttling and, unless --cache, no response cache.
+        cache_settings = {} if options['cache'] else {
+            'CACHES': dict(settings.CACHES, benchmark={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}),
+            'RESPONSE_CACHE_ALIAS': 'benchmark',
+        }
+        with override_settings(ALLOWED_HOSTS=['testserver'], **cache_settings), \
+                mock.patch('employees.throttling.SharedRateThrottle.allow_request', return_value=True):
+            for name in options['endpoint'] or list(ENDPOINTS):
+                result = self.measure(endpoint_path(name, samples), options)
+                results['endpoints'][name] = result
+                self.report(name, result)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Wrote results to {options['output']}")
+        if baseline is not None:
+            self.compare(results, baseline, options['tolerance'])
+
+    def populate(self, preset):
+        missing = preset['employees'] - Employee.objects.count()
+        if missing <= 0:
+            self.stdout.write(f"Database already has at least {preset['employees']} employees")
+            return
+        call_command(
+            'generate_sample_data', employees=missing, days=preset['days'],
+            departments=preset['departments'], seed=42, stdout=self.stdout
+        )
+
+    def load_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as baseline:
+                return json.load(baseline)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+
+    def request(self, client, path):
+        started = time.perf_counter()
+        response = client.get(path, headers=self.headers)
+        if response.streaming:
+            # Exports stream their body; the request isn't done until it's all produced.
+            for _ in response.streaming_content:
+                pass
+        return time.perf_counter() - started, response.status_code
+
+    def measure(self, path, options):
+        client = Client()
+        for _ in range(options['warmup']):
+            self.request(client, path)
+
+        # Queries and memory come from one extra request, as tracing skews the
+        # timings. Queries are counted at the cursor so that those run on the
+        # async views' worker threads and connections are included.
+        queries = []
+        execute = CursorWrapper._execute_with_wrappers
+
+        def counted(cursor, *args, **kwargs):
+            queries.append(None)
+            return execute(cursor, *args, **kwargs)
+
+        tracemalloc.start()
+        try:
+            with mock.patch.object(CursorWrapper, '_execute_with_wrappers', counted):
+                _, status_code = self.request(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        total, concurrency = options['requests'], options['concurrency']
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                timings = list(pool.map(lambda _: self.request(Client(), path), range(total)))
+        else:
+            timings = [self.request(client, path) for _ in range(total)]
+        wall = time.perf_counter() - started
+
+        latencies = [elapsed * 1000 for elapsed, _ in timings] or [0.0]
+        return {
+            'path': path,
+            'status': status_code,
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': statistics.mean(latencies),
+            'throughput': len(timings) / wall if wall else 0.0,
+            'queries': len(queries),
+            'peak_memory_kb': peak / 1024,
+            'errors': sum(1 for _, code in timings if code >= 400),
+        }
+
+    def report(self, name, result):
+        line = (
+            f"{name:<28}{result['p50_ms']:9.2f}{result['p90_ms']:9.2f}{result['p95_ms']:9.2f}"
+            f"{result['p99_ms']:9.2f}   {result['throughput']:9.1f}{result['queries']:9d}"
+            f"{result['peak_memory_kb']:10.0f}{result['errors']:8d}"
+        )
+        failed = result['status'] >= 400 or result['errors']
+        self.stdout.write(self.style.ERROR(line) if failed else line)
+
+    def compare(self, results, baseline, tolerance):
+        for key in ('scale', 'vendor', 'concurrency'):
+            if baseline.get(key) != results[key]:
+                self.stdout.write(self.style.WARNING(
+                    f'Baseline {key} {baseline.get(key)!r} differs from this run ({results[key]!r})'
+                ))
+        found = regressions(results, baseline, tolerance)
+        if found:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(found))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against the baseline ({tolerance:.0%} tolerance)"))
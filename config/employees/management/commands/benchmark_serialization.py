@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from employees.fastpath import FastJSONRenderer, compile_fields, render_rows
+from employees.views import AttendanceViewSet, DepartmentViewSet, EmployeeViewSet, PerformanceReviewViewSet
+
+VIEWSETS = {
+    'departments': DepartmentViewSet,
+    'employees': EmployeeViewSet,
+    'attendance': AttendanceViewSet,
+    'performance-reviews': PerformanceReviewViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of the serializer and fast list serialization paths (query + serialize + render)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the best one is reported')
+        parser.add_argument('--resource', choices=list(VIEWSETS), action='append',
+                            help='Resource to benchmark (repeatable); defaults to all')
+
+    def handle(self, *args, **options):
+        for name in options['resource'] or list(VIEWSETS):
+            view = VIEWSETS[name]()
+            view.action = 'list'
+            view.format_kwarg = None
+            view.request = Request(APIRequestFactory().get('/'))
+            serializer_class = view.get_serializer_class()
+            queryset = view.get_queryset()[:options['rows']]
+            columns, getters = compile_fields(serializer_class, tuple(serializer_class().fields))
+
+            def serializer_path():
+                return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+            def fast_path():
+                return FastJSONRenderer().render(render_rows(queryset.values(*columns), getters))
+
+            (slow, slow_body), (fast, fast_body) = self.best(serializer_path, options), self.best(fast_path, options)
+            if slow_body != fast_body:
+                raise CommandError(f'{name}: fast path output differs from the serializers')
+            rows = queryset.count()
+            self.stdout.write(
+                f'{name:<20} {rows} rows  serializer {rows / slow:10.0f} rows/s  '
+                f'fast {rows / fast:10.0f} rows/s  speedup {slow / fast:5.1f}x'
+            )
+
+    def best(self, run, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            body = run()
+            timings.append(time.perf_counter() - started)
+        return min(timings), body
@@ -0,0 +1,44 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees import payroll
+from employees.serializers import PayrollEmployeeSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compute monthly payroll per employee and per department'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Payroll month as YYYY-MM; defaults to the last complete month')
+        parser.add_argument('--department', help='Only include departments matching this name')
+        parser.add_argument('--output', help='Write per-employee rows to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            month = payroll.parse_month(options['month'])
+        except ValueError as e:
+            raise CommandError(e)
+        started = time.perf_counter()
+        result = payroll.compute(month)
+        elapsed = time.perf_counter() - started
+        mask = payroll.department_mask(result, options)
+
+        columns = ['headcount', 'days'] + list(payroll.TOTAL_COLUMNS[1:])
+        self.stdout.write(f"{'department':<20}" + ''.join(f'{column:>16}' for column in columns))
+        for row in payroll.department_rows(result, mask) + [dict(payroll.totals(result, mask), department='TOTAL')]:
+            self.stdout.write(f"{row['department']:<20}" + ''.join(f'{row[column]:>16}' for column in columns))
+
+        if options['output']:
+            rows = payroll.EmployeeRows(result, mask)
+            fields = list(PayrollEmployeeSerializer().fields)
+            with open(options['output'], 'w', newline='') as output:
+                writer = csv.DictWriter(output, fieldnames=fields)
+                writer.writeheader()
+                for start in range(0, len(rows), 5000):
+                    writer.writerows(rows[start:start + 5000])
+            self.stdout.write(f'Wrote {len(rows)} employees to {options["output"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Payroll for {month:%Y-%m}: {len(result["id"])} employees computed in {elapsed:.2f}s'
+        ))
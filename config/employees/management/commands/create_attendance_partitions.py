@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from employees import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly attendance partitions (PostgreSQL); run it monthly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Months after the current one to create')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stdout.write('The attendance table is not partitioned on this database; nothing to do')
+            return
+        current = partitions.month_start(timezone.now().date())
+        created = partitions.ensure_partitions(current, partitions.add_months(current, options['months_ahead']))
+        for name in created:
+            self.stdout.write(f'  created {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partition(s) created'))
@@ -1,35 +1,230 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import connection, connections
+from employees import partitions, rollups
+from employees.cache import bump_data_version
+from employees.search import bump_search_version
 from employees.models import Department, Employee, Attendance, PerformanceReview
 from faker import Faker
+from multiprocessing import Pool
+import csv
+import io
+import os
 import random
 from datetime import datetime, timedelta
 from decimal import Decimal
 
 fake = Faker()
 
+DEPARTMENTS = [
+    {'name': 'Engineering', 'location': 'Floor 3', 'budget': 500000},
+    {'name': 'Marketing', 'location': 'Floor 2', 'budget': 300000},
+    {'name': 'Sales', 'location': 'Floor 1', 'budget': 400000},
+    {'name': 'HR', 'location': 'Floor 2', 'budget': 200000},
+    {'name': 'Finance', 'location': 'Floor 4', 'budget': 350000},
+    {'name': 'Operations', 'location': 'Floor 1', 'budget': 450000},
+    {'name': 'Legal', 'location': 'Floor 5', 'budget': 250000},
+    {'name': 'Customer Support', 'location': 'Floor 1', 'budget': 300000},
+    {'name': 'Research', 'location': 'Floor 6', 'budget': 600000},
+    {'name': 'Product', 'location': 'Floor 3', 'budget': 400000},
+]
+
+JOB_TITLES = {
+    'Engineering': ['Software Engineer', 'Senior Developer', 'Tech Lead', 'QA Engineer'],
+    'Marketing': ['Marketing Specialist', 'Content Writer', 'SEO Analyst', 'Social Media Manager'],
+    'Sales': ['Sales Representative', 'Account Manager', 'Sales Director', 'Business Development'],
+    'HR': ['HR Manager', 'Recruiter', 'Training Specialist', 'Compensation Analyst'],
+    'Finance': ['Accountant', 'Financial Analyst', 'Finance Manager', 'Auditor'],
+    'Operations': ['Operations Analyst', 'Operations Manager', 'Logistics Coordinator', 'Facilities Lead'],
+    'Legal': ['Legal Counsel', 'Paralegal', 'Compliance Officer', 'Contracts Manager'],
+    'Customer Support': ['Support Agent', 'Support Engineer', 'Support Lead', 'Customer Success Manager'],
+    'Research': ['Research Scientist', 'Data Scientist', 'Research Engineer', 'Lab Manager'],
+    'Product': ['Product Manager', 'Product Designer', 'Product Analyst', 'UX Researcher'],
+}
+DEFAULT_JOB_TITLES = ['Associate', 'Specialist', 'Analyst', 'Manager']
+
+EMPLOYMENT_TYPES = ['FT', 'PT', 'CT', 'IN']
+STATUS_CHOICES = ['PR', 'AB', 'LV', 'HD', 'LT']
+STATUS_WEIGHTS = [70, 5, 10, 5, 10]
+
+ATTENDANCE_COLUMNS = [
+    'employee_id', 'date', 'check_in', 'check_out', 'hours_worked',
+    'status', 'notes', 'overtime_hours', 'leave_type',
+]
+REVIEW_COLUMNS = [
+    'employee_id', 'review_date', 'reviewer', 'rating', 'comments',
+    'goals', 'strengths', 'areas_for_improvement', 'next_review_date',
+]
+
+
+def _seeded(seed, stream, chunk):
+    # Each chunk gets its own generators so output does not depend on how
+    # chunks are scheduled across worker processes.
+    chunk_seed = None if seed is None else seed * 1000003 + stream * 7919 + chunk
+    rng = random.Random(chunk_seed)
+    chunk_fake = Faker()
+    if chunk_seed is not None:
+        chunk_fake.seed_instance(chunk_seed)
+    return rng, chunk_fake
+
+
+def generate_employee_chunk(args):
+    seed, chunk, start, count, departments, email_prefix = args
+    rng, chunk_fake = _seeded(seed, 1, chunk)
+    rows = []
+    for i in range(start, start + count):
+        dept_id, dept_name = rng.choice(departments)
+        first_name = chunk_fake.first_name()
+        last_name = chunk_fake.last_name()
+        rows.append({
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f"{first_name}.{last_name}.{email_prefix}{i}@example.com".lower(),
+            'phone': chunk_fake.phone_number()[:15],
+            'hire_date': chunk_fake.date_between(start_date='-3y', end_date='today'),
+            'job_title': rng.choice(JOB_TITLES.get(dept_name, DEFAULT_JOB_TITLES)),
+            'salary': Decimal(rng.randrange(40000, 120000, 5000)),
+            'department_id': dept_id,
+            'employment_type': rng.choice(EMPLOYMENT_TYPES),
+            'date_of_birth': chunk_fake.date_of_birth(minimum_age=22, maximum_age=65),
+            'address': chunk_fake.address(),
+        })
+    return rows
+
+
+def generate_attendance_chunk(args):
+    seed, chunk, employee_ids, days, today = args
+    rng, chunk_fake = _seeded(seed, 2, chunk)
+    rows = []
+    for emp_id in employee_ids:
+        for day in range(days):
+            date = today - timedelta(days=day)
+
+            # Skip weekends occasionally
+            if date.weekday() >= 5 and rng.random() > 0.2:
+                continue
+
+            status = rng.choices(STATUS_CHOICES, weights=STATUS_WEIGHTS)[0]
+
+            check_in = None
+            check_out = None
+            hours_worked = None
+
+            if status == 'PR':  # Present
+                check_in = chunk_fake.time_object()
+                check_out = (datetime.combine(date, check_in) + timedelta(hours=8)).time()
+                hours_worked = Decimal('8.00')
+            elif status == 'LT':  # Late
+                check_in = (datetime.combine(date, datetime.min.time()) + timedelta(hours=10)).time()
+                check_out = (datetime.combine(date, check_in) + timedelta(hours=7)).time()
+                hours_worked = Decimal('7.00')
+            elif status == 'HD':  # Half day
+                check_in = chunk_fake.time_object()
+                check_out = (datetime.combine(date, check_in) + timedelta(hours=4)).time()
+                hours_worked = Decimal('4.00')
+
+            rows.append((
+                emp_id,
+                date,
+                check_in,
+                check_out,
+                hours_worked,
+                status,
+                chunk_fake.sentence() if status in ['AB', 'LV'] else '',
+                Decimal(rng.randrange(0, 5)) if status == 'PR' and rng.random() > 0.7 else Decimal(0),
+                '',
+            ))
+    return rows
+
+
+def generate_review_chunk(args):
+    seed, chunk, employees, reviewers, today = args
+    rng, chunk_fake = _seeded(seed, 3, chunk)
+    rows = []
+    for emp_id, hire_date in employees:
+        for i in range(2):  # 2 reviews per employee
+            review_date = chunk_fake.date_between(start_date=hire_date, end_date=today)
+            rows.append((
+                emp_id,
+                review_date,
+                rng.choice(reviewers),
+                rng.randint(3, 5),
+                chunk_fake.paragraph(),
+                chunk_fake.paragraph(),
+                chunk_fake.paragraph(),
+                chunk_fake.paragraph(),
+                review_date + timedelta(days=180),
+            ))
+    return rows
+
+
 class Command(BaseCommand):
     help = 'Generate sample employee data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=20, help='Number of employees to create')
+        parser.add_argument('--days', type=int, default=30, help='Days of attendance history per employee')
+        parser.add_argument('--departments', type=int, default=5, help='Number of departments to use')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible output')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes used for Faker generation')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Use bulk_create even on PostgreSQL instead of COPY')
+
     def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        seed = options['seed']
+        workers = max(1, options['workers'])
+        today = datetime.now().date()
+
+        if seed is not None:
+            random.seed(seed)
+            fake.seed_instance(seed)
+
         self.stdout.write('Generating sample data...')
-        
+
         # Create superuser if not exists
         if not User.objects.filter(username='admin').exists():
             User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
             self.stdout.write('Created superuser: admin/admin123')
-        
-        # Create departments
-        departments_data = [
-            {'name': 'Engineering', 'location': 'Floor 3', 'budget': 500000},
-            {'name': 'Marketing', 'location': 'Floor 2', 'budget': 300000},
-            {'name': 'Sales', 'location': 'Floor 1', 'budget': 400000},
-            {'name': 'HR', 'location': 'Floor 2', 'budget': 200000},
-            {'name': 'Finance', 'location': 'Floor 4', 'budget': 350000},
-        ]
-        
+
+        departments = self.create_departments(options['departments'])
+
+        # Workers only generate rows; all database writes stay in this process.
+        connections.close_all()
+        pool = Pool(workers) if workers > 1 else None
+        imap = pool.imap if pool else map
+        try:
+            employees = self.create_employees(imap, seed, options['employees'], departments)
+            self.create_attendance(imap, seed, employees, options['days'], today)
+            self.create_reviews(imap, seed, employees, today)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        bump_data_version()
+        bump_search_version()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully generated sample data: '
+                f'{Department.objects.count()} departments, '
+                f'{Employee.objects.count()} employees, '
+                f'{Attendance.objects.count()} attendance records, '
+                f'{PerformanceReview.objects.count()} performance reviews'
+            )
+        )
+
+    def create_departments(self, count):
         departments = []
-        for dept_data in departments_data:
+        for i in range(count):
+            if i < len(DEPARTMENTS):
+                dept_data = DEPARTMENTS[i]
+            else:
+                dept_data = {'name': f'Department {i + 1}', 'location': f'Floor {i % 10 + 1}', 'budget': 300000}
             dept, created = Department.objects.get_or_create(
                 name=dept_data['name'],
                 defaults={
@@ -38,115 +233,110 @@ class Command(BaseCommand):
                     'budget': dept_data['budget'],
                     'established_date': fake.date_between(start_date='-5y', end_date='-1y'),
                     'head_of_department': fake.name(),
-                    'email': f"{dept_data['name'].lower()}@company.com"
+                    'email': f"{dept_data['name'].lower().replace(' ', '')}@company.com"
                 }
             )
             departments.append(dept)
-        
-        # Create employees
-        employment_types = ['FT', 'PT', 'CT', 'IN']
-        job_titles = {
-            'Engineering': ['Software Engineer', 'Senior Developer', 'Tech Lead', 'QA Engineer'],
-            'Marketing': ['Marketing Specialist', 'Content Writer', 'SEO Analyst', 'Social Media Manager'],
-            'Sales': ['Sales Representative', 'Account Manager', 'Sales Director', 'Business Development'],
-            'HR': ['HR Manager', 'Recruiter', 'Training Specialist', 'Compensation Analyst'],
-            'Finance': ['Accountant', 'Financial Analyst', 'Finance Manager', 'Auditor']
-        }
-        
+        return departments
+
+    def create_employees(self, imap, seed, count, departments):
+        # The email prefix keeps repeated runs from colliding on Employee.email.
+        email_prefix = Employee.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        email_prefix = f"r{email_prefix}-" if email_prefix else ''
+        department_refs = [(d.id, d.name) for d in departments]
+        chunks = [
+            (seed, n, start, min(self.batch_size, count - start), department_refs, email_prefix)
+            for n, start in enumerate(range(0, count, self.batch_size))
+        ]
+
+        # The first employees become managers for everyone after them, so
+        # they are inserted first and their primary keys reused directly
+        # instead of saving every employee a second time.
+        manager_count = min(count, max(5, count // 10))
+        managers = []
         employees = []
-        for i in range(20):  # Create 20 employees
-            dept = random.choice(departments)
-            job_title = random.choice(job_titles[dept.name])
-            
-            emp = Employee.objects.create(
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                email=fake.email(),
-                phone=fake.phone_number()[:15],
-                hire_date=fake.date_between(start_date='-3y', end_date='today'),
-                job_title=job_title,
-                salary=Decimal(random.randrange(40000, 120000, 5000)),
-                department=dept,
-                employment_type=random.choice(employment_types),
-                date_of_birth=fake.date_of_birth(minimum_age=22, maximum_age=65),
-                address=fake.address()
+        rng = random.Random(seed)
+        for rows in imap(generate_employee_chunk, chunks):
+            batch = [Employee(**row) for row in rows]
+            if len(managers) < manager_count:
+                taken = manager_count - len(managers)
+                managers.extend(self.insert_employees(batch[:taken]))
+                employees.extend(batch[:taken])
+                batch = batch[taken:]
+            for emp in batch:
+                emp.manager_id = rng.choice(managers).pk
+            employees.extend(self.insert_employees(batch))
+            self.stdout.write(f'  employees: {len(employees)}/{count}')
+
+        self.managers = managers
+        return employees
+
+    def insert_employees(self, batch):
+        if not batch:
+            return batch
+        Employee.objects.bulk_create(batch, batch_size=self.batch_size)
+        if any(emp.pk is None for emp in batch):
+            # Backends without RETURNING support: reload keys by unique email.
+            ids = dict(Employee.objects.filter(
+                email__in=[emp.email for emp in batch]
+            ).values_list('email', 'id'))
+            for emp in batch:
+                emp.pk = ids[emp.email]
+        return batch
+
+    def create_attendance(self, imap, seed, employees, days, today):
+        per_chunk = max(1, self.batch_size // max(1, days))
+        employee_ids = [emp.pk for emp in employees]
+        chunks = [
+            (seed, n, employee_ids[start:start + per_chunk], days, today)
+            for n, start in enumerate(range(0, len(employee_ids), per_chunk))
+        ]
+        partitions.ensure_partitions(today - timedelta(days=days - 1), today)
+        total = 0
+        for rows in imap(generate_attendance_chunk, chunks):
+            self.write_rows(Attendance, ATTENDANCE_COLUMNS, rows)
+            total += len(rows)
+            self.stdout.write(f'  attendance records: {total}')
+        if self.use_copy:
+            # COPY bypasses the Attendance manager, so the summary is rebuilt once at the end.
+            rollups.rebuild(today - timedelta(days=days - 1), today)
+
+    def create_reviews(self, imap, seed, employees, today):
+        reviewers = [emp.get_full_name() for emp in self.managers] or ['HR']
+        per_chunk = max(1, self.batch_size // 2)
+        refs = [(emp.pk, emp.hire_date) for emp in employees]
+        chunks = [
+            (seed, n, refs[start:start + per_chunk], reviewers, today)
+            for n, start in enumerate(range(0, len(refs), per_chunk))
+        ]
+        total = 0
+        for rows in imap(generate_review_chunk, chunks):
+            self.write_rows(PerformanceReview, REVIEW_COLUMNS, rows)
+            total += len(rows)
+            self.stdout.write(f'  performance reviews: {total}')
+
+    def write_rows(self, model, columns, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            self.copy_rows(model, columns, rows)
+        else:
+            model.objects.bulk_create(
+                [model(**dict(zip(columns, row))) for row in rows],
+                batch_size=self.batch_size
             )
-            employees.append(emp)
-        
-        # Set managers for some employees
-        for emp in employees[5:]:  # Skip first 5 to be managers
-            emp.manager = random.choice(employees[:5])
-            emp.save()
-        
-        # Create attendance records
-        status_choices = ['PR', 'AB', 'LV', 'HD', 'LT']
-        for emp in employees:
-            for day in range(30):  # Last 30 days
-                date = datetime.now().date() - timedelta(days=day)
-                
-                # Skip weekends occasionally
-                if date.weekday() >= 5 and random.random() > 0.2:
-                    continue
-                
-                status = random.choices(
-                    status_choices,
-                    weights=[70, 5, 10, 5, 10]  # Weighted probabilities
-                )[0]
-                
-                check_in = None
-                check_out = None
-                hours_worked = None
-                
-                if status == 'PR':  # Present
-                    check_in = fake.time_object()
-                    check_out = (datetime.combine(date, check_in) + timedelta(hours=8)).time()
-                    hours_worked = 8.0
-                elif status == 'LT':  # Late
-                    check_in = (datetime.combine(date, datetime.min.time()) + timedelta(hours=10)).time()
-                    check_out = (datetime.combine(date, check_in) + timedelta(hours=7)).time()
-                    hours_worked = 7.0
-                elif status == 'HD':  # Half day
-                    check_in = fake.time_object()
-                    check_out = (datetime.combine(date, check_in) + timedelta(hours=4)).time()
-                    hours_worked = 4.0
-                
-                Attendance.objects.create(
-                    employee=emp,
-                    date=date,
-                    check_in=check_in,
-                    check_out=check_out,
-                    hours_worked=hours_worked,
-                    status=status,
-                    notes=fake.sentence() if status in ['AB', 'LV'] else '',
-                    overtime_hours=Decimal(random.randrange(0, 5)) if status == 'PR' and random.random() > 0.7 else 0
-                )
-        
-        # Create performance reviews
-        for emp in employees:
-            for i in range(2):  # 2 reviews per employee
-                review_date = fake.date_between(
-                    start_date=emp.hire_date,
-                    end_date='today'
-                )
-                
-                PerformanceReview.objects.create(
-                    employee=emp,
-                    review_date=review_date,
-                    reviewer=random.choice(employees[:5]).get_full_name(),
-                    rating=random.randint(3, 5),
-                    comments=fake.paragraph(),
-                    goals=fake.paragraph(),
-                    strengths=fake.paragraph(),
-                    areas_for_improvement=fake.paragraph(),
-                    next_review_date=review_date + timedelta(days=180)
-                )
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully generated sample data: '
-                f'{Department.objects.count()} departments, '
-                f'{Employee.objects.count()} employees, '
-                f'{Attendance.objects.count()} attendance records, '
-                f'{PerformanceReview.objects.count()} performance reviews'
+
+    def copy_rows(self, model, columns, rows):
+        # COPY skips per-row statement overhead entirely. NULLs get an explicit
+        # marker so they stay distinct from empty strings such as blank notes.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([r'\N' if value is None else value for value in row])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} "
+                f"({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
             )
-        )
\ No newline at end of file
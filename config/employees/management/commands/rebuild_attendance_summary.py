@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from employees import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or backfill the daily attendance summary from raw attendance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date to rebuild (YYYY-MM-DD); defaults to the earliest record')
+        parser.add_argument('--end', help='Last date to rebuild (YYYY-MM-DD); defaults to the latest record')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Summary rows per bulk insert')
+
+    def handle(self, *args, **options):
+        start = self.parse(options['start'], 'start')
+        end = self.parse(options['end'], 'end')
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        rows = rollups.rebuild(start, end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} attendance summary rows'))
+
+    def parse(self, value, name):
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+        return parsed
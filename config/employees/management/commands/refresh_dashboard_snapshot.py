@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Precompute the dashboard snapshot, once or whenever it goes out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float,
+                            help='Keep running and check every this many seconds whether a new snapshot is due')
+        parser.add_argument('--force', action='store_true', help='Build even when the stored snapshot is current')
+
+    def handle(self, *args, **options):
+        every = options['every']
+        if every is not None and every <= 0:
+            raise CommandError('--every must be positive')
+        if not snapshot.cache_is_shared():
+            raise CommandError(
+                'The response cache is local to this process, so the web workers would never see the snapshot; '
+                'set CACHE_URL to a shared cache (e.g. redis://redis:6379/1)'
+            )
+        force = options['force']
+        while True:
+            if force or snapshot.needs_build(snapshot.stored_snapshot()):
+                self.build()
+            elif every is None:
+                self.stdout.write('Dashboard snapshot is current')
+            if every is None:
+                return
+            force = False
+            time.sleep(every)
+
+    def build(self):
+        started = time.perf_counter()
+        built = snapshot.build()
+        self.stdout.write(self.style.SUCCESS(
+            f'Built dashboard snapshot in {(time.perf_counter() - started) * 1000:.0f} ms: '
+            f'{len(built.body)} bytes, {len(built.gzipped)} gzipped'
+        ))
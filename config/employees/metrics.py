@@ -0,0 +1,319 @@
+"""
+Per-request instrumentation and its Prometheus exposition.
+
+While a request is served, RequestMetrics is held in a context variable, so
+it follows the request into sync_to_async threads and the async views'
+worker threads. Every database connection gets a permanent execute wrapper
+that counts and times each query when a request is being measured, and does
+nothing otherwise; the SQL text is kept for the first SLOW_REQUEST_MAX_QUERIES
+queries only, those the slow request log shows. Code that turns data into
+response dicts marks itself with timed('serialize'): every serializer of the
+API does, through the base classes in employees.serializers, and so does the
+list fast path. Database time spent inside such a section counts as database
+time only, so the parts of a request add up.
+
+Aggregates are kept in memory per process, and each process writes its
+totals to THROTTLE_STORE at most every METRICS_PUBLISH_SECONDS. Whichever
+worker serves /api/metrics/ sums the totals of every process that has
+written some, so the series stay monotonic however scrapes are balanced.
+Totals of processes that have exited stay in the store, as counters must
+not go back when a worker is replaced.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .throttling import get_store
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('employees_request_metrics', default=None)
+_section = ContextVar('employees_metrics_section', default=None)
+
+
+class Section:
+    __slots__ = ('name', 'db_time')
+
+    def __init__(self, name):
+        self.name = name
+        self.db_time = 0.0
+
+
+class RequestMetrics:
+    """What one request spent, in seconds, and the queries it ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # The async views' worker threads record into the same instance.
+        self.lock = threading.Lock()
+        self.query_count = 0
+        self.db_time = 0.0
+        # (sql, seconds) of the first max_queries queries.
+        self.queries = []
+        self.max_queries = settings.SLOW_REQUEST_MAX_QUERIES
+        # Seconds per section name.
+        self.sections = {}
+        # Query log sampling state, see employees.log.SQLSampleFilter.
+        self.log_sampled = None
+        self.held_logs = []
+
+    def add_query(self, sql, duration):
+        with self.lock:
+            self.query_count += 1
+            self.db_time += duration
+            if len(self.queries) < self.max_queries:
+                self.queries.append((sql, duration))
+
+    def add_section(self, name, duration):
+        with self.lock:
+            self.sections[name] = self.sections.get(name, 0.0) + duration
+
+    def section_time(self, name):
+        return self.sections.get(name, 0.0)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        metrics.add_query(sql, duration)
+        section = _section.get()
+        if section is not None:
+            section.db_time += duration
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver installing record_query on every connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(name):
+    """Add the block's duration, less its database time, to the current request's `name` time."""
+    metrics = current.get()
+    if metrics is None or _section.get() is not None:
+        # Not measuring, or already inside a section (nested serializers).
+        yield
+        return
+    section = Section(name)
+    token = _section.set(section)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _section.reset(token)
+        metrics.add_section(name, time.perf_counter() - started - section.db_time)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labels):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), value] for labels, value in self.series.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, series=None):
+        """Render the given {labels: value} series, this process's own by default."""
+        if series is None:
+            with self.lock:
+                series = dict(self.series)
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{format_labels(self.labels, labels)} {value}'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum.
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), list(values)] for labels, values in self.series.items()]
+
+    @staticmethod
+    def merge(total, values):
+        return values if total is None else [a + b for a, b in zip(total, values)]
+
+    def render(self, series=None):
+        """Render the given {labels: values} series, this process's own by default."""
+        if series is None:
+            with self.lock:
+                series = {labels: list(values) for labels, values in self.series.items()}
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                extra = [('le', bound if bound == '+Inf' else f'{bound:g}')]
+                yield f'{self.name}_bucket{format_labels(self.labels, labels, extra)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {values[-1]:.6g}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUTE = ('route', 'method')
+
+REQUESTS = Counter('employees_http_requests_total', 'Requests served.', ROUTE + ('status',))
+SLOW_REQUESTS = Counter(
+    'employees_http_slow_requests_total', 'Requests slower than SLOW_REQUEST_THRESHOLD_MS.', ROUTE
+)
+DURATION = Histogram('employees_http_request_duration_seconds', 'Time to build the response.', ROUTE, SECONDS)
+DB_TIME = Histogram('employees_http_request_db_seconds', 'Time spent in SQL queries.', ROUTE, SECONDS)
+QUERIES = Histogram(
+    'employees_http_request_db_queries', 'SQL queries per request.', ROUTE, (0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+SERIALIZE_TIME = Histogram(
+    'employees_http_request_serialize_seconds', 'Time spent turning data into response dicts.', ROUTE, SECONDS
+)
+RENDER_TIME = Histogram(
+    'employees_http_request_render_seconds', 'Time spent rendering responses to bytes.', ROUTE, SECONDS
+)
+RESPONSE_SIZE = Histogram(
+    'employees_http_response_size_bytes', 'Size of non-streaming response bodies.', ROUTE,
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+REGISTRY = (REQUESTS, SLOW_REQUESTS, DURATION, DB_TIME, QUERIES, SERIALIZE_TIME, RENDER_TIME, RESPONSE_SIZE)
+
+
+def observe(labels, status_code, total, metrics, size, slow):
+    REQUESTS.inc(labels + (str(status_code),))
+    if slow:
+        SLOW_REQUESTS.inc(labels)
+    DURATION.observe(labels, total)
+    DB_TIME.observe(labels, metrics.db_time)
+    QUERIES.observe(labels, metrics.query_count)
+    SERIALIZE_TIME.observe(labels, metrics.section_time('serialize'))
+    RENDER_TIME.observe(labels, metrics.section_time('render'))
+    if size is not None:
+        RESPONSE_SIZE.observe(labels, size)
+    publish_soon()
+
+
+STORE_PREFIX = 'metrics:'
+
+
+class Publisher:
+    """When this process last wrote its totals to the store, and the timer that writes them next."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Unique per process lifetime: a new process reusing a pid doesn't overwrite the old totals.
+        self.key = f'{STORE_PREFIX}{socket.gethostname()}:{os.getpid()}:{time.time_ns()}'
+        self.published = 0.0
+        self.timer = None
+
+
+publisher = Publisher()
+
+
+def _after_fork():
+    # A forked worker starts with its parent's series; they are the parent's to publish.
+    global publisher
+    publisher = Publisher()
+    for metric in REGISTRY:
+        metric.lock = threading.Lock()
+        metric.series = {}
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def publish():
+    """Write this process's totals to THROTTLE_STORE."""
+    with publisher.lock:
+        publisher.timer = None
+        publisher.published = time.monotonic()
+    get_store().put(publisher.key, json.dumps({metric.name: metric.snapshot() for metric in REGISTRY}))
+
+
+def _publish_from_timer():
+    try:
+        publish()
+    except Exception:
+        logger.exception('Publishing request metrics failed')
+
+
+def publish_soon():
+    """Publish within METRICS_PUBLISH_SECONDS, off the request path."""
+    with publisher.lock:
+        if publisher.timer is not None:
+            return
+        delay = max(publisher.published + settings.METRICS_PUBLISH_SECONDS - time.monotonic(), 0)
+        publisher.timer = threading.Timer(delay, _publish_from_timer)
+        publisher.timer.daemon = True
+        publisher.timer.start()
+
+
+def collect():
+    """{metric name: {labels: value}} summed over every process's published totals."""
+    publish()
+    metrics = {metric.name: metric for metric in REGISTRY}
+    totals = {name: {} for name in metrics}
+    for blob in get_store().values(STORE_PREFIX):
+        for name, series in json.loads(blob).items():
+            if name not in metrics:
+                continue
+            merged = totals[name]
+            for labels, value in series:
+                labels = tuple(labels)
+                merged[labels] = metrics[name].merge(merged.get(labels), value)
+    return totals
+
+
+def render_metrics():
+    totals = collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(totals[metric.name]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import metrics
+from .log import release_held_records
+from .routers import replica_reads
+from .throttling import get_store
+
+slow_request_logger = logging.getLogger('employees.slow_requests')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def client_key(request):
+    """Identify the client by its credentials, falling back to the session cookie."""
+    identity = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not identity:
+        return None
+    return f'employees:primary-pin:{hashlib.md5(identity.encode()).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe requests from the replicas, except for clients that wrote within
+    the last REPLICA_PIN_SECONDS, who stay on the primary so they read their
+    own writes. The pins are kept in THROTTLE_STORE, so they hold whichever
+    worker process serves the client's next request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def use_replicas(self, request, key):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return False
+        return key is None or not get_store().marked(key)
+
+    def pin(self, request, key):
+        if key is not None and request.method not in SAFE_METHODS:
+            get_store().mark(key, settings.REPLICA_PIN_SECONDS)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = client_key(request)
+        with replica_reads(self.use_replicas(request, key)):
+            response = self.get_response(request)
+        self.pin(request, key)
+        return response
+
+    async def __acall__(self, request):
+        key = client_key(request)
+        with replica_reads(await sync_to_async(self.use_replicas)(request, key)):
+            response = await self.get_response(request)
+        await sync_to_async(self.pin)(request, key)
+        return response
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unmatched>'
+
+
+def milliseconds(seconds):
+    return f'{seconds * 1000:.1f}'
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure each request's total, database, serialization and rendering
+    time, SQL query count and response size. Adds a Server-Timing header,
+    feeds the per-route histograms served at /api/metrics/ and logs requests
+    slower than SLOW_REQUEST_THRESHOLD_MS together with their queries. The
+    query log of slow and failed requests is written even when sampling
+    skipped it.
+    Streaming responses are measured up to the start of the body.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self.finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self.finish(request, response, request_metrics)
+
+    def process_template_response(self, request, response):
+        # Called just before DRF and template responses are rendered.
+        request_metrics = metrics.current.get()
+        if request_metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: request_metrics.add_section('render', time.perf_counter() - started)
+            )
+        return response
+
+    def finish(self, request, response, request_metrics):
+        total = time.perf_counter() - request_metrics.started
+        db_time = request_metrics.db_time
+        serialize_time = request_metrics.section_time('serialize')
+        render_time = request_metrics.section_time('render')
+        size = None if response.streaming else len(response.content)
+        labels = (route_name(request), request.method)
+        slow = total * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS
+        metrics.observe(labels, response.status_code, total, request_metrics, size, slow)
+
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={milliseconds(db_time)};desc="{request_metrics.query_count} queries"',
+                f'serialize;dur={milliseconds(serialize_time)}',
+                f'render;dur={milliseconds(render_time)}',
+                f'app;dur={milliseconds(max(0.0, total - db_time - serialize_time - render_time))}',
+                f'total;dur={milliseconds(total)}',
+            ])
+        if slow:
+            self.log_slow_request(request, response, labels, total, request_metrics)
+        if slow or response.status_code >= 500:
+            release_held_records(request_metrics)
+        return response
+
+    def log_slow_request(self, request, response, labels, total, request_metrics):
+        queries = request_metrics.queries
+        lines = [f'  {milliseconds(duration)} ms  {sql}' for sql, duration in queries]
+        if request_metrics.query_count > len(queries):
+            lines.append(f'  ... {request_metrics.query_count - len(queries)} more')
+        slow_request_logger.warning(
+            'Slow request: %s %s (%s) %s in %s ms, %d queries in %s ms\n%s',
+            request.method, request.get_full_path(), labels[0], response.status_code, milliseconds(total),
+            request_metrics.query_count, milliseconds(request_metrics.db_time), '\n'.join(lines)
+        )
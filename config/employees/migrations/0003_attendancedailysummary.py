@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+STATUS_FIELDS = {
+    'PR': 'present_count',
+    'AB': 'absent_count',
+    'LT': 'late_count',
+    'LV': 'leave_count',
+    'HD': 'half_day_count',
+}
+
+
+def backfill_summary(apps, schema_editor):
+    Attendance = apps.get_model('employees', 'Attendance')
+    AttendanceDailySummary = apps.get_model('employees', 'AttendanceDailySummary')
+    counts = {field: Count('id', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()}
+    rows = Attendance.objects.order_by().values('date', 'employee__department').annotate(
+        total_count=Count('id'), **counts
+    )
+    AttendanceDailySummary.objects.bulk_create([
+        AttendanceDailySummary(
+            date=row['date'],
+            department_id=row['employee__department'],
+            total_count=row['total_count'],
+            **{field: row[field] for field in STATUS_FIELDS.values()}
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0002_alter_attendance_check_in'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('present_count', models.PositiveIntegerField(default=0)),
+                ('absent_count', models.PositiveIntegerField(default=0)),
+                ('late_count', models.PositiveIntegerField(default=0)),
+                ('leave_count', models.PositiveIntegerField(default=0)),
+                ('half_day_count', models.PositiveIntegerField(default=0)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='employees.department')),
+            ],
+            options={
+                'ordering': ['date', 'department'],
+                'unique_together': {('date', 'department')},
+            },
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
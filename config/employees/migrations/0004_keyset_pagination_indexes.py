@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0003_attendancedailysummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['-date', 'employee'], name='attendance_date_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='performancereview',
+            index=models.Index(fields=['-review_date', '-id'], name='review_date_id_idx'),
+        ),
+    ]
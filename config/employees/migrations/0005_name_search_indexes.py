@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:33
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+# icontains compiles to UPPER(col) LIKE UPPER(%s) on PostgreSQL, so the trigram
+# indexes are built on UPPER(); prefix matches use LOWER(col) LIKE 'abc%', which
+# needs text_pattern_ops under non-C collations.
+POSTGRES_INDEXES = [
+    ('employee_last_name_trgm_idx', 'employees_employee', 'USING gin (UPPER(last_name) gin_trgm_ops)'),
+    ('department_name_trgm_idx', 'employees_department', 'USING gin (UPPER(name) gin_trgm_ops)'),
+    ('employee_last_name_prefix_idx', 'employees_employee', '(LOWER(last_name) text_pattern_ops)'),
+    ('department_name_prefix_idx', 'employees_department', '(LOWER(name) text_pattern_ops)'),
+]
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, definition in POSTGRES_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}')
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='department_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(django.db.models.functions.text.Lower('last_name'), name='employee_last_name_lower_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
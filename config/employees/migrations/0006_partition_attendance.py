@@ -0,0 +1,102 @@
+from datetime import date
+
+from django.db import migrations
+
+# On PostgreSQL, attendance becomes a table range-partitioned by month on
+# "date", so date-bounded queries only scan the matching months and old months
+# can be detached and dropped instead of deleted row by row. The primary key
+# has to include the partition key, so it becomes (id, date); ids still come
+# from the identity sequence. Other backends keep the plain table.
+#
+# The rows are copied once, inside the migration's transaction, so run it in a
+# maintenance window on large installations.
+
+TABLE = 'employees_attendance'
+MONTHS_AHEAD = 3
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def constraints(cursor, table):
+    cursor.execute(
+        'SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass',
+        [table]
+    )
+    return cursor.fetchall()
+
+
+def plain_indexes(cursor, table):
+    # Indexes that don't back a constraint; those are recreated with it.
+    cursor.execute(
+        'SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x '
+        'JOIN pg_class i ON i.oid = x.indexrelid '
+        'WHERE x.indrelid = %s::regclass '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)',
+        [table]
+    )
+    return cursor.fetchall()
+
+
+def rebuild(schema_editor, partitioned):
+    with schema_editor.connection.cursor() as cursor:
+        saved_constraints = constraints(cursor, TABLE)
+        saved_indexes = plain_indexes(cursor, TABLE)
+        cursor.execute(f'SELECT MIN(date) FROM {TABLE}')
+        first = cursor.fetchone()[0]
+
+    new = f'{TABLE}_rebuild'
+    clause = ' PARTITION BY RANGE (date)' if partitioned else ''
+    schema_editor.execute(f'CREATE TABLE {new} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY){clause}')
+    if partitioned:
+        month = month_start(first or date.today())
+        last = month_start(date.today())
+        for _ in range(MONTHS_AHEAD):
+            last = next_month(last)
+        while month <= last:
+            schema_editor.execute(
+                f'CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {new} '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            )
+            month = next_month(month)
+        schema_editor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {new} DEFAULT')
+    schema_editor.execute(f'INSERT INTO {new} SELECT * FROM {TABLE}')
+    schema_editor.execute(f'DROP TABLE {TABLE}')
+    schema_editor.execute(f'ALTER TABLE {new} RENAME TO {TABLE}')
+    schema_editor.execute(f'ALTER SEQUENCE {new}_id_seq RENAME TO {TABLE}_id_seq')
+    schema_editor.execute(
+        f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)"
+    )
+
+    for name, kind, definition in saved_constraints:
+        if kind == 'p':
+            definition = 'PRIMARY KEY (id, date)' if partitioned else 'PRIMARY KEY (id)'
+        schema_editor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+    for name, definition in saved_indexes:
+        schema_editor.execute(definition)
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0005_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
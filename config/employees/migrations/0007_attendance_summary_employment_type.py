@@ -0,0 +1,87 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+STATUS_FIELDS = {
+    'PR': 'present_count',
+    'AB': 'absent_count',
+    'LT': 'late_count',
+    'LV': 'leave_count',
+    'HD': 'half_day_count',
+}
+
+
+def check_constraints_now(schema_editor):
+    # The unique constraint is altered right after the rows are rewritten, and
+    # PostgreSQL refuses to ALTER a table with deferred FK checks pending.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def split_summary(apps, schema_editor):
+    # Days that still have attendance are recomputed per employment type.
+    # Days whose attendance was archived can't be split and keep their
+    # counts under the default type.
+    check_constraints_now(schema_editor)
+    Attendance = apps.get_model('employees', 'Attendance')
+    AttendanceDailySummary = apps.get_model('employees', 'AttendanceDailySummary')
+    AttendanceDailySummary.objects.filter(date__in=Attendance.objects.values('date')).delete()
+    counts = {field: Count('id', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()}
+    rows = Attendance.objects.order_by().values('date', 'employee__department', 'employee__employment_type').annotate(
+        total_count=Count('id'), **counts
+    )
+    AttendanceDailySummary.objects.bulk_create((
+        AttendanceDailySummary(
+            date=row['date'],
+            department_id=row['employee__department'],
+            employment_type=row['employee__employment_type'],
+            total_count=row['total_count'],
+            **{field: row[field] for field in STATUS_FIELDS.values()}
+        )
+        for row in rows
+    ), batch_size=1000)
+
+
+def merge_summary(apps, schema_editor):
+    check_constraints_now(schema_editor)
+    AttendanceDailySummary = apps.get_model('employees', 'AttendanceDailySummary')
+    fields = list(STATUS_FIELDS.values()) + ['total_count']
+    rows = list(AttendanceDailySummary.objects.order_by().values('date', 'department').annotate(
+        **{f'sum_{field}': models.Sum(field) for field in fields}
+    ))
+    AttendanceDailySummary.objects.all().delete()
+    AttendanceDailySummary.objects.bulk_create((
+        AttendanceDailySummary(
+            date=row['date'], department_id=row['department'],
+            **{field: row[f'sum_{field}'] for field in fields}
+        )
+        for row in rows
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0006_partition_attendance'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='attendancedailysummary',
+            options={'ordering': ['date', 'department', 'employment_type']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='attendancedailysummary',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='attendancedailysummary',
+            name='employment_type',
+            field=models.CharField(choices=[('FT', 'Full-Time'), ('PT', 'Part-Time'), ('CT', 'Contract'), ('IN', 'Intern')], default='FT', max_length=2),
+        ),
+        migrations.RunPython(split_summary, merge_summary),
+        migrations.AlterUniqueTogether(
+            name='attendancedailysummary',
+            unique_together={('date', 'department', 'employment_type')},
+        ),
+    ]
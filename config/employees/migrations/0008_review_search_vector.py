@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# On PostgreSQL, review text gets a generated tsvector column, stored and kept
+# current by the database itself, with a GIN index for employees.search.
+# Other backends search an in-memory index instead and need no schema change.
+# Adding the column rewrites the table once.
+
+TABLE = 'employees_performancereview'
+FIELDS = ('comments', 'goals', 'strengths', 'areas_for_improvement')
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    document = " || ' ' || ".join(FIELDS)
+    schema_editor.execute(
+        f"ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('english', {document})) STORED"
+    )
+    schema_editor.execute(f'CREATE INDEX review_search_vector_idx ON {TABLE} USING gin (search_vector)')
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'ALTER TABLE {TABLE} DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0007_attendance_summary_employment_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
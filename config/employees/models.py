@@ -1,8 +1,54 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Lower
+from . import rollups
+from .cache import bump_data_version
 
-class Department(models.Model):
+
+class DataVersionQuerySet(models.QuerySet):
+    """Invalidates cached responses for bulk writes, which send no post_save signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        # After the commit: a response cached under the new version before
+        # then would hold the old rows.
+        transaction.on_commit(bump_data_version)
+        return created
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        transaction.on_commit(bump_data_version)
+        return updated
+    update.alters_data = True
+
+
+class RollupBatchingQuerySet(DataVersionQuerySet):
+
+    def delete(self):
+        # post_delete fires per row, also for attendance deleted by cascade;
+        # batching merges those into one write per summary row.
+        with rollups.batched():
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class RollupBatchingModel(models.Model):
+    """Batches the summary updates of the attendance rows a delete cascades to."""
+
+    objects = RollupBatchingQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def delete(self, *args, **kwargs):
+        with rollups.batched():
+            return super().delete(*args, **kwargs)
+
+
+class Department(RollupBatchingModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     location = models.CharField(max_length=100)
@@ -16,8 +62,31 @@ class Department(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(Lower('name'), name='department_name_lower_idx'),
+        ]
+
+EMPLOYEE_GROUP_FIELDS = {'department', 'department_id', 'employment_type'}
+
+
+class EmployeeQuerySet(RollupBatchingQuerySet):
+    """Moves AttendanceDailySummary counts for group changes that bypass save()."""
+
+    def update(self, **kwargs):
+        if not EMPLOYEE_GROUP_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            # Read before the update, which may change what the filter matches.
+            dates = set(
+                Attendance.objects.filter(employee__in=self.values('pk')).values_list('date', flat=True).distinct()
+            )
+            updated = super().update(**kwargs)
+            rollups.refresh_dates(dates)
+        return updated
+    update.alters_data = True
+
 
-class Employee(models.Model):
+class Employee(RollupBatchingModel):
     EMPLOYMENT_TYPES = [
         ('FT', 'Full-Time'),
         ('PT', 'Part-Time'),
@@ -37,6 +106,8 @@ class Employee(models.Model):
     manager = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True)
     date_of_birth = models.DateField()
     address = models.TextField()
+
+    objects = EmployeeQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -46,6 +117,71 @@ class Employee(models.Model):
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(Lower('last_name'), name='employee_last_name_lower_idx'),
+        ]
+
+ROLLUP_FIELDS = {'date', 'status', 'employee', 'employee_id'}
+
+
+class AttendanceQuerySet(RollupBatchingQuerySet):
+    """Keeps AttendanceDailySummary current for writes that bypass save()/delete()."""
+
+    # Rows and summaries are written in one transaction, so the version
+    # bump the base class defers to the commit also covers the summaries.
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            return self._bulk_create(objs, *args, **kwargs)
+
+    def _bulk_create(self, objs, *args, **kwargs):
+        if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+            # Which rows were inserted, skipped or overwritten is unknown here,
+            # so the touched dates are recomputed instead.
+            created = super().bulk_create(objs, *args, **kwargs)
+            rollups.refresh_dates({obj.date for obj in objs})
+            return created
+        created = super().bulk_create(objs, *args, **kwargs)
+        rollups.record([(obj.date, obj.employee_id, obj.status) for obj in objs], 1)
+        for obj in objs:
+            obj._rollup_key = (obj.date, obj.employee_id, obj.status)
+        return created
+
+    def update(self, **kwargs):
+        if not ROLLUP_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            return self._update_with_rollups(**kwargs)
+    update.alters_data = True
+
+    def _update_with_rollups(self, **kwargs):
+        if any(isinstance(value, Combinable) for value in kwargs.values()):
+            # Expressions (including the Case() that bulk_update() builds) can't
+            # be mapped to deltas up front, so every touched date is recomputed.
+            pks = list(self.values_list('pk', flat=True))
+            dates = set(self.values_list('date', flat=True).distinct())
+            updated = super().update(**kwargs)
+            dates.update(Attendance.objects.filter(pk__in=pks).values_list('date', flat=True).distinct())
+            rollups.refresh_dates(dates)
+            return updated
+        before = rollups.aggregate(self)
+        day = rollups.to_date(kwargs['date']) if 'date' in kwargs else None
+        status = kwargs.get('status')
+        employee = kwargs.get('employee', kwargs.get('employee_id'))
+        group = None
+        if employee is not None:
+            employee_id = employee.pk if isinstance(employee, models.Model) else employee
+            group = rollups.employee_groups([employee_id])[employee_id]
+        with rollups.batched():
+            updated = super().update(**kwargs)
+            rollups.record_counts(before, -1)
+            rollups.record_counts([
+                (day or row_date, group or row_group, status or row_status, count)
+                for row_date, row_group, row_status, count in before
+            ], 1)
+        return updated
+
 
 class Attendance(models.Model):
     STATUS_CHOICES = [
@@ -65,10 +201,15 @@ class Attendance(models.Model):
     notes = models.TextField(blank=True)
     overtime_hours = models.DecimalField(max_digits=4, decimal_places=2, default=0)
     leave_type = models.CharField(max_length=50, blank=True)
+
+    objects = AttendanceQuerySet.as_manager()
     
     class Meta:
         unique_together = ['employee', 'date']
         ordering = ['-date', 'employee']
+        indexes = [
+            models.Index(fields=['-date', 'employee'], name='attendance_date_employee_idx'),
+        ]
     
     def __str__(self):
         return f"{self.employee} - {self.date} ({self.status})"
@@ -83,9 +224,32 @@ class PerformanceReview(models.Model):
     strengths = models.TextField()
     areas_for_improvement = models.TextField()
     next_review_date = models.DateField()
+
+    objects = DataVersionQuerySet.as_manager()
     
     class Meta:
         ordering = ['-review_date']
+        indexes = [
+            models.Index(fields=['-review_date', '-id'], name='review_date_id_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.employee} - {self.review_date} (Rating: {self.rating})"
\ No newline at end of file
+        return f"{self.employee} - {self.review_date} (Rating: {self.rating})"
+
+class AttendanceDailySummary(models.Model):
+    date = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='attendance_summaries')
+    employment_type = models.CharField(max_length=2, choices=Employee.EMPLOYMENT_TYPES, default='FT')
+    present_count = models.PositiveIntegerField(default=0)
+    absent_count = models.PositiveIntegerField(default=0)
+    late_count = models.PositiveIntegerField(default=0)
+    leave_count = models.PositiveIntegerField(default=0)
+    half_day_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['date', 'department', 'employment_type']
+        ordering = ['date', 'department', 'employment_type']
+
+    def __str__(self):
+        return f"{self.department} - {self.date} ({self.total_count})"
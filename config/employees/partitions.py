@@ -0,0 +1,94 @@
+"""
+Monthly range partitions of the attendance table on PostgreSQL.
+
+Migration 0006 partitions the table and creates partitions for the months it
+holds plus a few ahead; create_attendance_partitions keeps creating upcoming
+months. Rows outside every monthly partition land in the default partition.
+On other backends the table is not partitioned and these helpers are no-ops.
+"""
+from django.db import connection, transaction
+
+from .models import Attendance
+
+TABLE = Attendance._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+BOUNDS = 'date >= %s AND date < %s'
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def existing_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass', [TABLE]
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+def ensure_partitions(first, last):
+    """Create the monthly partitions from first's month to last's month that don't exist yet."""
+    if not is_partitioned():
+        return []
+    existing = existing_partitions()
+    created = []
+    month = month_start(first)
+    while month <= last:
+        if partition_name(month) not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def create_partition(month):
+    name, bounds = partition_name(month), [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {BOUNDS})', bounds)
+        if not cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', bounds)
+            return
+        # Rows for this month already sit in the default partition, which
+        # would make the new partition's bounds overlap; move them over first.
+        cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {BOUNDS}', bounds)
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE {BOUNDS}', bounds)
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def drop_partition_if_complete(month, expected):
+    """
+    Detach and drop month's partition if it holds exactly `expected` rows,
+    blocking writes to it while checking. Returns whether it was dropped.
+    """
+    name = partition_name(month)
+    if not is_partitioned() or name not in existing_partitions():
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {name} IN SHARE MODE')
+        cursor.execute(f'SELECT COUNT(*) FROM {name}')
+        if cursor.fetchone()[0] != expected:
+            return False
+        # Detaching only touches the catalog, so the parent is locked briefly.
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        cursor.execute(f'DROP TABLE {name}')
+    return True
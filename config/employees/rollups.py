@@ -0,0 +1,222 @@
+"""
+Incremental maintenance of ``AttendanceDailySummary``.
+
+Every change to an ``Attendance`` row is turned into a +1/-1 delta on the
+summary row for its date and the employee's group, (department,
+employment type), and on that row's status count. Deltas are buffered while
+a ``batched()`` block is open so bulk operations touch each summary row once.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+STATUS_FIELDS = {
+    'PR': 'present_count',
+    'AB': 'absent_count',
+    'LT': 'late_count',
+    'LV': 'leave_count',
+    'HD': 'half_day_count',
+}
+COUNT_FIELDS = list(STATUS_FIELDS.values()) + ['total_count']
+
+_state = threading.local()
+
+
+def _models():
+    from .models import Attendance, AttendanceDailySummary, Employee
+    return Attendance, AttendanceDailySummary, Employee
+
+
+def to_date(value):
+    Attendance, _, _ = _models()
+    return Attendance._meta.get_field('date').to_python(value)
+
+
+@contextmanager
+def batched():
+    """Collect deltas from everything in the block and apply them once at the end."""
+    if getattr(_state, 'deltas', None) is not None:
+        yield
+        return
+    _state.deltas = defaultdict(lambda: defaultdict(int))
+    _state.groups = {}
+    try:
+        yield
+        deltas = _state.deltas
+    finally:
+        _state.deltas = None
+        _state.groups = None
+    apply_deltas(deltas)
+
+
+def employee_groups(employee_ids):
+    """Map employee ids to their (department_id, employment_type) group."""
+    _, _, Employee = _models()
+    cache = getattr(_state, 'groups', None)
+    if cache is None:
+        cache = {}
+    missing = {pk for pk in employee_ids if pk not in cache}
+    if missing:
+        rows = Employee.objects.filter(pk__in=missing).values_list('id', 'department_id', 'employment_type')
+        cache.update((pk, (department_id, employment_type)) for pk, department_id, employment_type in rows)
+    return {pk: cache.get(pk) for pk in employee_ids}
+
+
+def record(entries, sign):
+    """Record ``sign`` (+1/-1) for each (date, employee_id, status) entry."""
+    entries = [entry for entry in entries if entry is not None]
+    if not entries:
+        return
+    groups = employee_groups({employee_id for _, employee_id, _ in entries})
+    record_counts(
+        ((to_date(day), groups[employee_id], status, 1) for day, employee_id, status in entries),
+        sign
+    )
+
+
+def record_counts(rows, sign):
+    """Record pre-aggregated (date, (department_id, employment_type), status, count) rows."""
+    deltas = getattr(_state, 'deltas', None)
+    pending = deltas if deltas is not None else defaultdict(lambda: defaultdict(int))
+    for day, group, status, count in rows:
+        if group is None or group[0] is None or status not in STATUS_FIELDS:
+            continue
+        counts = pending[(day, group)]
+        counts[STATUS_FIELDS[status]] += sign * count
+        counts['total_count'] += sign * count
+    if deltas is None:
+        apply_deltas(pending)
+
+
+def apply_deltas(deltas):
+    _, AttendanceDailySummary, _ = _models()
+    for (day, (department_id, employment_type)), counts in deltas.items():
+        counts = {field: value for field, value in counts.items() if value}
+        if not counts:
+            continue
+        summary = AttendanceDailySummary.objects.filter(
+            date=day, department_id=department_id, employment_type=employment_type
+        )
+        if summary.update(**{field: F(field) + value for field, value in counts.items()}):
+            continue
+        if any(value < 0 for value in counts.values()):
+            # Nothing to decrement: the summary row (or its department) is already gone.
+            continue
+        try:
+            with transaction.atomic():
+                AttendanceDailySummary.objects.create(
+                    date=day, department_id=department_id, employment_type=employment_type, **counts
+                )
+        except IntegrityError:
+            summary.update(**{field: F(field) + value for field, value in counts.items()})
+
+
+def aggregate(queryset):
+    """Group an Attendance queryset into (date, (department_id, employment_type), status, count) rows."""
+    rows = queryset.order_by().values(
+        'date', 'employee__department', 'employee__employment_type', 'status'
+    ).annotate(count=Count('id'))
+    return [
+        (row['date'], (row['employee__department'], row['employee__employment_type']), row['status'], row['count'])
+        for row in rows
+    ]
+
+
+def summary_rows(queryset):
+    """Aggregate an Attendance queryset into unsaved AttendanceDailySummary rows."""
+    _, AttendanceDailySummary, _ = _models()
+    counts = {field: Count('id', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()}
+    rows = queryset.order_by().values('date', 'employee__department', 'employee__employment_type').annotate(
+        total_count=Count('id'), **counts
+    )
+    return [
+        AttendanceDailySummary(
+            date=row['date'],
+            department_id=row['employee__department'],
+            employment_type=row['employee__employment_type'],
+            **{field: row[field] for field in COUNT_FIELDS}
+        )
+        for row in rows
+    ]
+
+
+def replace_summaries(start, end, dates=None, batch_size=1000):
+    """
+    Replace the summary rows dated start..end (inclusive, open-ended when
+    None), and in ``dates`` when given, with ones computed from the raw
+    attendance table plus the saved counts of archived days. Days of archives
+    without saved counts are left alone. Returns the number of rows written.
+    """
+    from .archive import archived_summaries
+    from .partitions import add_months
+
+    Attendance, AttendanceDailySummary, _ = _models()
+    archived, unknown = archived_summaries(start, end)
+    date_filter = Q()
+    if start:
+        date_filter &= Q(date__gte=start)
+    if end:
+        date_filter &= Q(date__lte=end)
+    if dates is not None:
+        date_filter &= Q(date__in=dates)
+    for month in unknown:
+        date_filter &= ~Q(date__gte=month, date__lt=add_months(month, 1))
+
+    with transaction.atomic():
+        summaries = AttendanceDailySummary.objects.filter(date_filter)
+        # Deltas to locked rows wait for the new ones, which then include their attendance rows.
+        list(summaries.select_for_update().order_by().values_list('pk', flat=True))
+        summaries.delete()
+        rows = with_archived(summary_rows(Attendance.objects.filter(date_filter)), archived, dates)
+        try:
+            with transaction.atomic():
+                AttendanceDailySummary.objects.bulk_create(rows, batch_size=batch_size)
+        except IntegrityError:
+            # A concurrent write created one of the rows since the delete; its
+            # count isn't in ours, so add ours to it instead.
+            apply_deltas({
+                (row.date, (row.department_id, row.employment_type)): {
+                    field: getattr(row, field) for field in COUNT_FIELDS
+                }
+                for row in rows
+            })
+    return len(rows)
+
+
+def with_archived(rows, archived, dates=None):
+    """Add archived counts, as returned by archive.archived_summaries(), to unsaved summary rows."""
+    _, AttendanceDailySummary, _ = _models()
+    Department = AttendanceDailySummary._meta.get_field('department').related_model
+    by_key = {(row.date, (row.department_id, row.employment_type)): row for row in rows}
+    # Summaries of deleted departments went with them.
+    departments = set(Department.objects.filter(
+        pk__in={department_id for _, (department_id, _) in archived}
+    ).values_list('pk', flat=True)) if archived else set()
+    for (day, group), counts in archived.items():
+        if (dates is not None and day not in dates) or group[0] not in departments:
+            continue
+        row = by_key.get((day, group))
+        if row is None:
+            by_key[(day, group)] = AttendanceDailySummary(
+                date=day, department_id=group[0], employment_type=group[1], **counts
+            )
+        else:
+            for field, value in counts.items():
+                setattr(row, field, getattr(row, field) + value)
+    return list(by_key.values())
+
+
+def refresh_dates(dates):
+    """Recompute the summary rows for the given dates from the raw attendance table and the archives."""
+    dates = {to_date(day) for day in dates}
+    if not dates:
+        return
+    replace_summaries(min(dates), max(dates), dates)
+
+
+def rebuild(start=None, end=None, batch_size=1000):
+    """Recompute the summary for ``start``..``end`` (inclusive); the whole table when both are None."""
+    return replace_summaries(start, end, batch_size=batch_size)
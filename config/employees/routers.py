@@ -0,0 +1,48 @@
+"""
+Primary/replica database routing.
+
+Reads go to a replica only inside a replica_reads() scope, which
+ReplicaRoutingMiddleware opens for safe requests from clients that haven't
+written recently. Writes, unsafe requests, management commands and anything
+else outside a scope use the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Token and session lookups are tiny and must see freshly issued rows.
+PRIMARY_ONLY_APPS = {'admin', 'auth', 'authtoken', 'contenttypes', 'sessions'}
+
+_replica_reads = ContextVar('employees_replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not replica_reads_enabled() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
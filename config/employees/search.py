@@ -0,0 +1,355 @@
+"""
+Ranked keyword search over the text of performance reviews.
+
+On PostgreSQL, migration 0008 adds a stored tsvector column generated from
+the four text fields, with a GIN index. Queries are parsed with
+websearch_to_tsquery ("quoted phrases", or, -word), ranked with ts_rank_cd,
+and snippets come from ts_headline.
+
+Other backends use ReviewIndex, an inverted index in process memory ranked
+with BM25. It is built on the first search. Committed review saves and
+deletes update it and bump a version in the shared cache, so other
+processes rebuild theirs on their next search. Bulk writes that skip the
+model signals must call bump_search_version(). The fallback ANDs the query
+words, honours -word, and treats quotes and "or" as plain words.
+"""
+import html
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache, partial
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_date
+
+from .cache import bump_version, current_version, get_cache
+from .models import PerformanceReview
+
+SEARCH_FIELDS = ('comments', 'goals', 'strengths', 'areas_for_improvement')
+SEARCH_CONFIG = 'english'
+SEARCH_VERSION_KEY = 'employees:review-search-version'
+
+# Marks placed around matches while the snippet is still plain text, then
+# replaced by <mark> tags once the rest has been HTML-escaped.
+START_MATCH, STOP_MATCH = '\x02', '\x03'
+SNIPPET_WORDS = 15
+SNIPPET_FRAGMENTS = 2
+FRAGMENT_DELIMITER = ' … '
+
+WORD_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have he her his i in is it its of on or our she so that the '
+    'their them they this to was we were will with you your'.split()
+)
+# Suffixes stem() strips, with the shortest stem each may leave.
+SUFFIXES = (('ions', 4), ('ion', 4), ('ing', 3), ('ed', 3), ('es', 3), ('s', 3))
+# BM25 term frequency saturation and length normalisation.
+K1, B = 1.2, 0.75
+
+
+def parse_search_params(params):
+    """(query, min_rating, max_rating, start, end) from the query params."""
+    query = (params.get('q') or '').strip()
+    if not query:
+        raise ValueError('q is required.')
+    ratings = []
+    for name in ('min_rating', 'max_rating'):
+        value = params.get(name)
+        try:
+            rating = int(value) if value else None
+        except ValueError:
+            rating = 0
+        if rating is not None and not 1 <= rating <= 5:
+            raise ValueError(f'{name} must be an integer from 1 to 5.')
+        ratings.append(rating)
+    dates = []
+    for name in ('start', 'end'):
+        value = params.get(name)
+        try:
+            day = parse_date(value) if value else None
+        except ValueError:
+            day = None
+        if value and day is None:
+            raise ValueError('start and end must be dates in YYYY-MM-DD format.')
+        dates.append(day)
+    return (query, *ratings, *dates)
+
+
+def filtered_reviews(min_rating, max_rating, start, end):
+    queryset = PerformanceReview.objects.all()
+    if min_rating:
+        queryset = queryset.filter(rating__gte=min_rating)
+    if max_rating:
+        queryset = queryset.filter(rating__lte=max_rating)
+    if start:
+        queryset = queryset.filter(review_date__gte=start)
+    if end:
+        queryset = queryset.filter(review_date__lte=end)
+    return queryset
+
+
+def search_reviews(params):
+    """
+    Matching reviews, best first, as a sliceable sequence of (id, rank) for a
+    paginator; pass a page of it to search_results().
+    """
+    query, *filters = parse_search_params(params)
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+        vector = RawSQL(f'{PerformanceReview._meta.db_table}.search_vector', [], output_field=SearchVectorField())
+        tsquery = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return (
+            filtered_reviews(*filters).alias(search_vector=vector).filter(search_vector=tsquery)
+            .annotate(rank=SearchRank(vector, tsquery, cover_density=True))
+            .order_by('-rank', '-review_date', '-id').values_list('id', 'rank')
+        )
+    index = review_index()
+    # apply_change() may be updating the index from another thread.
+    with _index_lock:
+        return index.search(query, *filters)
+
+
+def search_results(page, params):
+    """Result rows for a page of search_reviews(), with highlighted snippets of the matching fields."""
+    query = params.get('q', '')
+    ranks = dict(page)
+    rows = PerformanceReview.objects.filter(pk__in=ranks).values(
+        'id', 'employee', 'employee__first_name', 'employee__last_name', 'reviewer', 'review_date', 'rating'
+    )
+    # Highlights are made from the text fields, or on PostgreSQL from ts_headline annotations replacing them.
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery
+
+        tsquery = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        options = dict(
+            config=SEARCH_CONFIG, start_sel=START_MATCH, stop_sel=STOP_MATCH, max_words=SNIPPET_WORDS,
+            min_words=5, max_fragments=SNIPPET_FRAGMENTS, fragment_delimiter=FRAGMENT_DELIMITER
+        )
+        rows = rows.annotate(**{field: SearchHeadline(field, tsquery, **options) for field in SEARCH_FIELDS})
+        snippet = str
+    else:
+        rows = rows.values(*rows.query.values_select, *SEARCH_FIELDS)
+        snippet = partial(mark_matches, words=set(query_words(query)[0]))
+    results = {}
+    for row in rows:
+        highlights = {}
+        for field in SEARCH_FIELDS:
+            text = snippet(row[field])
+            # ts_headline returns the start of the text when a field has no match.
+            if START_MATCH in text:
+                highlights[field] = html.escape(text).replace(START_MATCH, '<mark>').replace(STOP_MATCH, '</mark>')
+        results[row['id']] = {
+            'id': row['id'],
+            'employee': row['employee'],
+            'employee_name': f"{row['employee__first_name']} {row['employee__last_name']}",
+            'reviewer': row['reviewer'],
+            'review_date': row['review_date'],
+            'rating': row['rating'],
+            'rank': round(ranks[row['id']], 6),
+            'highlights': highlights,
+        }
+    return [results[pk] for pk, _ in page if pk in results]
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Strip common English suffixes, so that estimate, estimates, estimated and estimation match."""
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    for suffix, shortest_stem in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= shortest_stem and not word.endswith('ss'):
+            word = word[:-len(suffix)]
+            break
+    if word.endswith('e') and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def terms(text):
+    return [stem(word) for word in WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def query_words(query):
+    """(required terms, excluded terms) of a query."""
+    required, excluded = [], []
+    for word in query.lower().split():
+        target = excluded if word.startswith('-') else required
+        target.extend(terms(word))
+    return required, excluded
+
+
+def mark_matches(text, words):
+    """Up to SNIPPET_FRAGMENTS windows of SNIPPET_WORDS words around matches, with the matches marked."""
+    tokens = list(WORD_RE.finditer(text))
+    hits = [i for i, token in enumerate(tokens) if stem(token.group().lower()) in words]
+    marked = set(hits)
+    fragments = []
+    covered = -1
+    for hit in hits:
+        if hit <= covered:
+            continue
+        if len(fragments) == SNIPPET_FRAGMENTS:
+            break
+        first = max(0, min(hit - SNIPPET_WORDS // 3, len(tokens) - SNIPPET_WORDS))
+        last = min(len(tokens), first + SNIPPET_WORDS) - 1
+        parts, position = [], tokens[first].start()
+        for i in range(first, last + 1):
+            token = tokens[i]
+            parts.append(text[position:token.start()])
+            word = token.group()
+            parts.append(f'{START_MATCH}{word}{STOP_MATCH}' if i in marked else word)
+            position = token.end()
+        fragments.append(''.join(parts))
+        covered = last
+    return FRAGMENT_DELIMITER.join(fragments)
+
+
+class ReviewIndex:
+    """
+    Postings and per-review values of every review, as of one search version.
+
+    Each term has parallel arrays of review ids and occurrence counts, so a
+    (term, review) pair takes twelve bytes; reviews keep the indexes of
+    their terms for remove().
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.term_ids = {}  # term -> index into postings and counts
+        self.postings = []  # term index -> array of review ids
+        self.counts = []  # term index -> array of occurrences, parallel to postings
+        self.reviews = {}  # review id -> (rating, review_date, number of terms, array of term indexes)
+        self.total_length = 0
+
+    def add(self, pk, rating, review_date, texts):
+        self.remove(pk)
+        occurrences = Counter(terms(' '.join(texts)))
+        term_ids = array('I')
+        for term, count in occurrences.items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = self.term_ids[term] = len(self.postings)
+                self.postings.append(array('q'))
+                self.counts.append(array('I'))
+            self.postings[term_id].append(pk)
+            self.counts[term_id].append(count)
+            term_ids.append(term_id)
+        length = sum(occurrences.values())
+        self.reviews[pk] = (rating, review_date, length, term_ids)
+        self.total_length += length
+
+    def remove(self, pk):
+        review = self.reviews.pop(pk, None)
+        if review is None:
+            return
+        self.total_length -= review[2]
+        for term_id in review[3]:
+            position = self.postings[term_id].index(pk)
+            del self.postings[term_id][position]
+            del self.counts[term_id][position]
+
+    def search(self, query, min_rating=None, max_rating=None, start=None, end=None):
+        required, excluded = query_words(query)
+        required = [self.term_ids.get(term) for term in dict.fromkeys(required)]
+        if not required or any(term_id is None or not self.postings[term_id] for term_id in required):
+            return []
+        # Walk the rarest term's reviews; the others only need lookups.
+        required.sort(key=lambda term_id: len(self.postings[term_id]))
+        rarest, others = required[0], required[1:]
+        lookups = [dict(zip(self.postings[term_id], self.counts[term_id])) for term_id in others]
+        skip = set()
+        for term in excluded:
+            if term in self.term_ids:
+                skip.update(self.postings[self.term_ids[term]])
+        reviews = len(self.reviews)
+        average_length = self.total_length / reviews
+        weights = []
+        for term_id in required:
+            found = len(self.postings[term_id])
+            weights.append(math.log(1 + (reviews - found + 0.5) / (found + 0.5)))
+        matches = []
+        for pk, count in zip(self.postings[rarest], self.counts[rarest]):
+            if pk in skip:
+                continue
+            counts = [count]
+            for lookup in lookups:
+                count = lookup.get(pk)
+                if count is None:
+                    break
+                counts.append(count)
+            else:
+                rating, review_date, length, _ = self.reviews[pk]
+                if (min_rating and rating < min_rating) or (max_rating and rating > max_rating) \
+                        or (start and review_date < start) or (end and review_date > end):
+                    continue
+                norm = K1 * (1 - B + B * length / average_length)
+                score = sum(weight * count * (K1 + 1) / (count + norm) for weight, count in zip(weights, counts))
+                matches.append((round(score, 6), review_date, pk))
+        matches.sort(reverse=True)
+        return [(pk, score) for score, _, pk in matches]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def search_version():
+    return current_version(get_cache(), SEARCH_VERSION_KEY)
+
+
+def bump_search_version():
+    """Make every process rebuild its in-memory review index; returns the new version."""
+    return bump_version(get_cache(), SEARCH_VERSION_KEY)
+
+
+def build_index(version):
+    index = ReviewIndex(version)
+    rows = PerformanceReview.objects.values_list('id', 'rating', 'review_date', *SEARCH_FIELDS)
+    for pk, rating, review_date, *texts in rows.iterator(chunk_size=2000):
+        index.add(pk, rating, review_date, texts)
+    return index
+
+
+def review_index():
+    global _index
+    # Read the version before the rows: a write racing the build leaves the
+    # index under an outdated version, to be rebuilt by the next search.
+    version = search_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = build_index(version)
+            index = _index
+    return index
+
+
+def apply_change(pk, fields=None):
+    """Bring this process's index up to date with one committed review change; fields=None deletes."""
+    version = bump_search_version()
+    with _index_lock:
+        index = _index
+        # Otherwise another process changed reviews too, and the next search rebuilds.
+        if index is not None and index.version == version - 1:
+            if fields is None:
+                index.remove(pk)
+            else:
+                index.add(pk, *fields)
+            index.version = version
+
+
+def review_saved(sender, instance, raw=False, **kwargs):
+    if raw or connection.vendor == 'postgresql':
+        return
+    review_date = PerformanceReview._meta.get_field('review_date').to_python(instance.review_date)
+    fields = (int(instance.rating), review_date, [getattr(instance, field) for field in SEARCH_FIELDS])
+    transaction.on_commit(partial(apply_change, instance.pk, fields))
+
+
+def review_deleted(sender, instance, **kwargs):
+    if connection.vendor != 'postgresql':
+        transaction.on_commit(partial(apply_change, instance.pk))
@@ -1,51 +1,144 @@
 from rest_framework import serializers
+from .fieldsets import SparseFieldsSerializerMixin
+from .hierarchy import would_create_cycle
+from .metrics import timed
 from .models import Department, Employee, Attendance, PerformanceReview
 
-class DepartmentSerializer(serializers.ModelSerializer):
+
+class TimedSerializerMixin:
+    """Count to_representation() as the request's serialize time; nested serializers count once."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+# Every serializer below derives from these, so whichever view uses them,
+# their time shows up as serialize rather than app time.
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+
+class DepartmentSerializer(SparseFieldsSerializerMixin, ModelSerializer):
     employee_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Department
         fields = '__all__'
+        field_columns = {'employee_count': []}
     
     def get_employee_count(self, obj):
+        if hasattr(obj, 'employee_count'):
+            return obj.employee_count
         return obj.employees.count()
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(SparseFieldsSerializerMixin, ModelSerializer):
     department_name = serializers.CharField(source='department.name', read_only=True)
     manager_name = serializers.SerializerMethodField()
     
     class Meta:
         model = Employee
         fields = '__all__'
+        field_columns = {'manager_name': ['manager__first_name', 'manager__last_name']}
     
     def get_manager_name(self, obj):
         return f"{obj.manager.first_name} {obj.manager.last_name}" if obj.manager else None
 
-class AttendanceSerializer(serializers.ModelSerializer):
+    def validate_manager(self, manager):
+        if manager and self.instance and would_create_cycle(self.instance.pk, manager.pk):
+            raise serializers.ValidationError("An employee cannot report to themselves or to one of their reports.")
+        return manager
+
+class AttendanceSerializer(SparseFieldsSerializerMixin, ModelSerializer):
     employee_name = serializers.CharField(source='employee.__str__', read_only=True)
     
     class Meta:
         model = Attendance
         fields = '__all__'
+        field_columns = {'employee_name': ['employee__first_name', 'employee__last_name']}
 
-class PerformanceReviewSerializer(serializers.ModelSerializer):
+class PerformanceReviewSerializer(SparseFieldsSerializerMixin, ModelSerializer):
     employee_name = serializers.CharField(source='employee.__str__', read_only=True)
     
     class Meta:
         model = PerformanceReview
         fields = '__all__'
+        field_columns = {'employee_name': ['employee__first_name', 'employee__last_name']}
 
-class DepartmentAnalyticsSerializer(serializers.Serializer):
+class DepartmentAnalyticsSerializer(Serializer):
     department = serializers.CharField()
     employee_count = serializers.IntegerField()
     avg_salary = serializers.DecimalField(max_digits=10, decimal_places=2)
     total_budget = serializers.DecimalField(max_digits=12, decimal_places=2)
-    budget_utilization = serializers.DecimalField(max_digits=5, decimal_places=2)
+    budget_utilization = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-class AttendanceAnalyticsSerializer(serializers.Serializer):
+class AttendanceAnalyticsSerializer(Serializer):
     date = serializers.DateField()
+    department = serializers.CharField(source='department__name', required=False)
+    employment_type = serializers.CharField(required=False)
     present_count = serializers.IntegerField()
     absent_count = serializers.IntegerField()
     late_count = serializers.IntegerField()
-    attendance_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
\ No newline at end of file
+    attendance_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+class OrgMemberSerializer(Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    job_title = serializers.CharField()
+
+class OrgBranchSerializer(OrgMemberSerializer):
+    headcount = serializers.IntegerField()
+    total_salary = serializers.DecimalField(max_digits=14, decimal_places=2)
+    levels = serializers.IntegerField()
+    managers = serializers.IntegerField()
+
+class SubtreeAttendanceSerializer(Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    present_count = serializers.IntegerField()
+    absent_count = serializers.IntegerField()
+    late_count = serializers.IntegerField()
+    leave_count = serializers.IntegerField()
+    half_day_count = serializers.IntegerField()
+    total_count = serializers.IntegerField()
+    attendance_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+class SubtreeRollupSerializer(Serializer):
+    employee = OrgMemberSerializer()
+    headcount = serializers.IntegerField()
+    direct_reports = serializers.IntegerField()
+    levels = serializers.IntegerField()
+    managers = serializers.IntegerField()
+    avg_span_of_control = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_salary = serializers.DecimalField(max_digits=14, decimal_places=2)
+    avg_salary = serializers.DecimalField(max_digits=10, decimal_places=2)
+    attendance = SubtreeAttendanceSerializer()
+    branches = OrgBranchSerializer(many=True)
+
+class PayrollTotalsSerializer(Serializer):
+    headcount = serializers.IntegerField()
+    days = serializers.IntegerField()
+    hours_worked = serializers.DecimalField(max_digits=14, decimal_places=2)
+    overtime_hours = serializers.DecimalField(max_digits=14, decimal_places=2)
+    base_pay = serializers.DecimalField(max_digits=16, decimal_places=2)
+    overtime_pay = serializers.DecimalField(max_digits=16, decimal_places=2)
+    labor_cost = serializers.DecimalField(max_digits=16, decimal_places=2)
+
+class PayrollDepartmentSerializer(PayrollTotalsSerializer):
+    department = serializers.CharField()
+
+class PayrollEmployeeSerializer(Serializer):
+    employee = serializers.IntegerField()
+    employee_name = serializers.CharField()
+    department = serializers.IntegerField()
+    days = serializers.IntegerField()
+    salary = serializers.DecimalField(max_digits=10, decimal_places=2)
+    hours_worked = serializers.DecimalField(max_digits=8, decimal_places=2)
+    overtime_hours = serializers.DecimalField(max_digits=8, decimal_places=2)
+    base_pay = serializers.DecimalField(max_digits=10, decimal_places=2)
+    overtime_pay = serializers.DecimalField(max_digits=12, decimal_places=2)
+    labor_cost = serializers.DecimalField(max_digits=12, decimal_places=2)
@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import live, rollups, search
+from .authentication import bump_auth_version
+from .cache import bump_data_version
+from .models import Attendance, Department, Employee, PerformanceReview
+
+ROLLUP_ATTRS = ('date', 'employee_id', 'status')
+
+
+def _loaded_key(instance):
+    if any(attr not in instance.__dict__ for attr in ROLLUP_ATTRS):
+        return None
+    return tuple(instance.__dict__[attr] for attr in ROLLUP_ATTRS)
+
+
+@receiver(post_init, sender=Attendance)
+def remember_attendance_state(sender, instance, **kwargs):
+    instance._rollup_key = _loaded_key(instance)
+
+
+@receiver(pre_save, sender=Attendance)
+def load_attendance_state(sender, instance, raw=False, **kwargs):
+    # Instances loaded with deferred fields don't know what they are replacing.
+    if raw or instance._state.adding or instance._rollup_key is not None:
+        return
+    row = Attendance.objects.filter(pk=instance.pk).values_list(*ROLLUP_ATTRS).first()
+    instance._rollup_key = tuple(row) if row else None
+
+
+@receiver(post_save, sender=Attendance)
+def publish_attendance_change(sender, instance, created, raw=False, **kwargs):
+    # Connected before update_summary_on_save, which moves _rollup_key on.
+    if raw:
+        return
+    previous = None if created or instance._rollup_key is None else instance._rollup_key[2]
+    live.publish([live.attendance_change(
+        instance.employee_id, instance.date, instance.status, instance.check_in, previous, created
+    )])
+
+
+@receiver(post_save, sender=Attendance)
+def update_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_key = (instance.date, instance.employee_id, instance.status)
+    old_key = None if created else instance._rollup_key
+    if old_key == new_key:
+        return
+    with rollups.batched():
+        rollups.record([old_key], -1)
+        rollups.record([new_key], 1)
+    instance._rollup_key = new_key
+
+
+@receiver(post_delete, sender=Attendance)
+def update_summary_on_delete(sender, instance, **kwargs):
+    rollups.record([instance._rollup_key], -1)
+    if instance._rollup_key is not None:
+        day, employee_id, status = instance._rollup_key
+        live.publish([live.removal(employee_id, day, status)])
+
+
+EMPLOYEE_GROUP_ATTRS = ('department_id', 'employment_type')
+
+
+@receiver(post_init, sender=Employee)
+def remember_employee_group(sender, instance, **kwargs):
+    instance._rollup_group = tuple(instance.__dict__.get(attr) for attr in EMPLOYEE_GROUP_ATTRS)
+
+
+@receiver(post_save, sender=Employee)
+def move_summary_on_group_change(sender, instance, created, raw=False, **kwargs):
+    old_group = instance._rollup_group
+    new_group = (instance.department_id, instance.employment_type)
+    instance._rollup_group = new_group
+    if raw or created or None in old_group or old_group == new_group:
+        return
+    counts = rollups.aggregate(Attendance.objects.filter(employee=instance))
+    with rollups.batched():
+        rollups.record_counts([(day, old_group, status, n) for day, _, status, n in counts], -1)
+        rollups.record_counts([(day, new_group, status, n) for day, _, status, n in counts], 1)
+
+
+for model in (Department, Employee, Attendance, PerformanceReview):
+    post_save.connect(bump_data_version, sender=model, dispatch_uid=f'bump_data_version_save_{model.__name__}')
+    post_delete.connect(bump_data_version, sender=model, dispatch_uid=f'bump_data_version_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=User)
+def revoke_cached_tokens_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which cached tokens don't depend on.
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    bump_auth_version()
+
+
+post_delete.connect(bump_auth_version, sender=Token, dispatch_uid='bump_auth_version_delete_Token')
+post_delete.connect(bump_auth_version, sender=User, dispatch_uid='bump_auth_version_delete_User')
+
+post_save.connect(search.review_saved, sender=PerformanceReview, dispatch_uid='review_search_save')
+post_delete.connect(search.review_deleted, sender=PerformanceReview, dispatch_uid='review_search_delete')
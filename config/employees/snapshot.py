@@ -0,0 +1,118 @@
+"""
+The dashboard page's data as one precomputed response.
+
+A snapshot holds the department analytics, the dashboard totals and the
+attendance series for every range the page offers. It is rendered to JSON
+once, gzip-compressed once, and kept in the response cache with its ETag,
+so serving it is a cache read. A snapshot built under an older data version
+stays in use until it is DASHBOARD_SNAPSHOT_REFRESH_SECONDS old; requests
+then keep getting it while one background thread builds the next one. The
+refresh_dashboard_snapshot command builds snapshots ahead of requests; it
+needs a response cache shared with the web workers (CACHE_URL), as with the
+default local-memory cache each process has its own snapshot.
+"""
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .analytics import attendance_analytics_data, dashboard_data, department_analytics_data
+from .cache import data_version, get_cache
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'employees:dashboard-snapshot'
+REFRESH_LOCK_KEY = 'employees:dashboard-snapshot:refresh'
+# Attendance ranges offered by the dashboard page, in days, and their buckets.
+ATTENDANCE_RANGES = {30: 'day', 90: 'week', 365: 'week', 730: 'month'}
+
+
+class Snapshot:
+    """A rendered payload, its gzip encoding and what it was built from."""
+
+    def __init__(self, body, version, day, generated):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        # Weak, as the identity and gzip encodings share it.
+        self.etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+        self.version, self.day, self.generated = version, day, generated
+
+    def is_current(self, version):
+        return self.version == version or time.time() - self.generated < settings.DASHBOARD_SNAPSHOT_REFRESH_SECONDS
+
+
+def snapshot_data(today):
+    attendance = {
+        str(days): attendance_analytics_data({
+            'start': (today - timedelta(days=days)).isoformat(), 'end': today.isoformat(), 'granularity': granularity,
+        })
+        for days, granularity in ATTENDANCE_RANGES.items()
+    }
+    return {
+        'generated_at': timezone.now(),
+        'summary': dashboard_data(),
+        'departments': department_analytics_data({}),
+        'attendance': attendance,
+    }
+
+
+def build():
+    """Compute, store and return a new snapshot."""
+    # Read the version first: a write during the build then leaves the
+    # snapshot under an outdated version.
+    version = data_version()
+    today = timezone.now().date()
+    body = JSONRenderer().render({'is_v1': True, 'data': snapshot_data(today)})
+    snapshot = Snapshot(body, version, today, time.time())
+    get_cache().set(SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def refresh_in_background():
+    """Start building a new snapshot on a thread unless one is already being built."""
+    if not get_cache().add(REFRESH_LOCK_KEY, 1, timeout=settings.DASHBOARD_SNAPSHOT_BUILD_TIMEOUT):
+        return
+    threading.Thread(target=_refresh, name='dashboard-snapshot', daemon=True).start()
+
+
+def _refresh():
+    try:
+        build()
+    except Exception:
+        logger.exception('Dashboard snapshot refresh failed')
+    finally:
+        get_cache().delete(REFRESH_LOCK_KEY)
+        connections.close_all()
+
+
+def cache_is_shared():
+    """Whether other processes read the snapshots this one stores."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def stored_snapshot():
+    return get_cache().get(SNAPSHOT_KEY)
+
+
+def needs_build(snapshot):
+    return snapshot is None or snapshot.day != timezone.now().date() or not snapshot.is_current(data_version())
+
+
+def get_snapshot():
+    """The stored snapshot, refreshed in the background when outdated; built inline when there is none."""
+    snapshot = stored_snapshot()
+    if snapshot is None or snapshot.day != timezone.now().date():
+        # Missing, or its attendance ranges end yesterday: don't serve it at all.
+        return build()
+    if not snapshot.is_current(data_version()):
+        refresh_in_background()
+    return snapshot
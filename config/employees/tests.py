@@ -1,3 +1,1765 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import CommandError
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+
+from . import (
+    analytics, archive, authentication, bulk, live, log, metrics, partitions, payroll, rollups, search, snapshot, throttling, urls
+)
+from .cache import cached_response, data_version
+from .management.commands import benchmark_endpoints
+from .pagination import AttendancePagination
+from .routers import PrimaryReplicaRouter, replica_reads
+from .serializers import AttendanceSerializer
+from .models import Department, Employee, Attendance, PerformanceReview, AttendanceDailySummary
+
+
+class FixtureMixin:
+
+    @classmethod
+    def create_fixtures(cls):
+        # Throttle budgets are kept outside the test database, under user ids that repeat.
+        throttling.get_store().clear()
+        cls.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.departments = [
+            Department.objects.create(
+                name=name, location=location, budget=Decimal(budget),
+                established_date=date(2020, 1, 1), head_of_department='Head',
+                email=f'{name.lower()}@company.com'
+            )
+            for name, location, budget in [
+                ('Engineering', 'Floor 3', 500000),
+                ('Marketing', 'Floor 2', 300000),
+                ('Sales', 'Floor 1', 400000),
+            ]
+        ]
+        cls.employees = []
+        for i in range(9):
+            cls.employees.append(cls.make_employee(i, cls.departments[i % 3]))
+        for emp in cls.employees[3:]:
+            emp.manager = cls.employees[0]
+            emp.save()
+        today = timezone.now().date()
+        statuses = ['PR', 'AB', 'LT', 'LV', 'HD']
+        for i, emp in enumerate(cls.employees):
+            for day in range(5):
+                Attendance.objects.create(
+                    employee=emp, date=today - timedelta(days=day),
+                    status=statuses[(i + day) % 5],
+                    hours_worked=Decimal('8.00'), overtime_hours=Decimal(day % 2)
+                )
+            PerformanceReview.objects.create(
+                employee=emp, review_date=today - timedelta(days=i), reviewer='Reviewer',
+                rating=i % 5 + 1, comments='Solid delivery', goals='Lead a project',
+                strengths='Communication', areas_for_improvement='Estimation',
+                next_review_date=today + timedelta(days=180)
+            )
+
+    @staticmethod
+    def make_employee(i, department, **kwargs):
+        fields = dict(
+            first_name=f'First{i}', last_name=f'Last{i}', email=f'employee{i}@company.com',
+            phone='555-0100', hire_date=date(2022, 1, 1) + timedelta(days=i),
+            job_title='Engineer', salary=Decimal(50000 + i * 1000), department=department,
+            employment_type='FT' if i % 2 == 0 else 'PT', date_of_birth=date(1990, 1, 1),
+            address='1 Main St'
+        )
+        fields.update(kwargs)
+        return Employee.objects.create(**fields)
+
+
+
+class EmployeeAPITestCase(FixtureMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixtures()
+
+    def setUp(self):
+        # Cached responses and tokens outlive the per-test database rollback.
+        cache.clear()
+        authentication.tokens.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class DepartmentAnalyticsTests(EmployeeAPITestCase):
+
+    def test_single_query_for_all_departments(self):
+        url = reverse('department-analytics')
+        with self.assertNumQueries(2):  # token lookup + analytics
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        rows = {row['department']: row for row in response.data['data']}
+        self.assertEqual(rows['Engineering']['employee_count'], 3)
+        self.assertEqual(Decimal(rows['Engineering']['avg_salary']), Decimal('53000.00'))
+
+    def test_location_and_employment_type_slicing(self):
+        url = reverse('department-analytics')
+        response = self.client.get(url, {'location': 'Floor 3', 'employment_type': 'FT'})
+        rows = response.data['data']
+        self.assertEqual([row['department'] for row in rows], ['Engineering'])
+        self.assertEqual(rows[0]['employee_count'], 2)
+
+    def test_utilization_over_ten_times_the_budget(self):
+        Department.objects.filter(pk=self.departments[0].pk).update(budget=Decimal('1000.00'))
+        response = self.client.get(reverse('department-analytics'))
+        self.assertEqual(response.status_code, 200)
+        rows = {row['department']: row for row in response.data['data']}
+        self.assertEqual(Decimal(rows['Engineering']['budget_utilization']), Decimal('15900.00'))
+
+
+class QueryBudgetTests(EmployeeAPITestCase):
+    """List endpoints must cost the same number of queries however many rows a page holds."""
+
+    endpoints = ['department-list', 'employee-list', 'attendance-list', 'performancereview-list']
+
+    def setUp(self):
+        super().setUp()
+        # Resolve the token once; later requests authenticate from the token cache.
+        self.client.get(reverse('api-root'))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_endpoints_query_budget(self):
+        # COUNT(*) for page-number pagination + page query; keyset-paginated
+        # endpoints skip the COUNT(*)
+        budgets = {'department-list': 2, 'employee-list': 2, 'attendance-list': 1, 'performancereview-list': 1}
+        for name in self.endpoints:
+            self.assertEqual(self.count_queries(reverse(name)), budgets[name], name)
+
+    def test_deeper_pages_keep_the_same_budget(self):
+        url = reverse('attendance-list')
+        self.assertEqual(self.count_queries(url + '?page=3'), self.count_queries(url + '?page=1'))
+
+
+class AttendanceSummaryTests(EmployeeAPITestCase):
+
+    def assertSummaryMatchesRaw(self):
+        stored = sorted(
+            AttendanceDailySummary.objects.values_list('date', 'department_id', 'employment_type', *rollups.COUNT_FIELDS)
+        )
+        expected = sorted(
+            (row.date, row.department_id, row.employment_type, *(getattr(row, field) for field in rollups.COUNT_FIELDS))
+            for row in rollups.summary_rows(Attendance.objects.all())
+        )
+        stored = [row for row in stored if row[-1]]
+        self.assertEqual(stored, expected)
+
+    def test_single_row_writes(self):
+        self.assertSummaryMatchesRaw()
+        record = Attendance.objects.filter(status='PR').first()
+        record.status = 'AB'
+        record.save()
+        self.assertSummaryMatchesRaw()
+        record.date = record.date - timedelta(days=30)
+        record.save()
+        self.assertSummaryMatchesRaw()
+        record.delete()
+        self.assertSummaryMatchesRaw()
+
+    def test_employee_group_change_by_update(self):
+        moved = [employee.pk for employee in self.employees if employee.department == self.departments[0]]
+        Employee.objects.filter(department=self.departments[0]).update(department=self.departments[1])
+        self.assertSummaryMatchesRaw()
+        self.assertFalse(AttendanceDailySummary.objects.filter(department=self.departments[0]).exists())
+        Employee.objects.filter(pk__in=moved).update(department_id=self.departments[2].pk, employment_type='CT')
+        self.assertSummaryMatchesRaw()
+        Employee.objects.filter(pk__in=moved).update(job_title='Staff Engineer')
+        self.assertSummaryMatchesRaw()
+
+    def test_bulk_writes(self):
+        today = timezone.now().date()
+        Attendance.objects.bulk_create([
+            Attendance(employee=emp, date=today - timedelta(days=10), status='LT')
+            for emp in self.employees
+        ])
+        self.assertSummaryMatchesRaw()
+        Attendance.objects.filter(status='LT').update(status='HD')
+        self.assertSummaryMatchesRaw()
+        Attendance.objects.filter(date=today).update(date=today - timedelta(days=40))
+        self.assertSummaryMatchesRaw()
+        records = list(Attendance.objects.filter(status='PR'))
+        for record in records:
+            record.status = 'LV'
+        Attendance.objects.bulk_update(records, ['status'])
+        self.assertSummaryMatchesRaw()
+        Attendance.objects.bulk_create([
+            Attendance(employee=emp, date=today - timedelta(days=1), status='AB')
+            for emp in self.employees
+        ], update_conflicts=True, unique_fields=['employee', 'date'], update_fields=['status'])
+        self.assertSummaryMatchesRaw()
+        Attendance.objects.filter(status='AB').delete()
+        self.assertSummaryMatchesRaw()
+
+    def test_department_change_and_cascade(self):
+        employee = self.employees[1]
+        employee.department = self.departments[2]
+        employee.save()
+        self.assertSummaryMatchesRaw()
+        employee.employment_type = 'CT'
+        employee.save()
+        self.assertSummaryMatchesRaw()
+        self.employees[2].delete()
+        self.assertSummaryMatchesRaw()
+
+    def test_cascade_delete_batches_summary_updates(self):
+        employee = self.employees[2]
+        today = timezone.now().date()
+        Attendance.objects.bulk_create([
+            Attendance(employee=employee, date=today - timedelta(days=day), status='PR') for day in range(10, 30)
+        ])
+        # The cascade's selects, deletes and one group lookup, then one update
+        # per summary row rather than a lookup and an update per attendance row.
+        with self.assertNumQueries(7 + 25):
+            employee.delete()
+        self.assertSummaryMatchesRaw()
+        with self.assertNumQueries(22):
+            self.departments[0].delete()
+        self.assertSummaryMatchesRaw()
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        AttendanceDailySummary.objects.all().delete()
+        call_command('rebuild_attendance_summary', stdout=open(os.devnull, 'w'))
+        self.assertSummaryMatchesRaw()
+
+    def test_analytics_reads_summary(self):
+        url = reverse('attendance-analytics')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        today = timezone.now().date()
+        row = next(item for item in response.data['data'] if item['date'] == str(today))
+        raw = Attendance.objects.filter(date=today)
+        self.assertEqual(row['present_count'], raw.filter(status='PR').count())
+        self.assertEqual(row['late_count'], raw.filter(status='LT').count())
+
+    def test_analytics_buckets_and_breakdowns(self):
+        url = reverse('attendance-analytics')
+        today = timezone.now().date()
+        Attendance.objects.create(employee=self.employees[0], date=today - timedelta(days=200), status='AB')
+        start = str(today - timedelta(days=365))
+        rows = self.client.get(url, {'start': start, 'granularity': 'month'}).data['data']
+        months = [row['date'] for row in rows]
+        self.assertEqual(months, sorted({str(day.replace(day=1)) for day in Attendance.objects.dates('date', 'month')}))
+        self.assertEqual(sum(row['present_count'] for row in rows), Attendance.objects.filter(status='PR').count())
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'start': start, 'granularity': 'week', 'breakdown': 'department'})
+        rows = response.data['data']
+        for row in rows:
+            week = date.fromisoformat(row['date'])
+            self.assertEqual(week.weekday(), 0)
+            raw = Attendance.objects.filter(
+                employee__department__name=row['department'], date__gte=week, date__lt=week + timedelta(days=7)
+            )
+            self.assertEqual(row['absent_count'], raw.filter(status='AB').count())
+            rate = raw.filter(status='PR').count() * 100 / raw.count()
+            self.assertEqual(Decimal(row['attendance_rate']), Decimal(rate).quantize(Decimal('0.01')))
+
+        rows = self.client.get(url, {'breakdown': 'employment_type', 'employment_type': 'PT'}).data['data']
+        self.assertEqual({row['employment_type'] for row in rows}, {'PT'})
+        self.assertEqual(
+            sum(row['late_count'] for row in rows),
+            Attendance.objects.filter(status='LT', employee__employment_type='PT').count()
+        )
+        for params in ({'granularity': 'year'}, {'breakdown': 'salary'}, {'end': 'today'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class KeysetPaginationTests(EmployeeAPITestCase):
+
+    def walk(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.data['data']
+            self.assertNotIn('count', data)
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def test_walks_every_attendance_row_once_in_order(self):
+        ids, pages = self.walk(reverse('attendance-list') + '?page_size=7')
+        expected = list(Attendance.objects.order_by('-date', 'employee_id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 7)
+
+    def test_walks_reviews_with_filters(self):
+        ids, _ = self.walk(reverse('performancereview-list') + '?page_size=2&min_rating=3')
+        expected = list(
+            PerformanceReview.objects.filter(rating__gte=3).order_by('-review_date', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_returns_prior_page(self):
+        url = reverse('attendance-list') + '?page_size=5'
+        first = self.client.get(url).data['data']
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data['data']
+        back = self.client.get(second['previous']).data['data']
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+
+    def test_deep_page_costs_the_same_as_first(self):
+        url = reverse('attendance-list') + '?page_size=4'
+        with CaptureQueriesContext(connection) as first:
+            data = self.client.get(url).data['data']
+        for _ in range(8):
+            data = self.client.get(data['next']).data['data']
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(data['next'])
+        self.assertEqual(len(deep.captured_queries), len(first.captured_queries))
+        self.assertNotIn('OFFSET', deep.captured_queries[-1]['sql'])
+
+    def test_seek_bounds_the_leading_column(self):
+        def page_sql(url):
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).data['data']
+            return data, next(query['sql'] for query in queries.captured_queries if 'LIMIT' in query['sql'])
+
+        first, _ = page_sql(reverse('attendance-list') + '?page_size=5')
+        second, sql = page_sql(first['next'])
+        self.assertRegex(sql, r'"date" <= \S+ AND \(')
+        _, sql = page_sql(second['previous'])
+        self.assertRegex(sql, r'"date" >= \S+ AND \(')
+
+        first, _ = page_sql(reverse('performancereview-list') + '?page_size=2')
+        _, sql = page_sql(first['next'])
+        self.assertRegex(sql, r'"review_date" <= \S+ AND \(')
+
+    def test_page_size_is_capped_and_bad_cursor_rejected(self):
+        with mock.patch.object(AttendancePagination, 'max_page_size', 6):
+            response = self.client.get(reverse('attendance-list') + '?page_size=100000')
+        self.assertEqual(len(response.data['data']['results']), 6)
+        for cursor in ['not-a-cursor', {'p': 5}, {'p': ['notadate', 1]}, {'p': ['2024-01-01', 'x']}, [1]]:
+            if not isinstance(cursor, str):
+                cursor = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            response = self.client.get(reverse('attendance-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.data['data'], {'error': 'Invalid cursor'})
+        response = self.client.get(reverse('performancereview-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_requests_keep_working(self):
+        response = self.client.get(reverse('attendance-list') + '?page=2')
+        self.assertEqual(response.data['data']['count'], Attendance.objects.count())
+
+
+class NameFilterTests(EmployeeAPITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.make_employee(20, cls.departments[0], last_name='Lastname', email='lastname@company.com')
+
+    def last_names(self, url, params):
+        response = self.client.get(url, dict(params, page_size=500))
+        return {row['employee_name'].split()[-1] for row in response.data['data']['results']}
+
+    def test_match_modes_on_attendance(self):
+        url = reverse('attendance-list')
+        Attendance.objects.create(employee=Employee.objects.get(last_name='Lastname'), date=date(2020, 1, 1))
+        self.assertEqual(self.last_names(url, {'employee': 'LAST1'}), {'Last1'})
+        self.assertEqual(self.last_names(url, {'employee': 'last1', 'match': 'exact'}), {'Last1'})
+        self.assertEqual(self.last_names(url, {'employee': 'lastn', 'match': 'prefix'}), {'Lastname'})
+        self.assertEqual(self.last_names(url, {'employee': 'name', 'match': 'prefix'}), set())
+        self.assertEqual(self.last_names(url, {'employee': 'name', 'match': 'contains'}), {'Lastname'})
+
+    def test_exact_department_match(self):
+        response = self.client.get(reverse('employee-list'), {'department': 'engineering', 'match': 'exact'})
+        self.assertEqual(response.data['data']['count'], 4)
+        response = self.client.get(reverse('employee-list'), {'department': 'engin', 'match': 'exact'})
+        self.assertEqual(response.data['data']['count'], 0)
+
+
+class ExportTests(EmployeeAPITestCase):
+
+    def export(self, resource, file_format, **params):
+        url = reverse('export-data', kwargs={'resource': resource, 'file_format': file_format})
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_attendance_csv_matches_filters(self):
+        today = timezone.now().date()
+        body = self.export('attendance', 'csv', status='PR', start=str(today - timedelta(days=2)))
+        rows = list(csv.DictReader(body.splitlines()))
+        expected = Attendance.objects.filter(status='PR', date__gte=today - timedelta(days=2))
+        self.assertEqual(sorted(int(row['id']) for row in rows), sorted(expected.values_list('id', flat=True)))
+        first = expected.get(pk=rows[0]['id'])
+        self.assertEqual(rows[0]['employee_name'], str(first.employee))
+
+    def test_employees_ndjson(self):
+        body = self.export('employees', 'ndjson', department='Engineering')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['department_name'], 'Engineering')
+        self.assertIsNone(rows[0]['manager_name'])
+        self.assertEqual(rows[1]['manager_name'], 'First0 Last0')
+        self.assertEqual(rows[1]['salary'], '53000.00')
+
+    def test_reviews_min_rating(self):
+        body = self.export('performance-reviews', 'ndjson', min_rating=4)
+        ratings = [json.loads(line)['rating'] for line in body.splitlines()]
+        self.assertEqual(len(ratings), PerformanceReview.objects.filter(rating__gte=4).count())
+        self.assertTrue(all(rating >= 4 for rating in ratings))
+
+    def test_unknown_export(self):
+        url = reverse('export-data', kwargs={'resource': 'salaries', 'file_format': 'csv'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AttendanceArchiveTests(EmployeeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        settings_override = override_settings(ATTENDANCE_ARCHIVE_DIR=self.archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for day, status in [(date(2024, 1, 10), 'PR'), (date(2024, 1, 11), 'AB'), (date(2024, 2, 5), 'PR')]:
+            for emp in self.employees[:3]:
+                Attendance.objects.create(employee=emp, date=day, status=status, hours_worked=Decimal('8.00'))
+
+    def test_command_archives_old_months_and_keeps_summaries(self):
+        summaries = AttendanceDailySummary.objects.filter(date__lt=date(2024, 3, 1)).count()
+        call_command('archive_attendance', retention_months=6, batch_size=2, stdout=open(os.devnull, 'w'))
+        self.assertFalse(Attendance.objects.filter(date__lt=date(2024, 3, 1)).exists())
+        self.assertEqual(Attendance.objects.count(), 45)
+        self.assertEqual(archive.archived_months(), [date(2024, 1, 1), date(2024, 2, 1)])
+        self.assertEqual(len(list(archive.read_month(date(2024, 1, 1)))), 6)
+        self.assertEqual(AttendanceDailySummary.objects.filter(date__lt=date(2024, 3, 1)).count(), summaries)
+
+    def test_late_rows_are_merged_into_the_month(self):
+        archive.archive_month(date(2024, 1, 1), batch_size=100)
+        Attendance.objects.create(employee=self.employees[5], date=date(2024, 1, 20), status='LT')
+        self.assertEqual(archive.archive_month(date(2024, 1, 1), batch_size=100), 1)
+        records = list(archive.read_month(date(2024, 1, 1)))
+        self.assertEqual(len(records), 7)
+        self.assertIn(('2024-01-20', 'LT'), [(record['date'], record['status']) for record in records])
+
+    def test_archive_endpoint_pages_and_filters(self):
+        archive.archive_month(date(2024, 1, 1), batch_size=100)
+        archive.archive_month(date(2024, 2, 1), batch_size=100)
+        url = reverse('attendance-archive')
+        data = self.client.get(url, {'page_size': 4}).data['data']
+        # Files are read only as far as the page needs, so the total is known on the last page only.
+        self.assertIsNone(data['count'])
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(list(data['results'][0]), list(AttendanceSerializer().fields))
+        self.assertEqual(len(self.client.get(data['next']).data['data']['results']), 4)
+        data = self.client.get(url, {'page_size': 4, 'page': 3}).data['data']
+        self.assertEqual((data['count'], len(data['results']), data['next']), (9, 1, None))
+        data = self.client.get(url, {'start': '2024-01-11', 'status': 'PR'}).data['data']
+        self.assertEqual([row['date'] for row in data['results']], ['2024-02-05'] * 3)
+        data = self.client.get(url, {'employee': 'Last1', 'end': '2024-01-31'}).data['data']
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self.client.get(url, {'start': 'January'}).status_code, 400)
+
+    def test_pages_read_only_the_files_they_need(self):
+        archive.archive_month(date(2024, 1, 1), batch_size=100)
+        archive.archive_month(date(2024, 2, 1), batch_size=100)
+        url = reverse('attendance-archive')
+        with mock.patch('employees.archive.read_month', side_effect=archive.read_month) as read_month:
+            self.client.get(url, {'start': '2024-02-01', 'end': '2024-02-29'})
+            self.assertEqual([call.args for call in read_month.call_args_list], [(date(2024, 2, 1),)])
+            read_month.reset_mock()
+            data = self.client.get(url, {'page_size': 2}).data['data']
+            self.assertEqual([call.args for call in read_month.call_args_list], [(date(2024, 1, 1),)])
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+
+    def summaries(self, before):
+        return sorted(
+            AttendanceDailySummary.objects.filter(date__lt=before).values_list(
+                'date', 'department_id', 'employment_type', *rollups.COUNT_FIELDS
+            )
+        )
+
+    def test_summaries_survive_rebuilds_after_archiving(self):
+        expected = self.summaries(date(2024, 3, 1))
+        call_command('archive_attendance', retention_months=6, batch_size=2, stdout=open(os.devnull, 'w'))
+        call_command('rebuild_attendance_summary', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.summaries(date(2024, 3, 1)), expected)
+
+        # A late row on an archived day, upserted in bulk, adds to the archived counts.
+        response = self.client.post(reverse('attendance-bulk-upsert'), [
+            {'employee': self.employees[5].pk, 'date': '2024-01-10', 'status': 'LT'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        late = {
+            'date': date(2024, 1, 10), 'department': self.employees[5].department,
+            'employment_type': self.employees[5].employment_type,
+        }
+        self.assertEqual(AttendanceDailySummary.objects.get(**late).late_count, 1)
+        self.assertEqual(len(self.summaries(date(2024, 3, 1))), len(expected) + 1)
+        with_late = self.summaries(date(2024, 3, 1))
+        rollups.rebuild()
+        self.assertEqual(self.summaries(date(2024, 3, 1)), with_late)
+
+    def test_archives_without_saved_counts_are_left_alone(self):
+        archive.archive_month(date(2024, 1, 1), batch_size=100)
+        os.remove(archive.summary_path(date(2024, 1, 1)))
+        expected = self.summaries(date(2024, 2, 1))
+        rollups.rebuild()
+        self.assertEqual(self.summaries(date(2024, 2, 1)), expected)
+
+    def test_export_from_archive(self):
+        archive.archive_month(date(2024, 1, 1), batch_size=100)
+        url = reverse('export-data', kwargs={'resource': 'attendance', 'file_format': 'csv'})
+        response = self.client.get(url, {'source': 'archive', 'date': '2024-01-10'})
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['employee_name'], 'First0 Last0')
+
+    def test_partition_helpers_are_noops_without_postgresql(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('attendance is partitioned on PostgreSQL')
+        self.assertEqual(partitions.ensure_partitions(date(2024, 1, 1), date(2024, 6, 1)), [])
+        self.assertFalse(partitions.drop_partition_if_complete(date(2024, 1, 1), 6))
+
+
+class OrgHierarchyTests(EmployeeAPITestCase):
+    # employees[3..8] report to employees[0]; make 3 -> 4 -> 5 a deeper line.
+
+    def setUp(self):
+        super().setUp()
+        Employee.objects.filter(pk=self.employees[4].pk).update(manager=self.employees[3])
+        Employee.objects.filter(pk=self.employees[5].pk).update(manager=self.employees[4])
+
+    def subtree_ids(self, employee, **params):
+        response = self.client.get(reverse('employee-subtree', args=[employee.pk]), dict(params, fields='id'))
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data['data']['results'])
+
+    def ids(self, *indexes):
+        return sorted(self.employees[i].pk for i in indexes)
+
+    def test_reporting_chain(self):
+        response = self.client.get(reverse('employee-chain', args=[self.employees[5].pk]))
+        chain = response.data['data']
+        self.assertEqual([row['id'] for row in chain], [self.employees[i].pk for i in (4, 3, 0)])
+        self.assertEqual(chain[0], {
+            'id': self.employees[4].pk, 'name': 'First4 Last4', 'job_title': 'Engineer',
+            'department_name': 'Marketing', 'level': 1,
+        })
+        self.assertEqual(self.client.get(reverse('employee-chain', args=[self.employees[0].pk])).data['data'], [])
+
+    def test_subtree_is_one_query_at_any_depth(self):
+        with self.assertNumQueries(4):  # token lookup + manager exists + COUNT(*) + page query
+            self.assertEqual(self.subtree_ids(self.employees[0]), self.ids(3, 4, 5, 6, 7, 8))
+        self.assertEqual(self.subtree_ids(self.employees[0], max_depth=1), self.ids(3, 6, 7, 8))
+        self.assertEqual(self.subtree_ids(self.employees[3]), self.ids(4, 5))
+        self.assertEqual(self.subtree_ids(self.employees[0], department='Sales'), self.ids(5, 8))
+        url = reverse('employee-subtree', args=[self.employees[0].pk])
+        self.assertEqual(self.client.get(url, {'max_depth': 0}).status_code, 400)
+
+    def test_manager_changes_are_followed(self):
+        response = self.client.patch(reverse('employee-detail', args=[self.employees[4].pk]), {'manager': self.employees[1].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.subtree_ids(self.employees[3]), [])
+        self.assertEqual(self.subtree_ids(self.employees[1]), self.ids(4, 5))
+        chain = self.client.get(reverse('employee-chain', args=[self.employees[5].pk])).data['data']
+        self.assertEqual([row['id'] for row in chain], [self.employees[4].pk, self.employees[1].pk])
+
+    def test_cycles_are_rejected(self):
+        url = reverse('employee-detail', args=[self.employees[3].pk])
+        for manager in (self.employees[5], self.employees[3]):
+            response = self.client.patch(url, {'manager': manager.pk})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('manager', response.data)
+
+    def test_rollup(self):
+        url = reverse('employee-rollup', args=[self.employees[0].pk])
+        data = self.client.get(url).data['data']
+        self.assertEqual(data['headcount'], 6)
+        self.assertEqual(data['direct_reports'], 4)
+        self.assertEqual(data['levels'], 3)
+        self.assertEqual(data['managers'], 3)
+        self.assertEqual(data['avg_span_of_control'], '2.00')
+        salaries = [self.employees[i].salary for i in range(3, 9)]
+        self.assertEqual(Decimal(data['total_salary']), sum(salaries))
+        self.assertEqual(data['attendance']['total_count'], 30)
+        branch = data['branches'][0]
+        self.assertEqual((branch['id'], branch['headcount'], branch['levels']), (self.employees[3].pk, 3, 3))
+        self.assertEqual(Decimal(branch['total_salary']), sum(salaries[:3]))
+
+        # Cached rollups are invalidated by manager changes.
+        self.client.patch(reverse('employee-detail', args=[self.employees[3].pk]), {'manager': self.employees[1].pk})
+        self.assertEqual(self.client.get(url).data['data']['headcount'], 3)
+        self.assertEqual(self.client.get(url, {'start': 'soon'}).status_code, 400)
+
+
+def reference_payroll(month):
+    """Row-by-row Decimal implementation of the payroll rules."""
+    cents = Decimal('0.01')
+    end = partitions.add_months(month, 1)
+    rows = {
+        emp.pk: {'department': emp.department_id, 'salary': emp.salary, 'days': 0,
+                 'hours_worked': Decimal('0.00'), 'overtime_hours': Decimal('0.00')}
+        for emp in Employee.objects.all()
+    }
+    for record in Attendance.objects.filter(date__gte=month, date__lt=end):
+        row = rows[record.employee_id]
+        row['days'] += 1
+        row['hours_worked'] += record.hours_worked or 0
+        row['overtime_hours'] += record.overtime_hours
+    for row in rows.values():
+        row['base_pay'] = (row['salary'] / 12).quantize(cents, ROUND_HALF_UP)
+        hourly = row['salary'] / 2080 * Decimal('1.5')
+        row['overtime_pay'] = (row['overtime_hours'] * hourly).quantize(cents, ROUND_HALF_UP)
+        row['labor_cost'] = row['base_pay'] + row['overtime_pay']
+    return rows
+
+
+class PayrollTests(EmployeeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.month = partitions.month_start(timezone.now().date())
+        self.previous = partitions.add_months(self.month, -1)
+        odd = self.make_employee(30, self.departments[2], salary=Decimal('12345.67'))
+        for day, hours, overtime in [(3, None, '1.25'), (4, '7.33', '0.01'), (5, '9.99', '2.50')]:
+            Attendance.objects.create(
+                employee=odd, date=self.previous + timedelta(days=day),
+                hours_worked=hours and Decimal(hours), overtime_hours=Decimal(overtime)
+            )
+
+    def test_matches_scalar_reference(self):
+        for month in (self.month, self.previous):
+            expected = reference_payroll(month)
+            result = payroll.compute(month)
+            rows = payroll.EmployeeRows(result, payroll.department_mask(result, {}))
+            self.assertEqual(len(rows), len(expected))
+            for row in rows[:]:
+                reference = expected[row['employee']]
+                for column in payroll.AMOUNT_COLUMNS + ('days', 'department'):
+                    self.assertEqual(row[column], reference[column], (month, row['employee'], column))
+
+            departments = payroll.department_rows(result, payroll.department_mask(result, {}))
+            for department in departments:
+                members = [row for row in expected.values()
+                           if row['department'] == Department.objects.get(name=department['department']).pk]
+                self.assertEqual(department['headcount'], len(members))
+                self.assertEqual(department['labor_cost'], sum(row['labor_cost'] for row in members))
+                self.assertEqual(department['overtime_hours'], sum(row['overtime_hours'] for row in members))
+
+    def test_salaries_beyond_32_bit_cents(self):
+        rich = self.make_employee(31, self.departments[0], salary=Decimal('30000000.00'))
+        result = payroll.compute(self.previous)
+        position = result['id'].tolist().index(rich.pk)
+        self.assertEqual(result['salary'][position], 3_000_000_000)
+        self.assertEqual(result['base_pay'][position], 250_000_000)
+
+    def test_attendance_of_employees_not_loaded_is_left_out(self):
+        expected = payroll.compute(self.previous)
+        # As if the last employee and their rows were committed between the two queries.
+        employees = payroll.load_employees()
+        with mock.patch('employees.payroll.load_employees', return_value=employees[:-1]):
+            result = payroll.compute(self.previous)
+        for column in ('id', 'days', 'hours_worked', 'overtime_pay'):
+            self.assertEqual(result[column].tolist(), expected[column][:-1].tolist(), column)
+
+    def test_summary_endpoint(self):
+        response = self.client.get(reverse('payroll'), {'month': f'{self.previous:%Y-%m}', 'department': 'Sales'})
+        self.assertEqual(response.status_code, 200)
+        data = response.data['data']
+        self.assertEqual([row['department'] for row in data['departments']], ['Sales'])
+        expected = reference_payroll(self.previous)
+        sales = [row for row in expected.values() if row['department'] == self.departments[2].pk]
+        self.assertEqual(data['totals']['headcount'], 4)
+        self.assertEqual(Decimal(data['totals']['labor_cost']), sum(row['labor_cost'] for row in sales))
+        self.assertEqual(self.client.get(reverse('payroll'), {'month': 'May'}).status_code, 400)
+
+    def test_employee_endpoint_pages(self):
+        url = reverse('payroll-employees')
+        data = self.client.get(url, {'month': f'{self.previous:%Y-%m}', 'page_size': 4}).data['data']
+        self.assertEqual(data['count'], 10)
+        self.assertEqual([row['employee'] for row in data['results']], [emp.pk for emp in self.employees[:4]])
+        last = self.client.get(data['next']).data['data']
+        last = self.client.get(last['next']).data['data']
+        self.assertEqual(last['results'][-1]['employee_name'], 'First30 Last30')
+        self.assertEqual(last['results'][-1]['overtime_pay'], '33.48')
+
+    def test_command_writes_csv(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+            call_command('compute_payroll', month=f'{self.previous:%Y-%m}', output=output.name,
+                         stdout=open(os.devnull, 'w'))
+            rows = list(csv.DictReader(open(output.name)))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[-1]['hours_worked'], '17.32')
+
+
+class EndpointBenchmarkTests(FixtureMixin, APITransactionTestCase):
+    # The async endpoints are benchmarked too, so fixtures are committed as in AsyncViewTests.
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+
+    def route_names(self, patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from self.route_names(pattern.url_patterns)
+            else:
+                yield pattern.name
+
+    def test_every_get_route_is_benchmarked(self):
+        self.assertEqual(
+            set(self.route_names(urls.urlpatterns)),
+            set(benchmark_endpoints.ENDPOINTS) | set(benchmark_endpoints.WRITE_ONLY) | set(benchmark_endpoints.STREAMING)
+        )
+
+    def test_run_and_compare_with_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_endpoints', requests=2, warmup=0, output=output, stdout=open(os.devnull, 'w'))
+            with open(output) as results:
+                baseline = json.load(results)
+            self.assertEqual(set(baseline['endpoints']), set(benchmark_endpoints.ENDPOINTS))
+            for name, result in baseline['endpoints'].items():
+                self.assertEqual((name, result['status'], result['errors']), (name, 200, 0))
+            self.assertEqual(baseline['endpoints']['department-list']['queries'], 2)
+            self.assertEqual(baseline['rows']['employees'], 9)
+
+            baseline['endpoints']['department-list']['queries'] = 1
+            with open(output, 'w') as results:
+                json.dump(baseline, results)
+            with self.assertRaisesMessage(CommandError, 'department-list: queries 1 -> 2'):
+                call_command('benchmark_endpoints', requests=2, warmup=0, endpoint=['department-list'],
+                             baseline=output, stdout=open(os.devnull, 'w'))
+
+
+class ReviewSearchTests(EmployeeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        self.reviews = [
+            self.make_review(0, 5, today, comments='Led the Kubernetes migration for R&D; Kubernetes skills grew.'),
+            self.make_review(1, 2, today - timedelta(days=400), goals='Learn Kubernetes basics'),
+            self.make_review(2, 4, today, strengths='Migrated billing to the new ledger'),
+        ]
+
+    def make_review(self, i, rating, review_date, **text):
+        fields = dict(comments='Solid delivery', goals='Lead a project', strengths='Communication',
+                      areas_for_improvement='Estimation')
+        fields.update(text)
+        return PerformanceReview.objects.create(
+            employee=self.employees[i], review_date=review_date, reviewer='Reviewer', rating=rating,
+            next_review_date=review_date + timedelta(days=180), **fields
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('performancereview-search'), params)
+        return response.status_code, response.data['data']
+
+    def test_ranked_matches_with_highlights(self):
+        status_code, data = self.search(q='kubernetes')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['count'], 2)
+        first, second = data['results']
+        self.assertEqual([first['id'], second['id']], [self.reviews[0].pk, self.reviews[1].pk])
+        self.assertGreater(first['rank'], second['rank'])
+        self.assertEqual(first['employee_name'], 'First0 Last0')
+        self.assertEqual(list(first['highlights']), ['comments'])
+        self.assertIn('<mark>Kubernetes</mark>', first['highlights']['comments'])
+        self.assertIn('R&amp;D', first['highlights']['comments'])
+        self.assertEqual(list(second['highlights']), ['goals'])
+
+    def test_words_are_stemmed_and_combined(self):
+        self.assertEqual(self.search(q='migrating')[1]['count'], 2)
+        _, data = self.search(q='kubernetes migration')
+        self.assertEqual([row['id'] for row in data['results']], [self.reviews[0].pk])
+        _, data = self.search(q='migration -kubernetes')
+        self.assertEqual([row['id'] for row in data['results']], [self.reviews[2].pk])
+
+    def test_rating_and_date_filters(self):
+        today = timezone.now().date()
+        self.assertEqual(self.search(q='kubernetes', min_rating=3)[1]['count'], 1)
+        self.assertEqual(self.search(q='kubernetes', max_rating=2)[1]['count'], 1)
+        _, data = self.search(q='kubernetes', start=str(today - timedelta(days=30)), end=str(today))
+        self.assertEqual([row['id'] for row in data['results']], [self.reviews[0].pk])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'q': 'kubernetes', 'min_rating': '9'}, {'q': 'kubernetes', 'start': 'soon'}):
+            status_code, data = self.search(**params)
+            self.assertEqual(status_code, 400, params)
+            self.assertIn('error', data)
+
+    def test_results_follow_review_changes(self):
+        self.assertEqual(self.search(q='ledger')[1]['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.reviews[2]
+            review.strengths = 'Rewrote the invoicing service'
+            review.save()
+            self.make_review(3, 3, timezone.now().date(), comments='Owns the ledger now')
+        _, data = self.search(q='ledger')
+        self.assertEqual([row['employee'] for row in data['results']], [self.employees[3].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            PerformanceReview.objects.filter(employee=self.employees[3]).delete()
+        self.assertEqual(self.search(q='ledger')[1]['count'], 0)
+
+    def test_review_index(self):
+        index = search.ReviewIndex(version=1)
+        index.add(1, 4, date(2024, 1, 1), ['Estimates were accurate', 'Estimated well'])
+        index.add(2, 2, date(2024, 2, 1), ['Estimate better'])
+        self.assertEqual([pk for pk, _ in index.search('estimating')], [1, 2])
+        index.add(1, 4, date(2024, 1, 1), ['Shipped on time'])
+        self.assertEqual([pk for pk, _ in index.search('estimate')], [2])
+        index.remove(2)
+        self.assertEqual(index.search('estimate'), [])
+        self.assertEqual(index.total_length, 2)  # shipp, time
+
+
+class RequestMetricsTests(EmployeeAPITestCase):
+
+    def server_timing(self, response):
+        entries = [entry.split(';') for entry in response['Server-Timing'].split(', ')]
+        return {name: dict(part.split('=', 1) for part in parts) for name, *parts in entries}
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('department-analytics'))
+        timing = self.server_timing(response)
+        self.assertEqual(list(timing), ['db', 'serialize', 'render', 'app', 'total'])
+        self.assertEqual(timing['db']['desc'], '"2 queries"')
+        parts = sum(float(timing[name]['dur']) for name in ('db', 'serialize', 'render', 'app'))
+        self.assertAlmostEqual(parts, float(timing['total']['dur']), delta=0.5)
+
+        with override_settings(SERVER_TIMING_HEADER=False):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('department-analytics')))
+
+    def test_serialization_excludes_queries_it_triggers(self):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            with metrics.timed('serialize'):
+                list(Employee.objects.all())
+                with metrics.timed('serialize'):
+                    pass
+        finally:
+            metrics.current.reset(token)
+        self.assertEqual(len(request_metrics.queries), 1)
+        self.assertEqual(list(request_metrics.sections), ['serialize'])
+        self.assertLess(request_metrics.section_time('serialize'), 0.05)
+
+    @override_settings(SLOW_REQUEST_MAX_QUERIES=2)
+    def test_only_the_first_queries_keep_their_sql(self):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            for employee in self.employees[:5]:
+                Employee.objects.get(pk=employee.pk)
+        finally:
+            metrics.current.reset(token)
+        self.assertEqual(request_metrics.query_count, 5)
+        self.assertEqual(len(request_metrics.queries), 2)
+        self.assertGreater(request_metrics.db_time, sum(duration for _, duration in request_metrics.queries))
+
+    def test_every_serializer_counts_as_serialize_time(self):
+        previous = partitions.add_months(partitions.month_start(timezone.now().date()), -1)
+        for name, params in [
+            ('department-analytics', {}), ('attendance-analytics', {}), ('employee-dashboard', {}),
+            ('payroll', {'month': f'{previous:%Y-%m}'}), ('payroll-employees', {'month': f'{previous:%Y-%m}'}),
+        ]:
+            with mock.patch.object(metrics.RequestMetrics, 'add_section', autospec=True,
+                                   side_effect=metrics.RequestMetrics.add_section) as add_section:
+                self.assertEqual(self.client.get(reverse(name), params).status_code, 200)
+            self.assertIn('serialize', [call.args[1] for call in add_section.call_args_list], name)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('employee-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE employees_http_request_duration_seconds histogram', body)
+        self.assertIn('employees_http_request_db_queries_bucket{route="employee-list",method="GET",le="+Inf"}', body)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_metrics_sum_every_process(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('employee-list')))
+        labels = ['employee-list', 'GET', '200']
+        other = {'employees_http_requests_total': [[labels, 5]], 'unknown_metric': [[['x'], 1]]}
+        throttling.get_store().put(f'{metrics.STORE_PREFIX}other-host:1:1', json.dumps(other))
+
+        def requests_total():
+            body = self.client.get(reverse('metrics')).content.decode()
+            line = 'employees_http_requests_total{route="employee-list",method="GET",status="200"} '
+            return next(int(row[len(line):]) for row in body.splitlines() if row.startswith(line))
+
+        own = metrics.REQUESTS.series[tuple(labels)]
+        self.assertEqual(requests_total(), own + 5)
+        self.client.get(reverse('employee-list'))
+        self.assertEqual(requests_total(), own + 6)
+
+    def test_histogram_format(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency.', ('route',), (0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(('a"b',), value)
+        self.assertEqual(list(histogram.render()), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{route="a\\"b",le="0.1"} 1',
+            'latency_seconds_bucket{route="a\\"b",le="1"} 3',
+            'latency_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+            'latency_seconds_sum{route="a\\"b"} 4.05',
+            'latency_seconds_count{route="a\\"b"} 4',
+        ])
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0, SLOW_REQUEST_MAX_QUERIES=1)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('employees.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('department-analytics'), {'location': 'Floor 3'})
+        message = logs.output[0]
+        self.assertIn('GET /api/departments/analytics/?location=Floor+3 (department-analytics) 200', message)
+        self.assertIn('2 queries', message)
+        self.assertIn('authtoken_token', message)
+        self.assertIn('... 1 more', message)
+
+
+
+class TokenCacheTests(EmployeeAPITestCase):
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('department-list'))
+        return response.status_code, sum('authtoken_token' in query['sql'] for query in ctx.captured_queries)
+
+    def test_token_is_resolved_once(self):
+        self.assertEqual(self.token_queries(), (200, 1))
+        self.assertEqual(self.token_queries(), (200, 0))
+
+    def test_deleted_token_is_rejected(self):
+        self.token_queries()
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.token_queries(), (401, 1))
+
+    def test_deactivated_user_is_rejected(self):
+        self.token_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.token_queries(), (401, 1))
+
+    def test_logging_in_keeps_cached_tokens(self):
+        self.token_queries()
+        self.client.login(username='tester', password='secret')
+        self.assertEqual(self.token_queries(), (200, 0))
+
+    def test_revocation_in_another_process(self):
+        self.token_queries()
+        # Another worker's signal handler bumps the version; the response cache plays no part.
+        cache.clear()
+        worker = multiprocessing.get_context('fork').Process(target=authentication.bump_auth_version)
+        worker.start()
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(self.token_queries(), (200, 1))
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_entries_expire(self):
+        self.token_queries()
+        self.assertEqual(self.token_queries(), (200, 1))
+
+    @override_settings(TOKEN_CACHE_SIZE=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        tokens = authentication.TokenCache()
+        for key in ('a', 'b'):
+            tokens.put(key, self.user, key, 1)
+        tokens.get('a', 1)
+        tokens.put('c', self.user, 'c', 1)
+        self.assertEqual(list(tokens.entries), ['a', 'c'])
+        self.assertIsNone(tokens.get('b', 1))
+        self.assertIsNone(tokens.get('a', 2))
+
+
+class LoggingTests(EmployeeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Leave every request out of the SQL log sample.
+        self.sampling = mock.patch('employees.log.random.random', return_value=1.0)
+
+    def make_handler(self, **kwargs):
+        handler = log.QueuedRotatingFileHandler(os.path.join(self.directory, 'app-{pid}.log'), **kwargs)
+        handler.setFormatter(log.JSONFormatter())
+        self.addCleanup(handler.close)
+        return handler
+
+    def read_lines(self, name):
+        with open(os.path.join(self.directory, name.format(pid=os.getpid()))) as lines:
+            return [json.loads(line) for line in lines]
+
+    def test_json_lines(self):
+        handler = self.make_handler()
+        logger = logging.getLogger('employees.tests')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.warning('Took %d ms', 12, extra={'route': 'payroll'})
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            logger.exception('Failed')
+        handler.close()
+
+        first, second = self.read_lines('app-{pid}.log')
+        self.assertEqual(first['message'], 'Took 12 ms')
+        self.assertEqual(first['level'], 'WARNING')
+        self.assertEqual(first['route'], 'payroll')
+        self.assertEqual(first['process'], os.getpid())
+        self.assertIn('ValueError: bad', second['exception'])
+
+    def test_rotation(self):
+        handler = self.make_handler(maxBytes=1000, backupCount=2)
+        for i in range(100):
+            handler.handle(logging.makeLogRecord({'msg': f'record {i}'}))
+        handler.close()
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(len(files), 3)
+        self.assertEqual(self.read_lines('app-{pid}.log')[-1]['message'], 'record 99')
+
+    def test_full_queue_drops_records(self):
+        handler = self.make_handler(queue_size=2)
+        handler.listener.stop()
+        for i in range(5):
+            handler.handle(logging.makeLogRecord({'msg': f'record {i}'}))
+        self.assertEqual(handler.dropped, 3)
+
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        handler.handle(logging.makeLogRecord({'msg': 'record 5'}))
+        self.assertEqual(handler.dropped, 0)
+        queued = [json.loads(handler.queue.get_nowait().getMessage())['message'] for _ in range(2)]
+        self.assertEqual(queued, ['Log queue full, dropped 3 records', 'record 5'])
+        handler.listener = None
+
+    def test_unsampled_queries_are_dropped(self):
+        with self.sampling, CaptureQueriesContext(connection), self.assertNoLogs('django.db.backends', 'DEBUG'):
+            self.client.get(reverse('department-analytics'))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_queries_of_slow_requests_are_kept(self):
+        with self.sampling, CaptureQueriesContext(connection), \
+                self.assertLogs('django.db.backends', 'DEBUG') as logs:
+            self.client.get(reverse('department-analytics'))
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('authtoken_token', logs.records[0].getMessage())
+
+class ThrottlingTests(EmployeeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'throttle.sqlite3')
+        self.addCleanup(throttling._stores.pop, self.path, None)
+
+    def test_gcra_allows_a_burst_then_the_steady_rate(self):
+        tat = None
+        for _ in range(3):
+            allowed, tat, wait = throttling.gcra(tat, 1000.0, 3, 60)
+            self.assertTrue(allowed)
+        allowed, _, wait = throttling.gcra(tat, 1000.0, 3, 60)
+        self.assertEqual((allowed, wait), (False, 20.0))
+        self.assertTrue(throttling.gcra(tat, 1020.0, 3, 60)[0])
+
+    def test_gcra_allows_every_request_of_a_burst(self):
+        # period / limit doesn't add up to period exactly for these.
+        now = 1.7e9 + 0.123
+        for limit, period in [(5, 1), (13, 1), (100, 60), (1000, 86400)]:
+            tat = None
+            for _ in range(limit):
+                allowed, tat, _ = throttling.gcra(tat, now, limit, period)
+                self.assertTrue(allowed, (limit, period))
+            self.assertFalse(throttling.gcra(tat, now, limit, period)[0], (limit, period))
+
+    def test_file_store_is_shared_between_processes(self):
+        # Each process opens the file with its own store.
+        first, second = throttling.FileStore(self.path), throttling.FileStore(self.path)
+        self.assertTrue(first.hit('throttle_user_1', 2, 60)[0])
+        self.assertTrue(second.hit('throttle_user_1', 2, 60)[0])
+        allowed, wait = first.hit('throttle_user_1', 2, 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30, delta=1)
+        self.assertTrue(second.hit('throttle_user_2', 2, 60)[0])
+
+    def test_endpoints_have_their_own_budgets(self):
+        with override_settings(THROTTLE_STORE=self.path), \
+                mock.patch.object(throttling.ScopedRateThrottle, 'THROTTLE_RATES', {'analytics': '2/minute'}):
+            for _ in range(2):
+                self.assertEqual(self.client.get(reverse('department-analytics')).status_code, 200)
+            response = self.client.get(reverse('attendance-analytics'))
+            self.assertEqual(response.status_code, 429)
+            self.assertAlmostEqual(int(response['Retry-After']), 30, delta=1)
+            # Cheap endpoints without a scope keep only the per-user budget.
+            self.assertEqual(self.client.get(reverse('employee-list')).status_code, 200)
+            # Viewset actions can name a scope too.
+            self.assertEqual(self.client.get(reverse('employee-rollup', args=[self.employees[0].pk])).status_code, 429)
+
+    def test_user_budget_is_shared(self):
+        with override_settings(THROTTLE_STORE=self.path), \
+                mock.patch.object(throttling.UserRateThrottle, 'THROTTLE_RATES', {'user': '3/hour'}):
+            for _ in range(3):
+                self.assertEqual(self.client.get(reverse('employee-list')).status_code, 200)
+            # Another process sees the same state.
+            throttling._stores.pop(self.path)
+            self.assertEqual(self.client.get(reverse('department-list')).status_code, 429)
+
+
+class AttendanceBulkUpsertTests(EmployeeAPITestCase):
+
+    def test_creates_merges_and_reports_per_row(self):
+        url = reverse('attendance-bulk-upsert')
+        day = '2021-03-01'
+        employee = self.employees[0]
+        existing = Attendance.objects.filter(employee=employee).first()
+        records = [
+            {'employee': employee.pk, 'date': day, 'check_in': '09:00'},
+            {'employee': employee.pk, 'date': day, 'check_out': '18:30'},
+            {'employee': self.employees[1].pk, 'date': day, 'check_in': '22:00', 'check_out': '06:00', 'status': 'LT'},
+            {'employee': existing.employee_id, 'date': str(existing.date), 'check_in': '08:00', 'check_out': '12:00', 'status': 'HD'},
+            {'employee': 999999, 'date': day},
+            {'employee': employee.pk, 'date': '2021-02-30'},
+            {'employee': employee.pk, 'date': day, 'status': 'XX'},
+        ]
+        # auth, employee check, missing rows, locked existing rows, upsert,
+        # summary refresh with its row lock (+ savepoints); independent of the
+        # number of records
+        with self.assertNumQueries(17):
+            response = self.client.post(url, records, format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.data['data']
+        self.assertEqual((data['created'], data['updated'], data['failed']), (3, 1, 3))
+        self.assertEqual([row['result'] for row in data['results']],
+                         ['created', 'created', 'created', 'updated', 'error', 'error', 'error'])
+
+        merged = Attendance.objects.get(employee=employee, date=day)
+        self.assertEqual(merged.hours_worked, Decimal('9.50'))
+        self.assertEqual(merged.overtime_hours, Decimal('1.50'))
+        overnight = Attendance.objects.get(employee=self.employees[1], date=day)
+        self.assertEqual((overnight.hours_worked, overnight.status), (Decimal('8.00'), 'LT'))
+        existing.refresh_from_db()
+        self.assertEqual((existing.status, existing.hours_worked), ('HD', Decimal('4.00')))
+        self.assertEqual(
+            AttendanceDailySummary.objects.filter(date=day).aggregate(total=Sum('total_count'))['total'], 2
+        )
+
+    def test_rejects_oversized_batches(self):
+        with self.settings(ATTENDANCE_BULK_MAX_RECORDS=1):
+            response = self.client.post(reverse('attendance-bulk-upsert'), [{}, {}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentBulkUpsertTests(FixtureMixin, APITransactionTestCase):
+    # Each request runs in its own thread and transaction.
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+
+    def test_concurrent_events_for_a_day_merge(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('SQLite runs one write transaction at a time')
+        employee = self.employees[0]
+        days = [date(2021, 4, day) for day in range(1, 11)]
+        barrier = threading.Barrier(2)
+
+        def post(field, value):
+            try:
+                for day in days:
+                    barrier.wait()
+                    bulk.upsert_attendance([{'employee': employee.pk, 'date': str(day), field: value}])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post, args=args) for args in [('check_in', '09:00'), ('check_out', '17:30')]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = Attendance.objects.filter(employee=employee, date__in=days)
+        self.assertEqual(
+            sorted((str(check_in), str(check_out), hours)
+                   for check_in, check_out, hours in rows.values_list('check_in', 'check_out', 'hours_worked')),
+            [('09:00:00', '17:30:00', Decimal('8.50'))] * len(days)
+        )
+        self.assertEqual(
+            AttendanceDailySummary.objects.filter(date__in=days).aggregate(total=Sum('total_count'))['total'],
+            len(days)
+        )
+
+
+class ResponseCacheTests(EmployeeAPITestCase):
+
+    def test_repeat_requests_are_served_from_cache(self):
+        url = reverse('employee-dashboard')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):  # the token is cached too
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        url = reverse('department-analytics')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_writes_invalidate(self):
+        url = reverse('employee-dashboard')
+        before = self.client.get(url).data['data']['total_employees']
+        self.make_employee(50, self.departments[0])
+        self.assertEqual(self.client.get(url).data['data']['total_employees'], before + 1)
+        Attendance.objects.filter(date=timezone.now().date()).update(status='AB')
+        response = self.client.get(reverse('attendance-analytics'))
+        today = next(row for row in response.data['data'] if row['date'] == str(timezone.now().date()))
+        self.assertEqual(today['present_count'], 0)
+
+    def test_bulk_writes_bump_the_version_after_commit(self):
+        today = timezone.now().date()
+        writes = [
+            lambda: Department.objects.filter(pk=self.departments[0].pk).update(location='Floor 4'),
+            lambda: Department.objects.bulk_create([Department(
+                name='Legal', location='Floor 5', budget=Decimal(1000), established_date=today,
+                head_of_department='Head', email='legal@company.com',
+            )]),
+            lambda: Employee.objects.filter(pk=self.employees[0].pk).update(job_title='Lead'),
+            lambda: PerformanceReview.objects.filter(employee=self.employees[0]).update(rating=5),
+            lambda: Attendance.objects.filter(date=today).update(notes='Checked'),
+            lambda: Attendance.objects.filter(date=today).update(status='AB'),
+        ]
+        for write in writes:
+            before = data_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+                self.assertEqual(data_version(), before)
+            self.assertGreater(data_version(), before)
+
+    def test_query_params_are_part_of_the_key(self):
+        url = reverse('department-analytics')
+        everyone = self.client.get(url).data['data']
+        interns = self.client.get(url, {'employment_type': 'IN'}).data['data']
+        self.assertNotEqual(everyone, interns)
+
+    def test_cold_cache_is_computed_once(self):
+        calls = []
+
+        @api_view(['GET'])
+        @authentication_classes([])
+        @permission_classes([AllowAny])
+        @cached_response(wait_interval=0.01)
+        def slow_view(request):
+            calls.append(1)
+            time.sleep(0.2)
+            return Response({'is_v1': True, 'data': {'value': 42}})
+
+        factory = APIRequestFactory()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(slow_view(factory.get('/slow/')).data))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'is_v1': True, 'data': {'value': 42}}] * 5)
+
+
+class DashboardSnapshotTests(EmployeeAPITestCase):
+    url = reverse('dashboard-snapshot')
+
+    def test_snapshot_has_everything_the_dashboard_shows(self):
+        data = self.client.get(self.url).json()['data']
+        self.assertEqual(data['summary'], self.client.get(reverse('employee-dashboard')).json()['data'])
+        self.assertEqual(data['departments'], self.client.get(reverse('department-analytics')).json()['data'])
+        today = timezone.now().date()
+        self.assertEqual(set(data['attendance']), {'30', '90', '365', '730'})
+        week = self.client.get(reverse('attendance-analytics'), {
+            'start': str(today - timedelta(days=90)), 'granularity': 'week'
+        }).json()['data']
+        self.assertEqual(data['attendance']['90'], week)
+
+    def test_gzip_and_conditional_get(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_outdated_snapshot_is_served_while_refreshing(self):
+        before = self.client.get(self.url).json()['data']['summary']['total_employees']
+        self.make_employee(50, self.departments[0])
+        with mock.patch('employees.snapshot.refresh_in_background') as refresh:
+            # Young enough to be served as is.
+            self.client.get(self.url)
+            refresh.assert_not_called()
+            with override_settings(DASHBOARD_SNAPSHOT_REFRESH_SECONDS=0):
+                stale = self.client.get(self.url).json()['data']['summary']['total_employees']
+            refresh.assert_called_once()
+        self.assertEqual(stale, before)
+        snapshot.build()
+        self.assertEqual(self.client.get(self.url).json()['data']['summary']['total_employees'], before + 1)
+
+    def test_snapshot_from_an_earlier_day_is_rebuilt_inline(self):
+        first = self.client.get(self.url)
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('employees.snapshot.timezone.now', return_value=tomorrow):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(snapshot.stored_snapshot().day, tomorrow.date())
+
+    def test_refresh_command(self):
+        with self.assertRaisesMessage(CommandError, 'set CACHE_URL to a shared cache'):
+            call_command('refresh_dashboard_snapshot')
+        self.assertIsNone(snapshot.stored_snapshot())
+        with mock.patch.object(snapshot, 'cache_is_shared', return_value=True):
+            output = StringIO()
+            call_command('refresh_dashboard_snapshot', stdout=output)
+            self.assertIn('Built dashboard snapshot', output.getvalue())
+            output = StringIO()
+            call_command('refresh_dashboard_snapshot', stdout=output)
+            self.assertIn('is current', output.getvalue())
+        etag = snapshot.stored_snapshot().etag
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+
+
+class AsyncViewTests(FixtureMixin, APITransactionTestCase):
+    # Async views query from worker threads with their own connections, so the
+    # fixtures must be committed rather than wrapped in a test transaction.
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_async_views_match_sync_views(self):
+        for sync_name, async_name in [
+            ('employee-dashboard', 'async-employee-dashboard'),
+            ('department-analytics', 'async-department-analytics'),
+            ('attendance-analytics', 'async-attendance-analytics'),
+        ]:
+            expected = self.client.get(reverse(sync_name), {'employment_type': 'FT'})
+            actual = self.client.get(reverse(async_name), {'employment_type': 'FT'})
+            self.assertEqual(actual.status_code, 200)
+            self.assertEqual(actual.content, expected.content, async_name)
+
+    def test_async_views_require_a_valid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(self.client.get(reverse('async-employee-dashboard')).status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('async-employee-dashboard')).status_code, 401)
+
+    def test_async_views_share_the_token_cache(self):
+        url = reverse('async-department-analytics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in ctx.captured_queries))
+        self.token.delete()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_async_views_are_throttled(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'throttle.sqlite3')
+        self.addCleanup(throttling._stores.pop, path, None)
+        with override_settings(THROTTLE_STORE=path), \
+                mock.patch.object(throttling.ScopedRateThrottle, 'THROTTLE_RATES', {'analytics': '2/minute'}):
+            # The budget is shared with the sync endpoints of the same scope.
+            self.assertEqual(self.client.get(reverse('department-analytics')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('async-department-analytics')).status_code, 200)
+            for name in ('async-employee-dashboard', 'async-department-analytics', 'async-attendance-analytics'):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 429, name)
+                self.assertAlmostEqual(int(response['Retry-After']), 30, delta=1)
+        with override_settings(THROTTLE_STORE=path), \
+                mock.patch.object(throttling.UserRateThrottle, 'THROTTLE_RATES', {'user': '1/hour'}):
+            # The requests above spent it; the live feed counts against it too.
+            self.assertEqual(self.client.get(reverse('attendance-live')).status_code, 429)
+
+    def test_async_views_cache_responses(self):
+        url = reverse('async-department-analytics')
+        with mock.patch('employees.async_views.department_analytics_data',
+                        side_effect=analytics.department_analytics_data) as compute:
+            first = self.client.get(url)
+            self.assertEqual(self.client.get(url).content, first.content)
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.make_employee(50, self.departments[0])
+            self.assertNotEqual(self.client.get(url).content, first.content)
+            self.assertEqual(compute.call_count, 2)
+
+    @override_settings(DASHBOARD_SNAPSHOT_REFRESH_SECONDS=0)
+    def test_dashboard_snapshot_refreshes_in_background(self):
+        url = reverse('dashboard-snapshot')
+        before = self.client.get(url).json()['data']['summary']['total_employees']
+        self.make_employee(50, self.departments[0])
+        self.assertEqual(self.client.get(url).json()['data']['summary']['total_employees'], before)
+        deadline = time.monotonic() + 10
+        while cache.get(snapshot.REFRESH_LOCK_KEY) is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.client.get(url).json()['data']['summary']['total_employees'], before + 1)
+
+
+class LiveFeedTests(FixtureMixin, APITransactionTestCase):
+    # Changes are published on commit, so the fixtures must be committed.
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+        self.feed = live.LiveFeed(background=False)
+        patcher = mock.patch('employees.live.feed', self.feed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flush(self):
+        """Run a flush, returning how many queries it took."""
+        with CaptureQueriesContext(connection) as queries:
+            self.feed.flush()
+        return len(queries)
+
+    async def primed(self):
+        subscription = self.feed.subscribe()
+        await sync_to_async(self.flush)()
+        return subscription, self.event(await subscription.queue.get())
+
+    @staticmethod
+    def event(message):
+        lines = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+        return json.loads(lines['data'])
+
+    async def test_one_message_serves_every_subscriber(self):
+        first, second = self.feed.subscribe(), self.feed.subscribe()
+        await sync_to_async(self.flush)()
+        primed = await first.queue.get()
+        self.assertIs(await second.queue.get(), primed)
+        self.assertEqual(self.event(primed)['changes'], [])
+        self.assertEqual(self.event(primed)['counts']['total_count'], 9)
+
+        def change_attendance():
+            employee = self.make_employee(50, self.departments[0])
+            row = Attendance.objects.create(employee=employee, date=timezone.now().date(), status='PR',
+                                            check_in='09:00')
+            row.status = 'LT'
+            row.save()
+            Attendance.objects.filter(date=timezone.now().date(), employee=self.employees[0]).delete()
+            # Not today: not published.
+            Attendance.objects.create(employee=employee, date=date(2021, 3, 1))
+            return employee.pk
+
+        employee = await sync_to_async(change_attendance)()
+        self.assertEqual(await sync_to_async(self.flush)(), 1)
+        message = await first.queue.get()
+        self.assertIs(await second.queue.get(), message)
+        event = self.event(message)
+        self.assertEqual(event['changes'], [
+            {'type': 'checkin', 'employee': employee, 'status': 'PR', 'check_in': '09:00:00'},
+            {'type': 'status', 'employee': employee, 'status': 'LT', 'previous_status': 'PR'},
+            {'type': 'removed', 'employee': self.employees[0].pk, 'status': 'PR'},
+        ])
+        self.assertEqual(event['counts']['total_count'], 9)
+        self.assertEqual(event['counts']['late_count'], 3)
+        self.assertEqual(event['counts']['present_count'], 1)
+
+        # Nothing changed: nothing sent, nothing queried.
+        self.assertEqual(await sync_to_async(self.flush)(), 0)
+        self.assertTrue(first.queue.empty())
+
+    async def test_writes_without_events_update_the_counts(self):
+        subscription, _ = await self.primed()
+        await sync_to_async(Attendance.objects.filter(date=timezone.now().date()).update)(status='AB')
+        await sync_to_async(self.feed.flush)()
+        event = self.event(await subscription.queue.get())
+        self.assertEqual(event['changes'], [])
+        self.assertEqual(event['counts']['absent_count'], 9)
+
+    async def test_writes_of_other_processes_show_up_on_the_next_poll(self):
+        subscription, _ = await self.primed()
+
+        def write_elsewhere():
+            # Another process's write: its data version bump lands in its own cache.
+            with mock.patch('employees.cache.bump_version'), mock.patch('employees.live.publish'):
+                Attendance.objects.filter(date=timezone.now().date()).update(status='AB')
+
+        await sync_to_async(write_elsewhere)()
+        self.assertEqual(await sync_to_async(self.flush)(), 0)
+        self.assertTrue(subscription.queue.empty())
+        with override_settings(LIVE_FEED_POLL_SECONDS=0):
+            self.assertEqual(await sync_to_async(self.flush)(), 1)
+        self.assertEqual(self.event(await subscription.queue.get())['counts']['absent_count'], 9)
+
+    async def test_bulk_upsert_publishes_todays_changes(self):
+        subscription, _ = await self.primed()
+        today = str(timezone.now().date())
+        employee = await sync_to_async(self.make_employee)(50, self.departments[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = await sync_to_async(self.client.post)(reverse('attendance-bulk-upsert'), [
+            {'employee': employee.pk, 'date': today, 'check_in': '08:30'},
+            {'employee': self.employees[0].pk, 'date': today, 'status': 'AB'},
+            {'employee': self.employees[1].pk, 'date': today, 'notes': 'Unchanged status'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        await sync_to_async(self.feed.flush)()
+        event = self.event(await subscription.queue.get())
+        self.assertEqual(event['changes'], [
+            {'type': 'checkin', 'employee': employee.pk, 'status': 'PR', 'check_in': '08:30:00'},
+            {'type': 'status', 'employee': self.employees[0].pk, 'status': 'AB', 'previous_status': 'PR'},
+        ])
+        self.assertEqual(event['counts']['total_count'], 10)
+
+    async def test_slow_subscriber_is_dropped(self):
+        subscription = self.feed.subscribe()
+        for _ in range(live.SUBSCRIBER_QUEUE_SIZE + 1):
+            subscription.deliver(b'data: {}\n\n')
+        self.assertTrue(subscription.lagging)
+
+    async def test_event_stream(self):
+        url = reverse('attendance-live')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(url, headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content
+        self.assertEqual(await anext(events), b'retry: 1000\n\n')
+        flush = asyncio.ensure_future(sync_to_async(self.feed.flush)())
+        self.assertEqual(self.event(await anext(events))['counts']['total_count'], 9)
+        await flush
+        with override_settings(LIVE_FEED_KEEPALIVE_SECONDS=0.01):
+            self.assertEqual(await anext(events), live.KEEPALIVE)
+        await events.aclose()
+
+    async def test_stream_ends_and_unsubscribes(self):
+        with override_settings(LIVE_FEED_MAX_SECONDS=0.05, LIVE_FEED_KEEPALIVE_SECONDS=1):
+            chunks = [chunk async for chunk in live.stream(self.feed)]
+        self.assertEqual(chunks, [b'retry: 1000\n\n', live.KEEPALIVE])
+        self.assertEqual(self.feed.subscribers, set())
+        events = live.stream(self.feed)
+        await anext(events)
+        self.assertEqual(len(self.feed.subscribers), 1)
+        await events.aclose()
+        self.assertEqual(self.feed.subscribers, set())
+
+    def test_wsgi_is_refused(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get(reverse('attendance-live')).status_code, 501)
+
+
+class SparseFieldsetTests(EmployeeAPITestCase):
+
+    def test_fields_trim_output_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('employee-list'), {'fields': 'id,first_name,department_name,unknown'})
+        self.assertEqual(response.status_code, 200)
+        for row in response.data['data']['results']:
+            self.assertEqual(set(row), {'id', 'first_name', 'department_name'})
+        select = queries.captured_queries[-1]['sql']
+        self.assertIn('"employees_department"."name"', select)
+        self.assertNotIn('"address"', select)
+        self.assertNotIn('"manager_id"', select)
+
+    def test_fields_keep_keyset_pagination_working(self):
+        url = reverse('attendance-list')
+        first = self.client.get(url, {'fields': 'status', 'page_size': 10})
+        self.assertEqual(first.data['data']['results'][0], {'status': first.data['data']['results'][0]['status']})
+        second = self.client.get(first.data['data']['next'])
+        self.assertEqual(len(second.data['data']['results']), 10)
+
+    def test_retrieve_honours_fields(self):
+        response = self.client.get(reverse('department-detail', args=[self.departments[0].pk]), {'fields': 'name'})
+        self.assertEqual(response.data, {'name': 'Engineering'})
+
+    def test_includes_use_a_fixed_number_of_queries(self):
+        url = reverse('employee-list')
+        params = {
+            'include': 'attendances,performance_reviews', 'fields': 'id,last_name',
+            'fields[attendances]': 'date,status', 'fields[performance_reviews]': 'rating',
+        }
+        self.client.get(url, params)
+        # count, page, one prefetch per include; the token is cached by now
+        with self.assertNumQueries(4):
+            response = self.client.get(url, params)
+        row = next(row for row in response.data['data']['results'] if row['id'] == self.employees[0].pk)
+        self.assertEqual(len(row['attendances']), 5)
+        self.assertEqual(set(row['attendances'][0]), {'date', 'status'})
+        self.assertEqual(row['performance_reviews'], [{'rating': 1}])
+        for i in range(10, 20):
+            self.make_employee(i, self.departments[0])
+        with self.assertNumQueries(4):
+            self.client.get(url, dict(params, page_size=100))
+
+    def test_to_one_include_is_joined(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('attendance-list'), {
+                'include': 'employee', 'fields[employee]': 'first_name,department_name,manager_name',
+            })
+        employee = response.data['data']['results'][0]['employee']
+        self.assertEqual(set(employee), {'first_name', 'department_name', 'manager_name'})
+
+    def test_employee_count_is_skipped_when_not_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('department-list'), {'fields': 'name'})
+        self.assertEqual(response.data['data']['results'][0], {'name': 'Engineering'})
+        self.assertNotIn('COUNT("employees_employee"', queries.captured_queries[-1]['sql'])
+
+
+class FastListTests(EmployeeAPITestCase):
+
+    def assert_same_as_serializers(self, url, params=None):
+        fast = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200)
+        with override_settings(API_FAST_LIST_SERIALIZATION=False):
+            slow = self.client.get(url, params)
+        self.assertEqual(fast.content, JSONRenderer().render(slow.data), url)
+        return json.loads(fast.content)['data']
+
+    def test_output_matches_serializers_byte_for_byte(self):
+        self.make_employee(20, self.departments[1], first_name='Zoë', last_name='O\u2028Brien\x01', address='Straße "7"')
+        Attendance.objects.filter(employee=self.employees[1]).update(hours_worked=None, check_in=None)
+        for name in ['department-list', 'employee-list', 'attendance-list', 'performancereview-list']:
+            self.assert_same_as_serializers(reverse(name))
+        self.assert_same_as_serializers(reverse('attendance-list'), {'page_size': 500})
+        self.assert_same_as_serializers(reverse('attendance-list'), {'page': 2, 'page_size': 7})
+
+    def test_names_and_fields(self):
+        rows = self.assert_same_as_serializers(reverse('employee-list'), {'fields': 'first_name,manager_name'})['results']
+        self.assertIn({'manager_name': 'First0 Last0', 'first_name': 'First3'}, rows)
+        self.assertIn({'manager_name': None, 'first_name': 'First0'}, rows)
+        rows = self.assert_same_as_serializers(reverse('attendance-list'), {'fields': 'employee_name,hours_worked'})['results']
+        self.assertEqual(rows[0]['hours_worked'], '8.00')
+
+    def test_keyset_cursors_work_with_rows(self):
+        url = reverse('performancereview-list')
+        first = self.assert_same_as_serializers(url, {'page_size': 4})
+        second = self.client.get(first['next']).data['data']
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 8)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(EmployeeAPITestCase):
+    # The replica is a separate, migrated but empty SQLite file, so a read
+    # served from it sees no rows while the primary holds the fixtures. The
+    # alias only exists while this class runs.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.databases = {'default', 'replica'}
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings['replica'] = dict(
+            connections['default'].settings_dict, ENGINE='django.db.backends.sqlite3',
+            NAME=os.path.join(cls.replica_dir, 'replica.sqlite3'), TEST={'MIRROR': None},
+        )
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def test_router_uses_replicas_only_inside_a_read_scope(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Employee), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Employee), 'replica')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Employee), 'default')
+
+    def test_reads_go_to_the_replica(self):
+        response = self.client.get(reverse('employee-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['count'], 0)
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        response = self.client.post(reverse('department-list'), {
+            'name': 'Support', 'location': 'Floor 4', 'budget': '100000.00',
+            'established_date': '2021-01-01', 'head_of_department': 'Head', 'email': 'support@company.com',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Department.objects.using('default').filter(name='Support').exists())
+        self.assertFalse(Department.objects.using('replica').exists())
+
+        # Within the pin window the writer reads its own write from the primary,
+        # also when another worker process, with its own caches, serves it.
+        cache.clear()
+        throttling._stores.clear()
+        response = self.client.get(reverse('department-detail', args=[response.data['id']]))
+        self.assertEqual(response.data['name'], 'Support')
+
+        # Other clients keep reading from the replica.
+        other = User.objects.create_user('other')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        self.assertEqual(self.client.get(reverse('department-list')).data['data']['count'], 0)
+
+    def test_pin_expires(self):
+        self.client.delete(reverse('employee-detail', args=[self.employees[8].pk]))
+        self.assertEqual(self.client.get(reverse('employee-list')).data['data']['count'], 8)
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            self.client.delete(reverse('employee-detail', args=[self.employees[7].pk]))
+            self.assertEqual(self.client.get(reverse('employee-list')).data['data']['count'], 0)
+
+    def test_cache_fills_after_a_write_use_the_primary(self):
+        self.assertEqual(self.client.get(reverse('employee-dashboard')).data['data']['total_employees'], 0)
+        # Right after a write by anyone, a lagging replica must not be cached
+        # under the new data version.
+        self.make_employee(50, self.departments[0])
+        self.assertEqual(self.client.get(reverse('employee-dashboard')).data['data']['total_employees'], 10)
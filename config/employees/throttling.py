@@ -0,0 +1,255 @@
+"""
+Rate limiting shared by every worker process.
+
+DRF's throttles keep a list of request timestamps per client in the default
+cache, which is local to each process unless a shared cache is configured.
+These throttles keep a single number per client instead, its theoretical
+arrival time (GCRA, a token bucket in one value): each request pushes it
+forward by period / limit, and a request is refused when that would move it
+more than one period past now. That allows bursts of up to `limit` requests
+and then the steady rate.
+
+The numbers live in THROTTLE_STORE: a SQLite file shared by the processes
+on one host (the default), or a Redis server shared across hosts. The store
+also keeps the little state other features need every process to agree on
+whatever the cache backend: version counters (token revocation), marks
+that expire (read-your-writes pins) and values stored by key (each process's
+request metrics).
+"""
+import os
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import exceptions, throttling
+from rest_framework.settings import api_settings
+
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+# Seconds a tat may exceed one period by: `limit` float increments of
+# period / limit can add up to a hair more than period, which would refuse
+# the last request of a full burst. Far below any interval a rate can set.
+TOLERANCE = 0.001
+
+
+def gcra(tat, now, limit, period):
+    """Return (allowed, new tat, seconds to wait) for one request against a stored tat."""
+    new_tat = max(tat or 0.0, now) + period / limit
+    if new_tat - now > period + TOLERANCE:
+        return False, tat, new_tat - period - now
+    return True, new_tat, 0.0
+
+
+class FileStore:
+    """
+    GCRA state in a SQLite file. Each check is one short write transaction;
+    WAL mode without fsync keeps that to tens of microseconds, and losing the
+    last few updates in a crash is harmless.
+    """
+    purge_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        # One connection per thread, and a new one after a fork.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS throttle (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS counter (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS mark (key TEXT PRIMARY KEY, expires REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS blob (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.local.connection, self.local.pid, self.local.hits = connection, os.getpid(), 0
+        return self.local.connection
+
+    def hit(self, key, limit, period):
+        connection = self.connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tat FROM throttle WHERE key = ?', (key,)).fetchone()
+            allowed, tat, wait = gcra(row and row[0], now, limit, period)
+            if allowed:
+                connection.execute('INSERT OR REPLACE INTO throttle (key, tat) VALUES (?, ?)', (key, tat))
+            self.local.hits += 1
+            if self.local.hits % self.purge_every == 0:
+                # A tat in the past means a full bucket, the same as no row.
+                connection.execute('DELETE FROM throttle WHERE tat < ?', (now,))
+                connection.execute('DELETE FROM mark WHERE expires < ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, wait
+
+    def version(self, key):
+        row = self.connection().execute('SELECT value FROM counter WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, key):
+        self.connection().execute(
+            'INSERT INTO counter (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1', (key,)
+        )
+
+    def mark(self, key, seconds):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO mark (key, expires) VALUES (?, ?)', (key, time.time() + seconds)
+        )
+
+    def marked(self, key):
+        row = self.connection().execute('SELECT expires FROM mark WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def put(self, key, value):
+        self.connection().execute('INSERT OR REPLACE INTO blob (key, value) VALUES (?, ?)', (key, value))
+
+    def values(self, prefix):
+        rows = self.connection().execute(
+            'SELECT value FROM blob WHERE substr(key, 1, ?) = ?', (len(prefix), prefix)
+        ).fetchall()
+        return [value for value, in rows]
+
+    def clear(self):
+        connection = self.connection()
+        connection.execute('DELETE FROM throttle')
+        connection.execute('DELETE FROM mark')
+        connection.execute('DELETE FROM blob')
+
+
+class RedisStore:
+    """GCRA state in Redis, updated by a Lua script on the server's clock; keys expire once full again."""
+    script = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local interval, period, tolerance = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now) + interval
+    if tat - now > period + tolerance then
+        return {0, tostring(tat - period - now)}
+    end
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+    return {1, '0'}
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('A Redis THROTTLE_STORE needs the redis package (pip install redis).')
+        self.client = redis.Redis.from_url(url)
+        self.gcra = self.client.register_script(self.script)
+
+    def hit(self, key, limit, period):
+        allowed, wait = self.gcra(keys=[f'employees:{key}'], args=[period / limit, period, TOLERANCE])
+        return bool(allowed), float(wait)
+
+    def version(self, key):
+        return int(self.client.get(f'employees:counter:{key}') or 0)
+
+    def bump(self, key):
+        self.client.incr(f'employees:counter:{key}')
+
+    def mark(self, key, seconds):
+        self.client.set(f'employees:mark:{key}', 1, px=max(int(seconds * 1000), 1))
+
+    def marked(self, key):
+        return bool(self.client.exists(f'employees:mark:{key}'))
+
+    def put(self, key, value):
+        self.client.set(f'employees:blob:{key}', value)
+
+    def values(self, prefix):
+        keys = list(self.client.scan_iter(f'employees:blob:{prefix}*'))
+        return [value.decode() for value in self.client.mget(keys) if value is not None] if keys else []
+
+    def clear(self):
+        for pattern in ('employees:throttle_*', 'employees:mark:*', 'employees:blob:*'):
+            for key in self.client.scan_iter(pattern):
+                self.client.delete(key)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    location = settings.THROTTLE_STORE
+    store = _stores.get(location)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(location)
+            if store is None:
+                if location.startswith(REDIS_SCHEMES):
+                    store = RedisStore(location)
+                else:
+                    store = FileStore(location.removeprefix('file://'))
+                _stores[location] = store
+    return store
+
+
+class SharedRateThrottle(throttling.SimpleRateThrottle):
+    """SimpleRateThrottle checked against THROTTLE_STORE with GCRA instead of a cached timestamp list."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self.retry_after = get_store().hit(self.key, self.num_requests, self.duration)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SharedRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SharedRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SharedRateThrottle):
+    """
+    Per-endpoint budgets: views name a throttle_scope whose rate is in
+    DEFAULT_THROTTLE_RATES, and viewset actions can name their own.
+    """
+
+    def allow_request(self, request, view):
+        handler = getattr(view, getattr(view, 'action', None) or '', None)
+        scope = getattr(handler, 'throttle_scope', None)
+        if scope is not None:
+            view = SimpleNamespace(throttle_scope=scope)
+        return super().allow_request(request, view)
+
+
+def throttle_scope(scope):
+    """Set the throttle scope of an @api_view function or a viewset action; apply above @api_view/@action."""
+    def decorator(view):
+        if hasattr(view, 'cls'):
+            view.cls.throttle_scope = scope
+        else:
+            view.throttle_scope = scope
+        return view
+    return decorator
+
+
+def check_throttles(request, scope=None):
+    """
+    APIView.check_throttles() for views outside DRF, on a request whose user
+    is set: raises Throttled when one of the default throttles refuses it.
+    """
+    view = SimpleNamespace(throttle_scope=scope)
+    durations = [
+        throttle.wait()
+        for throttle in (throttle_class() for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, view)
+    ]
+    if durations:
+        raise exceptions.Throttled(max((duration for duration in durations if duration is not None), default=None))
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'departments', views.DepartmentViewSet)
@@ -14,7 +14,16 @@ urlpatterns = [
     path('departments/analytics/', views.department_analytics, name='department-analytics'),
     path('attendance/analytics/', views.attendance_analytics, name='attendance-analytics'),
     path('dashboard/', views.employee_dashboard, name='employee-dashboard'),
+    path('dashboard/snapshot/', views.dashboard_snapshot, name='dashboard-snapshot'),
+    path('async/departments/analytics/', async_views.department_analytics, name='async-department-analytics'),
+    path('async/attendance/analytics/', async_views.attendance_analytics, name='async-attendance-analytics'),
+    path('async/dashboard/', async_views.employee_dashboard, name='async-employee-dashboard'),
+    path('attendance/live/', async_views.attendance_live, name='attendance-live'),
+    path('payroll/', views.payroll, name='payroll'),
+    path('payroll/employees/', views.payroll_employees, name='payroll-employees'),
     path('dashboard/view/', views.dashboard_view, name='dashboard-view'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('export/<str:resource>.<str:file_format>', views.export_data, name='export-data'),
 
     path('auth/token/', obtain_auth_token, name='api_token_auth'),
 
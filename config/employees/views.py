@@ -1,26 +1,67 @@
+import re
+
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count, Avg, Sum, Q
-from django.utils import timezone
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db.models import Count
+from django.utils.decorators import method_decorator
 from .models import Department, Employee, Attendance, PerformanceReview
+from .analytics import attendance_analytics_data, dashboard_data, department_analytics_data, subtree_rollup_data
+from .archive import archived_page, stream_archive
+from .bulk import upsert_attendance
+from .cache import cached_response
+from .filters import filter_attendance, filter_employees, filter_reviews
+from .hierarchy import reporting_chain, subtree_ids
+from .metrics import render_metrics
+from .pagination import AttendancePagination, PayrollPagination, PerformanceReviewPagination, ReviewSearchPagination
+from .payroll import payroll_data, payroll_employee_rows
+from .search import search_results, search_reviews
+from .snapshot import get_snapshot
+from .throttling import throttle_scope
 from .serializers import (
     DepartmentSerializer, EmployeeSerializer, AttendanceSerializer, 
-    PerformanceReviewSerializer, DepartmentAnalyticsSerializer, AttendanceAnalyticsSerializer
+    PerformanceReviewSerializer, PayrollEmployeeSerializer
 )
-from datetime import timedelta
-from django.shortcuts import render
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from django.shortcuts import get_object_or_404, render
+from .exports import FORMATS, RESOURCES, stream_export
+from .fastpath import FastListMixin
+from .fieldsets import FIELDSET_ACTIONS, SparseFieldsetMixin
 
 
 def dashboard_view(request):
     return render(request, 'employees/index.html')
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+@require_GET
+def metrics(request):
+    """Request metrics in the Prometheus text format; needs `Bearer METRICS_TOKEN` when one is set."""
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if settings.METRICS_TOKEN and not constant_time_compare(request.headers.get('Authorization', ''), expected):
+        response = HttpResponse('Invalid or missing metrics token.\n', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class DepartmentViewSet(FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [IsAuthenticated]
+    include_serializers = {'employees': EmployeeSerializer}
+
+    def get_queryset(self):
+        queryset = Department.objects.order_by('name')
+        if self.wants_field('employee_count'):
+            queryset = queryset.annotate(employee_count=Count('employees'))
+        return self.apply_fieldsets(queryset)
 
     def list(self, request, *args, **kwargs):
         try:
@@ -29,6 +70,12 @@ class DepartmentViewSet(viewsets.ModelViewSet):
                 "is_v1": True,
                 "data": response.data
             })
+        except APIException as e:
+            # Client errors such as a malformed pagination cursor.
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e.detail)}
+            }, status=e.status_code)
         except Exception as e:
             return Response({
                 "is_v1": True,
@@ -36,25 +83,76 @@ class DepartmentViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class EmployeeViewSet(viewsets.ModelViewSet):
+class EmployeeViewSet(FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
     permission_classes = [IsAuthenticated]
+    include_serializers = {'attendances': AttendanceSerializer, 'performance_reviews': PerformanceReviewSerializer}
+    fieldset_actions = FIELDSET_ACTIONS + ('subtree',)
 
     def get_queryset(self):
         try:
-            queryset = Employee.objects.all()
-            department = self.request.query_params.get('department')
-            employment_type = self.request.query_params.get('employment_type')
-            if department:
-                queryset = queryset.filter(department__name__icontains=department)
-            if employment_type:
-                queryset = queryset.filter(employment_type=employment_type)
-            return queryset
+            queryset = Employee.objects.select_related('department', 'manager')
+            if self.action == 'subtree':
+                queryset = queryset.filter(pk__in=subtree_ids(self.kwargs['pk'], self.subtree_depth))
+            return self.apply_fieldsets(filter_employees(queryset, self.request.query_params))
         except Exception as e:
             print("Error in EmployeeViewSet:", e)
             return Employee.objects.none()
 
+    @action(detail=True, methods=['get'])
+    def chain(self, request, pk=None):
+        """The employee's reporting chain, from the direct manager to the top."""
+        employee = get_object_or_404(Employee, pk=pk)
+        try:
+            return Response({
+                "is_v1": True,
+                "data": reporting_chain(employee.pk)
+            })
+        except Exception as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """Everyone under the employee, as a paginated employee list; max_depth=1 lists direct reports."""
+        get_object_or_404(Employee, pk=pk)
+        max_depth = request.query_params.get('max_depth')
+        try:
+            self.subtree_depth = int(max_depth) if max_depth else None
+            if self.subtree_depth is not None and self.subtree_depth < 1:
+                raise ValueError
+        except ValueError:
+            return Response({
+                "is_v1": True,
+                "data": {"error": "max_depth must be a positive integer."}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return self.list(request)
+
+    @throttle_scope('analytics')
+    @action(detail=True, methods=['get'])
+    @method_decorator(cached_response())
+    def rollup(self, request, pk=None):
+        """Headcount, span of control, payroll and attendance for everyone under the employee."""
+        employee = get_object_or_404(Employee, pk=pk)
+        try:
+            return Response({
+                "is_v1": True,
+                "data": subtree_rollup_data(employee, request.query_params)
+            })
+        except ValueError as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     def list(self, request, *args, **kwargs):
         try:
             response = super().list(request, *args, **kwargs)
@@ -62,6 +160,12 @@ class EmployeeViewSet(viewsets.ModelViewSet):
                 "is_v1": True,
                 "data": response.data
             })
+        except APIException as e:
+            # Client errors such as a malformed pagination cursor.
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e.detail)}
+            }, status=e.status_code)
         except Exception as e:
             return Response({
                 "is_v1": True,
@@ -69,28 +173,85 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
+    include_serializers = {'employee': EmployeeSerializer}
+    pagination_class = AttendancePagination
 
     def get_queryset(self):
         try:
-            queryset = Attendance.objects.all()
-            employee = self.request.query_params.get('employee')
-            date = self.request.query_params.get('date')
-            status_param = self.request.query_params.get('status')
-            if employee:
-                queryset = queryset.filter(employee__last_name__icontains=employee)
-            if date:
-                queryset = queryset.filter(date=date)
-            if status_param:
-                queryset = queryset.filter(status=status_param)
-            return queryset
+            queryset = Attendance.objects.select_related('employee')
+            return self.apply_fieldsets(filter_attendance(queryset, self.request.query_params))
         except Exception as e:
             print("Error in AttendanceViewSet:", e)
             return Attendance.objects.none()
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upsert(self, request):
+        try:
+            records = request.data.get('records') if isinstance(request.data, dict) else request.data
+            if not isinstance(records, list):
+                return Response({
+                    "is_v1": True,
+                    "data": {"error": "Expected a list of attendance records."}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if len(records) > settings.ATTENDANCE_BULK_MAX_RECORDS:
+                return Response({
+                    "is_v1": True,
+                    "data": {"error": f"At most {settings.ATTENDANCE_BULK_MAX_RECORDS} records per request."}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            results = upsert_attendance(records)
+            counts = {'created': 0, 'updated': 0, 'error': 0}
+            for result in results:
+                counts[result['result']] += 1
+            return Response({
+                "is_v1": True,
+                "data": {
+                    'created': counts['created'],
+                    'updated': counts['updated'],
+                    'failed': counts['error'],
+                    'results': results
+                }
+            })
+        except Exception as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='archive')
+    def archive(self, request):
+        """Page through attendance moved to the archive files by archive_attendance."""
+        try:
+            page = int(request.query_params.get('page', 1))
+            if page < 1:
+                raise ValueError('page must be a positive integer.')
+            page_size = self.paginator.get_page_size(request)
+            count, records, has_next = archived_page(request.query_params, page, page_size)
+            url = request.build_absolute_uri()
+            fields = list(self.get_serializer_class()().fields)
+            return Response({
+                "is_v1": True,
+                "data": {
+                    'count': count,
+                    'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+                    'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+                    'results': [{name: record[name] for name in fields} for record in records]
+                }
+            })
+        except ValueError as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     def list(self, request, *args, **kwargs):
         try:
             response = super().list(request, *args, **kwargs)
@@ -98,6 +259,12 @@ class AttendanceViewSet(viewsets.ModelViewSet):
                 "is_v1": True,
                 "data": response.data
             })
+        except APIException as e:
+            # Client errors such as a malformed pagination cursor.
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e.detail)}
+            }, status=e.status_code)
         except Exception as e:
             return Response({
                 "is_v1": True,
@@ -105,25 +272,40 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PerformanceReviewViewSet(viewsets.ModelViewSet):
+class PerformanceReviewViewSet(FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = PerformanceReview.objects.all()
     serializer_class = PerformanceReviewSerializer
     permission_classes = [IsAuthenticated]
+    include_serializers = {'employee': EmployeeSerializer}
+    pagination_class = PerformanceReviewPagination
 
     def get_queryset(self):
         try:
-            queryset = PerformanceReview.objects.all()
-            employee = self.request.query_params.get('employee')
-            min_rating = self.request.query_params.get('min_rating')
-            if employee:
-                queryset = queryset.filter(employee__last_name__icontains=employee)
-            if min_rating:
-                queryset = queryset.filter(rating__gte=min_rating)
-            return queryset
+            queryset = PerformanceReview.objects.select_related('employee')
+            return self.apply_fieldsets(filter_reviews(queryset, self.request.query_params))
         except Exception as e:
             print("Error in PerformanceReviewViewSet:", e)
             return PerformanceReview.objects.none()
 
+    @throttle_scope('search')
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Reviews whose text matches ?q=, best first, with highlighted snippets; filter by rating and date."""
+        try:
+            matches = search_reviews(request.query_params)
+        except ValueError as e:
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e)}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        paginator = ReviewSearchPagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        response = paginator.get_paginated_response(search_results(page, request.query_params))
+        return Response({
+            "is_v1": True,
+            "data": response.data
+        })
+
     def list(self, request, *args, **kwargs):
         try:
             response = super().list(request, *args, **kwargs)
@@ -131,6 +313,12 @@ class PerformanceReviewViewSet(viewsets.ModelViewSet):
                 "is_v1": True,
                 "data": response.data
             })
+        except APIException as e:
+            # Client errors such as a malformed pagination cursor.
+            return Response({
+                "is_v1": True,
+                "data": {"error": str(e.detail)}
+            }, status=e.status_code)
         except Exception as e:
             return Response({
                 "is_v1": True,
@@ -138,27 +326,15 @@ class PerformanceReviewViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@throttle_scope('analytics')
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def department_analytics(request):
     try:
-        departments = Department.objects.all()
-        data = []
-        for dept in departments:
-            employees = dept.employees.all()
-            avg_salary = employees.aggregate(avg=Avg('salary'))['avg'] or 0
-            total_salary = employees.aggregate(total=Sum('salary'))['total'] or 0
-            data.append({
-                'department': dept.name,
-                'employee_count': employees.count(),
-                'avg_salary': avg_salary,
-                'total_budget': dept.budget,
-                'budget_utilization': (total_salary / dept.budget * 100) if dept.budget > 0 else 0
-            })
-        serializer = DepartmentAnalyticsSerializer(data, many=True)
         return Response({
             "is_v1": True,
-            "data": serializer.data
+            "data": department_analytics_data(request.query_params)
         })
     except Exception as e:
         return Response({
@@ -167,36 +343,21 @@ def department_analytics(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@throttle_scope('analytics')
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def attendance_analytics(request):
     try:
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=30)
-        attendance_data = Attendance.objects.filter(
-            date__range=[start_date, end_date]
-        ).values('date').annotate(
-            present_count=Count('id', filter=Q(status='PR')),
-            absent_count=Count('id', filter=Q(status='AB')),
-            late_count=Count('id', filter=Q(status='LT')),
-            total_count=Count('id')
-        ).order_by('date')
-        data = []
-        for item in attendance_data:
-            total = item['total_count']
-            attendance_rate = (item['present_count'] / total * 100) if total > 0 else 0
-            data.append({
-                'date': item['date'],
-                'present_count': item['present_count'],
-                'absent_count': item['absent_count'],
-                'late_count': item['late_count'],
-                'attendance_rate': attendance_rate
-            })
-        serializer = AttendanceAnalyticsSerializer(data, many=True)
         return Response({
             "is_v1": True,
-            "data": serializer.data
+            "data": attendance_analytics_data(request.query_params)
         })
+    except ValueError as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             "is_v1": True,
@@ -204,28 +365,117 @@ def attendance_analytics(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@throttle_scope('analytics')
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def employee_dashboard(request):
     try:
-        total_employees = Employee.objects.count()
-        total_departments = Department.objects.count()
-        today_attendance = Attendance.objects.filter(
-            date=timezone.now().date()
-        ).count()
-        recent_hires = Employee.objects.order_by('-hire_date')[:5]
-        recent_hires_data = EmployeeSerializer(recent_hires, many=True).data
-        return Response({
-            "is_v1": True,
-            "data": {
-                'total_employees': total_employees,
-                'total_departments': total_departments,
-                'today_attendance': today_attendance,
-                'recent_hires': recent_hires_data
-            }
+        return Response({
+            "is_v1": True,
+            "data": dashboard_data()
+        })
+    except Exception as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+@throttle_scope('analytics')
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_snapshot(request):
+    """Everything the dashboard page shows, precomputed and served gzip-compressed when accepted."""
+    try:
+        snapshot = get_snapshot()
+    except Exception as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    response = get_conditional_response(request, etag=snapshot.etag, last_modified=int(snapshot.generated))
+    if response is None:
+        if accepts_gzip.search(request.headers.get('Accept-Encoding', '')):
+            response = HttpResponse(snapshot.gzipped, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    # Browsers keep it but revalidate on every load, which costs a 304.
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@throttle_scope('payroll')
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+def payroll(request):
+    try:
+        return Response({
+            "is_v1": True,
+            "data": payroll_data(request.query_params)
         })
+    except ValueError as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             "is_v1": True,
             "data": {"error": str(e)}
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@throttle_scope('payroll')
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payroll_employees(request):
+    try:
+        paginator = PayrollPagination()
+        page = paginator.paginate_queryset(payroll_employee_rows(request.query_params), request)
+        response = paginator.get_paginated_response(PayrollEmployeeSerializer(page, many=True).data)
+        return Response({
+            "is_v1": True,
+            "data": response.data
+        })
+    except ValueError as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@throttle_scope('export')
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_data(request, resource, file_format):
+    try:
+        if resource not in RESOURCES or file_format not in FORMATS:
+            return Response({
+                "is_v1": True,
+                "data": {"error": f"Unsupported export: {resource}.{file_format}"}
+            }, status=status.HTTP_404_NOT_FOUND)
+        if resource == 'attendance' and request.query_params.get('source') == 'archive':
+            stream = stream_archive(file_format, request.query_params)
+        else:
+            stream = stream_export(resource, file_format, request.query_params)
+        response = StreamingHttpResponse(stream, content_type=FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{file_format}"'
+        return response
+    except Exception as e:
+        return Response({
+            "is_v1": True,
+            "data": {"error": str(e)}
+        }, status=status.HTTP_400_BAD_REQUEST)